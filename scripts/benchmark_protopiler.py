@@ -0,0 +1,158 @@
+"""benchmark compiling the full-plate PCR configs, and rendering templates"""
+
+import contextlib
+import io
+import statistics
+import tempfile
+import time
+import timeit
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+
+import yaml
+
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.templates import template_registry
+
+CONFIG_DIR = Path(__file__).parent.parent / "src/ot2_interface/protopiler/test_configs"
+CONFIGS = [
+    "PCR_prep_full_plate.yaml",
+    "PCR_prep_first_half.yaml",
+    "PCR_prep_second_half.yaml",
+]
+
+# values like the ones _create_commands fills in for one transfer
+SLOTS = {
+    "pipette": 'pipettes["right"]',
+    "location": 'deck["8"].wells()[17]',
+    "height": "1.5",
+    "volume": "12.5",
+    "src": 'deck["4"]["B3"]',
+    "dst": 'deck["5"]["H12"]',
+    "loc": 'deck["5"]["H12"]',
+    "reps": "3",
+}
+TEMPLATES = [
+    "pick_tip",
+    "aspirate_clearance",
+    "aspirate",
+    "dispense_clearance",
+    "dispense",
+    "mix",
+    "blow_out",
+    "drop_tip",
+]
+
+
+def runnable_config(name: str, out_dir: Path) -> Path:
+    """A copy of a test config that compiles from anywhere
+
+    The test configs point at their spreadsheets with absolute paths from the machine they were
+    written on and some have no requirements, both are fixed in the copy.
+    """
+    config = yaml.safe_load((CONFIG_DIR / name).read_text())
+    config.setdefault("requirements", {"robotType": "OT-2"})
+    for resource in config.get("resources") or []:
+        resource["location"] = str(CONFIG_DIR / Path(resource["location"]).name)
+    path = out_dir / name
+    path.write_text(yaml.safe_dump(config, sort_keys=False))
+    return path
+
+
+def time_compile(
+    config: Path, out_dir: Path, repeats: int, compact: bool = False
+) -> float:
+    """Median seconds to compile a config to a protocol"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ProtoPiler(compact=compact).yaml_to_protocol(
+                config, protocol_out_path=out_dir, write_resources=False
+            )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def compare_compact(config: Path, repeats: int) -> None:
+    """Size of unrolled and compact protocols, and how long python takes to parse them"""
+    for compact in (False, True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            protocol, _ = ProtoPiler(compact=compact).yaml_to_bytes(config)
+        parse_time = statistics.median(
+            timeit.repeat(
+                lambda protocol=protocol: compile(protocol, "protocol.py", "exec"),
+                number=1,
+                repeat=repeats,
+            )
+        )
+        lines = protocol.count(b"\n") + 1
+        print(
+            f"    {'compact' if compact else 'unrolled':<9} {lines:6d} lines "
+            f"{len(protocol) / 1024:7.1f} KiB  parsed in {parse_time * 1000:6.1f} ms"
+        )
+
+
+def time_templates(number: int) -> None:
+    """Compare chained str.replace with a single render, per template"""
+    registry = template_registry()
+    for name in TEMPLATES:
+        template = registry[name]
+        values = {slot: SLOTS[slot] for slot in template.slots}
+
+        def chained(text: str = template.text, values: dict = values) -> str:
+            for slot, value in values.items():
+                text = text.replace(f"#{slot}#", value)
+            return text
+
+        assert chained() == template.render(**values)
+        replace_time = timeit.timeit(chained, number=number)
+        render_time = timeit.timeit(
+            lambda template=template, values=values: template.render(**values),
+            number=number,
+        )
+        print(
+            f"{name:<20} {len(values)} slots  "
+            f"replace {replace_time / number * 1e9:6.0f} ns  "
+            f"render {render_time / number * 1e9:6.0f} ns  "
+            f"x{replace_time / render_time:.2f}"
+        )
+
+
+def main(args: Namespace) -> None:
+    """run the benchmarks"""
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = Path(tmp)
+        for name in CONFIGS:
+            config = runnable_config(name, out_dir)
+            seconds = time_compile(config, out_dir, args.repeats)
+            compact_seconds = time_compile(config, out_dir, args.repeats, compact=True)
+            print(
+                f"{name:<28} {seconds * 1000:8.1f} ms, compact {compact_seconds * 1000:8.1f} ms"
+            )
+            compare_compact(config, args.repeats)
+    print()
+    time_templates(args.number)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Time the protopiler on the full-plate PCR configs and its template rendering"
+    )
+    parser.add_argument(
+        "-r",
+        "--repeats",
+        help="Compiles per config, the median is reported",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "-n",
+        "--number",
+        help="Renders per template",
+        type=int,
+        default=200000,
+    )
+
+    args = parser.parse_args()
+    main(args)
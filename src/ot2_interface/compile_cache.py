@@ -0,0 +1,201 @@
+"""On-disk cache of compiled protopiler protocols"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import yaml
+
+from ot2_interface.config import PathLike
+from ot2_interface.protopiler.templates import TemplateRegistry, template_registry
+
+PROTOCOL_NAME = "protocol.py"
+RESOURCES_NAME = "resources.json"
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "ot2_module" / "compile_cache"
+"""Where the protopiler command line keeps its cache, point the node's `compile_cache_dir` here to share it"""
+
+
+class CompileCache:
+    """Compiled protocols, keyed by a hash of everything that goes into compiling them.
+
+    Each entry is a directory named after its key holding the protocol and the resource
+    state after compiling it, so a hit can stand in for the whole `yaml_to_protocol` call.
+    Entries are written to a temporary directory and renamed into place, so several
+    processes can share a cache directory, and their mtime is bumped on every hit; once
+    there are more than `max_entries`, or they take more than `max_bytes`, the least
+    recently used entries are removed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: PathLike = DEFAULT_CACHE_DIR,
+        max_entries: int = 128,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        """Initialize the cache
+
+        Parameters
+        ----------
+        cache_dir : PathLike, optional
+            directory to keep the cache in, created if it does not exist, by default DEFAULT_CACHE_DIR
+        max_entries : int, optional
+            number of compiled protocols to keep, by default 128
+        max_bytes : Optional[int], optional
+            total size of the compiled protocols to keep, by default no limit
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def key(
+        self,
+        config_path: PathLike,
+        payload: Optional[Dict[str, Any]] = None,
+        resource_file: Optional[PathLike] = None,
+        templates: Optional[TemplateRegistry] = None,
+        compact: bool = False,
+    ) -> str:
+        """Hash the inputs of a compile
+
+        Covers the config, the spreadsheets its `resources` point to, the payload, the
+        resource state, the templates and the code generation mode, so changing any of them is
+        a miss.
+
+        Parameters
+        ----------
+        config_path : PathLike
+            path to the protopiler config
+        payload : Optional[Dict[str, Any]], optional
+            payload the config is compiled with, by default None
+        resource_file : Optional[PathLike], optional
+            resource state the config is compiled against, by default None
+        templates : Optional[TemplateRegistry], optional
+            templates the config is compiled with, by default the protopiler's own
+        compact : bool, optional
+            whether the config is compiled into a compact protocol, by default False
+
+        Returns
+        -------
+        str
+            the cache key
+        """
+        config = Path(config_path).read_bytes()
+        digest = hashlib.sha256()
+        digest.update(config)
+        digest.update(b"\0")
+        for location in _resource_locations(config):
+            digest.update(str(location).encode())
+            digest.update(b"\0")
+            if Path(location).is_file():
+                digest.update(Path(location).read_bytes())
+            digest.update(b"\0")
+        digest.update(json.dumps(payload, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+        if resource_file is not None and Path(resource_file).exists():
+            digest.update(Path(resource_file).read_bytes())
+        digest.update(b"\0")
+        digest.update((templates or template_registry()).digest().encode())
+        digest.update(b"\0")
+        digest.update(b"compact" if compact else b"unrolled")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Path, Optional[Path]]]:
+        """Look up a compiled protocol
+
+        Parameters
+        ----------
+        key : str
+            the cache key, from `key()`
+
+        Returns
+        -------
+        Optional[Tuple[Path, Optional[Path]]]
+            paths to the cached protocol and resource file, or None on a miss
+        """
+        entry = self.cache_dir / key
+        protocol = entry / PROTOCOL_NAME
+        if not protocol.exists():
+            return None
+        os.utime(entry)
+        resources = entry / RESOURCES_NAME
+        return protocol, resources if resources.exists() else None
+
+    def put(
+        self,
+        key: str,
+        protocol_path: Union[PathLike, bytes],
+        resource_path: Optional[Union[PathLike, bytes]] = None,
+    ) -> Tuple[Path, Optional[Path]]:
+        """Store a compiled protocol
+
+        Parameters
+        ----------
+        key : str
+            the cache key, from `key()`
+        protocol_path : Union[PathLike, bytes]
+            the compiled protocol, as a file or its content
+        resource_path : Optional[Union[PathLike, bytes]], optional
+            the resource state after compiling, as a file or its content, by default None
+
+        Returns
+        -------
+        Tuple[Path, Optional[Path]]
+            paths to the cached protocol and resource file
+        """
+        staging = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-"))
+        _store(protocol_path, staging / PROTOCOL_NAME)
+        if resource_path is not None:
+            _store(resource_path, staging / RESOURCES_NAME)
+        try:
+            staging.rename(self.cache_dir / key)
+        except OSError:
+            # someone else compiled the same thing in the meantime, keep theirs
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+        return self.get(key)
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until both `max_entries` and `max_bytes` hold"""
+        entries = [
+            entry
+            for entry in self.cache_dir.iterdir()
+            if entry.is_dir() and not entry.name.startswith(".")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        sizes = [_size(entry) for entry in entries] if self.max_bytes else []
+        total = sum(sizes)
+        while len(entries) > self.max_entries or (
+            self.max_bytes is not None and total > self.max_bytes
+        ):
+            entry = entries.pop(0)
+            total -= sizes.pop(0) if sizes else 0
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _resource_locations(config: bytes) -> List[str]:
+    """The files a config's `resources` point to, read straight from its yaml"""
+    try:
+        resources = (yaml.safe_load(config) or {}).get("resources") or []
+        return [resource["location"] for resource in resources]
+    except (yaml.YAMLError, AttributeError, KeyError, TypeError):
+        # an invalid config does not compile, it is never cached either way
+        return []
+
+
+def _size(entry: Path) -> int:
+    """Bytes taken by the files of a cache entry"""
+    return sum(path.stat().st_size for path in entry.iterdir() if path.is_file())
+
+
+def _store(source: Union[PathLike, bytes], destination: Path) -> None:
+    """Copy a file, or write content, into a cache entry"""
+    if isinstance(source, bytes):
+        destination.write_bytes(source)
+    else:
+        shutil.copyfile(source, destination)
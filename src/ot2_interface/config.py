@@ -52,6 +52,10 @@ class OT2_Config(BaseModel):
     port: int = 31950
     model: str = "OT2"
     version: Optional[int] = None
+    control_timeout: float = 2.0
+    """timeout (seconds) for run actions (play/pause/stop) sent over the control connection"""
+    control_keepalive_interval: Optional[float] = 4.0
+    """seconds between keepalive requests on the control connection, None to disable"""
 
 
 def parse_ot2_args() -> Namespace:
@@ -0,0 +1,168 @@
+"""In-memory counters, gauges and histograms, rendered in the Prometheus text format"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+DEFAULT_BUCKETS = (
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    600.0,
+    1800.0,
+    3600.0,
+    float("inf"),
+)
+"""Histogram bucket bounds in seconds, from robot HTTP calls up to hour long runs"""
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Thread-safe registry of metrics, cheap enough to update on every robot request.
+
+    Every metric is identified by its name and labels. Values are only kept in memory,
+    `render` exposes them for scraping.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """Initialize an empty registry
+
+        Parameters
+        ----------
+        buckets : Tuple[float, ...], optional
+            upper bounds of the histogram buckets, the last one should be infinity
+        """
+        self._labels: Dict[str, str] = {}
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def bind(self, **labels: str) -> "Metrics":
+        """A view of this registry that adds `labels` to everything recorded through it"""
+        view = Metrics.__new__(Metrics)
+        # shares the lock and storage of this registry
+        view.__dict__.update(self.__dict__)
+        view._labels = {**self._labels, **labels}
+        return view
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        """Hashable form of a metric's labels"""
+        merged = {**self._labels, **labels} if self._labels else labels
+        return tuple(sorted((key, str(value)) for key, value in merged.items()))
+
+    def inc(self, name: str, amount: float = 1.0, **labels: Any) -> None:
+        """Add to a counter"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        """Set a gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record a value, usually a duration in seconds, in a histogram"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # bucket counts, then the sum and count of all values
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe how long the body of the `with` takes, even if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Every metric with its labels and current value, JSON serializable"""
+        with self._lock:
+            return {
+                "counters": _series(self._counters, lambda value: value),
+                "gauges": _series(self._gauges, lambda value: value),
+                "histograms": _series(
+                    self._histograms,
+                    lambda counts: {"count": counts[-1], "sum": counts[-2]},
+                ),
+            }
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for kind, metrics in (
+                ("counter", self._counters),
+                ("gauge", self._gauges),
+            ):
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_labels(key)} {_number(value)}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, counts in series.items():
+                    cumulative = 0.0
+                    # the counts end with the sum and the count of the observations
+                    buckets = counts[: len(self.buckets)]
+                    for bound, count in zip(self.buckets, buckets, strict=True):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(
+                            f"{name}_bucket{_labels((*key, ('le', le)))} "
+                            f"{_number(cumulative)}"
+                        )
+                    lines.append(f"{name}_sum{_labels(key)} {_number(counts[-2])}")
+                    lines.append(f"{name}_count{_labels(key)} {_number(counts[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _series(metrics: Dict[str, Dict[LabelKey, Any]], value: Any) -> Dict[str, Any]:
+    """Metrics by name, as lists of labels and values"""
+    return {
+        name: [
+            {"labels": dict(key), "value": value(entry)}
+            for key, entry in series.items()
+        ]
+        for name, series in metrics.items()
+    }
+
+
+def _labels(key: LabelKey) -> str:
+    """Prometheus label set, e.g. `{robot="a",phase="upload"}`"""
+    if not key:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in key
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    """Prometheus number, integers without a trailing .0"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
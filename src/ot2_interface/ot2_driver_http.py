@@ -1,17 +1,25 @@
 """Driver implemented using HTTP protocol supported by Opentrons"""
 
+import contextlib
 import subprocess
+import threading
 import time
 from enum import Enum
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import requests
 import yaml
+from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
+from ot2_interface.compile_cache import CompileCache
 from ot2_interface.config import OT2_Config, PathLike, parse_ot2_args
-from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.metrics import Metrics
+from ot2_interface.protopiler.preflight import PreflightReport, preflight
+from ot2_interface.protopiler.protopiler import ProtoPiler, step_marker
+from ot2_interface.run_progress import RunProgress
+from ot2_interface.run_watchdog import RunWatchdog, StallPolicy
 
 
 class RobotStatus(Enum):
@@ -48,6 +56,8 @@ class OT2_Driver:
         retries: int = 5,
         retry_backoff: float = 1.0,
         retry_status_codes: Optional[List[int]] = None,
+        metrics: Optional[Metrics] = None,
+        compact_protocols: bool = False,
     ) -> None:
         """Initialize OT2 driver.
 
@@ -55,24 +65,52 @@ class OT2_Driver:
         ----------
         config : OT2_Config
             Dataclass of the ot2_config
+        metrics : Optional[Metrics], optional
+            where to record the latency and errors of requests to the robot, by default None
+        compact_protocols : bool, optional
+            compile transfers into tables run by a loop rather than unrolled commands, for
+            smaller protocols the robot analyzes faster, by default False
         """
         self.config: OT2_Config = config
+        self.metrics = metrics
         template_dir = Path(__file__).parent.resolve() / "protopiler/protocol_templates"
         assert template_dir.exists(), f"Template dir: {template_dir} does not exist"
-        self.protopiler: ProtoPiler = ProtoPiler(template_dir=template_dir)
+        self.protopiler: ProtoPiler = ProtoPiler(
+            template_dir=template_dir, compact=compact_protocols
+        )
+        # the protopiler is stateful, only one compile may use it at a time
+        self._compile_lock = threading.Lock()
 
         self.retry_strategy = Retry(
             total=retries,
             backoff_factor=retry_backoff,
             status_forcelist=retry_status_codes,
+            # uploads and run creation are not idempotent, only reads are retried
+            allowed_methods=frozenset({"GET"}),
+        )
+
+        # Data plane: uploads, run logs, status polling
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(max_retries=self.retry_strategy))
+
+        # Control plane: run actions (play/pause/stop) on their own kept-alive
+        # connection so they never queue behind a large transfer on the data plane
+        self.control_session = requests.Session()
+        self.control_session.mount(
+            "http://", HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=1)
         )
+        self._control_lock = threading.Lock()
+        self._closed = threading.Event()
+        if self.metrics is not None:
+            self.session.hooks["response"].append(self._record_response)
+            self.control_session.hooks["response"].append(self._record_response)
 
         # Test connection
         self.base_url = f"http://{self.config.ip}:{self.config.port}"
         self.headers = {"Opentrons-Version": "2"}
         test_conn_url = f"{self.base_url}/robot/lights"
 
-        resp = requests.get(test_conn_url, headers=self.headers)
+        resp = self.session.get(test_conn_url, headers=self.headers)
         if resp.status_code != 200:
             raise RuntimeError(f"Could not connect to opentrons with config {config}")
 
@@ -83,6 +121,91 @@ class OT2_Driver:
             time.sleep(1)  # Can mix later
             self.change_lights_status(status=True)
 
+        # Open the control connection now and keep it from idling out
+        self._ping_control()
+        if self.config.control_keepalive_interval:
+            threading.Thread(target=self._keep_control_warm, daemon=True).start()
+
+    def close(self) -> None:
+        """Stop the control-plane keepalive and close both connections"""
+        self._closed.set()
+        self.control_session.close()
+        self.session.close()
+
+    def _record_response(
+        self, response: requests.Response, *_args: Any, **_kwargs: Any
+    ) -> None:
+        """Record the latency of a robot request, by method and endpoint (e.g. `GET /runs`)"""
+        path = requests.utils.urlparse(response.request.url).path
+        # only the first path segment, run and protocol ids would make every run its own series
+        endpoint = f"{response.request.method} /{path.strip('/').split('/')[0]}"
+        self.metrics.observe(
+            "ot2_http_request_seconds",
+            response.elapsed.total_seconds(),
+            endpoint=endpoint,
+        )
+        if response.status_code >= 400:
+            self.metrics.inc(
+                "ot2_errors_total", kind="http", status=response.status_code
+            )
+
+    def _ping_control(self) -> Optional[requests.RequestException]:
+        """Touch the robot over the control connection so it stays open
+
+        The keepalive never takes the control lock, so a run action never waits for it: an
+        action sent while a keepalive is in flight gets a connection of its own.
+
+        Returns
+        -------
+        Optional[requests.RequestException]
+            why the keepalive failed, None if it went through or was skipped
+        """
+        if self._control_lock.locked():
+            # a run action is using the connection, that keeps it open already
+            return None
+        try:
+            self.control_session.get(
+                f"{self.base_url}/health",
+                headers=self.headers,
+                timeout=self.config.control_timeout,
+            )
+        except requests.RequestException as e:
+            if self.metrics is not None:
+                self.metrics.inc("ot2_errors_total", kind="keepalive")
+            return e
+        return None
+
+    def _keep_control_warm(self) -> None:
+        """Keepalive loop for the control connection, runs until `close()`"""
+        while not self._closed.wait(self.config.control_keepalive_interval):
+            self._ping_control()
+
+    def _send_run_action(self, run_id: str, action_type: str) -> requests.Response:
+        """Send a run action (play, pause, stop) over the control connection
+
+        Parameters
+        ----------
+        run_id : str
+            the run ID coming from `transfer()`
+        action_type : str
+            opentrons run action type, `play`, `pause` or `stop`
+
+        Returns
+        -------
+        requests.Response
+            the response from the OT2 actions endpoint
+        """
+        execute_url = f"{self.base_url}/runs/{run_id}/actions"
+        execute_json = {"data": {"actionType": action_type}}
+
+        with self._control_lock:
+            return self.control_session.post(
+                url=execute_url,
+                headers=self.headers,
+                json=execute_json,
+                timeout=self.config.control_timeout,
+            )
+
     def compile_protocol(
         self,
         config_path,
@@ -90,6 +213,7 @@ class OT2_Driver:
         resource_path=None,
         payload: Optional[Dict[str, Any]] = None,
         protocol_out_path=None,
+        cache: Optional[CompileCache] = None,
     ) -> Tuple[str, str]:
         """Compile the protocols via protopiler
 
@@ -101,6 +225,9 @@ class OT2_Driver:
             path to the configuration file (the one with the ot2 commands )
         resource_file : PathLike, optional
             path to an existing resource file, by default None, will be created if None
+        cache : Optional[CompileCache], optional
+            compiled protocols to reuse, keyed by config, spreadsheets, payload, resource state
+            and templates, by default None
 
         Returns
         -------
@@ -108,108 +235,427 @@ class OT2_Driver:
             path to the protocol file and resource file
         """
         if ".py" not in str(config_path):
-            self.protopiler.load_config(
-                config_path=config_path,
+            with self._compile_lock:
+                if cache is None:
+                    # with a cache, the protopiler only loads the config on a miss
+                    self.protopiler.load_config(
+                        config_path=config_path,
+                        resource_file=resource_file,
+                        resource_path=resource_path,
+                        protocol_out_path=protocol_out_path,
+                    )
+                return self.protopiler.yaml_to_protocol(
+                    config_path,
+                    protocol_out_path=protocol_out_path,
+                    resource_file=resource_file,
+                    resource_file_out=resource_path,
+                    payload=payload,
+                    cache=cache,
+                )
+        else:
+            return config_path, None
+
+    def compile_protocol_bytes(
+        self,
+        config_path: PathLike,
+        resource_file=None,
+        resource_path=None,
+        payload: Optional[Dict[str, Any]] = None,
+        cache: Optional[CompileCache] = None,
+    ) -> Tuple[bytes, Optional[str]]:
+        """Compile a protopiler config in memory, ready for `upload_protocol`
+
+        Unlike `compile_protocol` no protocol file is written, and the resource state is only
+        saved when `resource_file` or `resource_path` is given.
+
+        Parameters
+        ----------
+        config_path : PathLike
+            path to the configuration file (the one with the ot2 commands )
+        resource_file : PathLike, optional
+            path to an existing resource file to compile against, by default None
+        resource_path : PathLike, optional
+            where to save the resource state after compiling, by default None
+        payload : Optional[Dict[str, Any]], optional
+            values for the `payload.` fields of the config, by default None
+        cache : Optional[CompileCache], optional
+            compiled protocols to reuse, shared with `compile_protocol`, by default None
+
+        Returns
+        -------
+        Tuple[bytes, Optional[str]]
+            the protocol file's content and the path to the resource file, if one was saved
+        """
+        with self._compile_lock:
+            if cache is None:
+                self.protopiler.load_config(
+                    config_path=config_path,
+                    resource_file=resource_file,
+                    resource_path=resource_path,
+                )
+            compiled = self.protopiler.yaml_to_bytes(
+                config_path,
                 resource_file=resource_file,
-                resource_path=resource_path,
+                resource_file_out=resource_path,
+                payload=payload,
+                write_resources=resource_file is not None or resource_path is not None,
+                cache=cache,
+            )
+            self._record_tips_saved()
+            return compiled
+
+    def compile_protocols(
+        self,
+        config_paths: List[PathLike],
+        payloads: Optional[List[Optional[Dict[str, Any]]]] = None,
+        resource_file=None,
+        resource_path=None,
+        protocol_out_path=None,
+    ) -> Tuple[str, str]:
+        """Compile several protopiler configs with the same deck layout into one protocol
+
+        Use `split_run_log` on the log of the resulting run to get the results of each config.
+
+        Parameters
+        ----------
+        config_paths : List[PathLike]
+            paths to the configuration files, in the order they should run
+        payloads : Optional[List[Optional[Dict[str, Any]]]], optional
+            one payload per config, by default None
+        resource_file : PathLike, optional
+            path to an existing resource file, by default None, will be created if None
+
+        Returns
+        -------
+        Tuple: [str, str]
+            path to the protocol file and resource file
+        """
+        with self._compile_lock:
+            return self.protopiler.yaml_to_batch_protocol(
+                config_paths,
+                payloads=payloads,
                 protocol_out_path=protocol_out_path,
+                resource_file=resource_file,
+                resource_file_out=resource_path,
             )
-            print("resource_file = {}".format(str(resource_file)))
-            (
-                protocol_out_path,
-                protocol_resource_file,
-            ) = self.protopiler.yaml_to_protocol(
-                config_path,
+
+    def compile_protocols_bytes(
+        self,
+        config_paths: List[PathLike],
+        payloads: Optional[List[Optional[Dict[str, Any]]]] = None,
+        resource_file=None,
+        resource_path=None,
+    ) -> Tuple[bytes, Optional[str]]:
+        """Compile several protopiler configs with the same deck layout into one protocol, in memory
+
+        See `compile_protocols` and `compile_protocol_bytes`.
+
+        Parameters
+        ----------
+        config_paths : List[PathLike]
+            paths to the configuration files, in the order they should run
+        payloads : Optional[List[Optional[Dict[str, Any]]]], optional
+            one payload per config, by default None
+        resource_file : PathLike, optional
+            path to an existing resource file, by default None
+        resource_path : PathLike, optional
+            where to save the resource state after compiling, by default None
+
+        Returns
+        -------
+        Tuple[bytes, Optional[str]]
+            the protocol file's content and the path to the resource file, if one was saved
+        """
+        with self._compile_lock:
+            compiled = self.protopiler.yaml_to_batch_bytes(
+                config_paths,
+                payloads=payloads,
                 resource_file=resource_file,
                 resource_file_out=resource_path,
-                payload=payload,
             )
+            self._record_tips_saved()
+            return compiled
 
-            return protocol_out_path, protocol_resource_file
-        else:
-            return config_path, None
+    def _record_tips_saved(self) -> None:
+        """Count the tips the protopiler's tip planner saved in the compile just done"""
+        if self.metrics is None:
+            return
+        for kind, tips in self.protopiler.tips_saved.items():
+            self.metrics.inc("ot2_tips_saved_total", tips, kind=kind)
+
+    def preflight(
+        self,
+        config_paths: List[PathLike],
+        payloads: Optional[List[Optional[Dict[str, Any]]]] = None,
+        resource_file=None,
+    ) -> PreflightReport:
+        """Statically check protopiler configs before they are compiled or uploaded
+
+        Checks volumes against the pipettes, labware aliases, wells, deck conflicts and
+        tip demand against the tips on the deck, without contacting the robot.
+
+        Parameters
+        ----------
+        config_paths : List[PathLike]
+            paths to the configuration files, checked as one batch like `compile_protocols`
+        payloads : Optional[List[Optional[Dict[str, Any]]]], optional
+            one payload per config, by default None
+        resource_file : PathLike, optional
+            resource file describing the tips already used, by default None
 
-    def transfer(self, protocol_path: PathLike) -> Tuple[str, str]:
+        Returns
+        -------
+        PreflightReport
+            the problems found and the tip budget
+        """
+        return preflight(list(config_paths), payloads, resource_file)
+
+    def transfer(
+        self, protocol_path: Union[PathLike, bytes], name: Optional[str] = None
+    ) -> Tuple[str, str]:
         """Transfer the protocol file to the OT2 via http
 
         Parameters
         ----------
-        protocol_path : Union[Path, str]
-            path to the protocol file, locally
+        protocol_path : Union[Path, str, bytes]
+            path to the protocol file, locally, or the protocol itself
+        name : Optional[str], optional
+            file name the robot gets the protocol under, see `upload_protocol`
 
         Returns
         -------
         Tuple[str, str]
             returns `protocol_id`, and `run_id` in that order
         """
-        # Make sure its a path object
-        protocol_path = Path(protocol_path)
+        protocol_id = self.upload_protocol(protocol_path, name)
+        run_id = self.create_run(protocol_id)
 
+        return protocol_id, run_id
+
+    def upload_protocol(
+        self, protocol_path: Union[PathLike, bytes], name: Optional[str] = None
+    ) -> str:
+        """Upload a protocol file to the OT2, without creating a run for it
+
+        The robot starts analyzing the protocol as soon as it is uploaded, see `validate_protocol`
+
+        Parameters
+        ----------
+        protocol_path : Union[Path, str, bytes]
+            path to the protocol file, locally, or the protocol itself, e.g. from
+            `compile_protocol_bytes`
+        name : Optional[str], optional
+            file name the robot gets the protocol under, by default the file's own name, or
+            `protocol.py` for a protocol given as bytes
+
+        Returns
+        -------
+        str
+            the `protocol_id` of the uploaded protocol
+        """
         transfer_url = f"{self.base_url}/protocols"
-        files = {"files": protocol_path.open("rb")}
 
         # transfer the protocol
-        transfer_resp = requests.post(
-            url=transfer_url, files=files, headers=self.headers, timeout=600
-        )
+        if isinstance(protocol_path, bytes):
+            transfer_resp = self.session.post(
+                url=transfer_url,
+                files={"files": (name or "protocol.py", protocol_path)},
+                headers=self.headers,
+                timeout=600,
+            )
+        else:
+            # Make sure its a path object
+            protocol_path = Path(protocol_path)
+            with protocol_path.open("rb") as protocol_file:
+                transfer_resp = self.session.post(
+                    url=transfer_url,
+                    files={"files": (name or protocol_path.name, protocol_file)},
+                    headers=self.headers,
+                    timeout=600,
+                )
         print(transfer_resp.status_code)
         print(transfer_resp.text)
         print(transfer_resp.reason)
-        protocol_id = transfer_resp.json()["data"]["id"]
+        return transfer_resp.json()["data"]["id"]
 
-        # create the run
+    def create_run(self, protocol_id: str) -> str:
+        """Create a run of an uploaded protocol, the robot only allows one active run at a time
+
+        Parameters
+        ----------
+        protocol_id : str
+            the protocol ID coming from `upload_protocol()`
+
+        Returns
+        -------
+        str
+            the `run_id` of the new run
+        """
         run_url = f"{self.base_url}/runs"
         run_json = {"data": {"protocolId": protocol_id}}
-        run_resp = requests.post(
+        run_resp = self.session.post(
             url=run_url, headers=self.headers, json=run_json, timeout=60
         )
 
-        run_id = run_resp.json()["data"]["id"]
+        return run_resp.json()["data"]["id"]
 
-        return protocol_id, run_id
+    def validate_protocol(
+        self, protocol_id: str, timeout: float = 120.0
+    ) -> List[Dict[str, Any]]:
+        """Wait for the robot to analyze an uploaded protocol and return the errors it found
 
-    def execute(self, run_id: str) -> Dict[str, Dict[str, str]]:
-        """Execute a `play` command for a given protocol-id
+        Parameters
+        ----------
+        protocol_id : str
+            the protocol ID coming from `upload_protocol()`
+        timeout : float, optional
+            seconds to wait for the analysis, by default 120.0
+
+        Returns
+        -------
+        List[Dict[str, Any]]
+            the analysis errors, empty if the protocol is valid or the analysis did not finish in time
+        """
+        analyses_url = f"{self.base_url}/protocols/{protocol_id}/analyses"
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            analyses_resp = self.session.get(url=analyses_url, headers=self.headers)
+            if analyses_resp.status_code != 200:
+                print(f"Could not get protocol {protocol_id} analyses")
+                return []
+            analyses = analyses_resp.json().get("data") or []
+            if analyses and analyses[-1].get("status") == "completed":
+                return analyses[-1].get("errors") or []
+            time.sleep(1)
+
+        print(f"Protocol {protocol_id} analysis did not finish in {timeout}s")
+        return []
+
+    def execute(
+        self,
+        run_id: str,
+        watchdog: Optional[RunWatchdog] = None,
+        progress: Optional[RunProgress] = None,
+    ) -> Dict[str, Dict[str, str]]:
+        """Execute a `play` command for a given protocol-id and wait for the run to finish
 
         Parameters
         ----------
         run_id : str
             the run ID coming from `transfer()`
+        watchdog : Optional[RunWatchdog], optional
+            watches the run for stalls while polling, and its policy is applied if one is found, by default None
+        progress : Optional[RunProgress], optional
+            updated with the run's progress while polling, by default None
 
         Returns
         -------
         Dict[str, Dict[str, str]]
             the json response from the OT2 execute command
         """
-        execute_url = f"{self.base_url}/runs/{run_id}/actions"
-        execute_json = {"data": {"actionType": "play"}}
+        self.start(run_id)
+        return self.wait(run_id, watchdog=watchdog, progress=progress)
+
+    def start(self, run_id: str) -> requests.Response:
+        """Execute a `play` command for a given protocol-id without waiting for the run
 
+        Parameters
+        ----------
+        run_id : str
+            the run ID coming from `transfer()`
+
+        Returns
+        -------
+        requests.Response
+            the response from the OT2 play action
+        """
         # TODO: do some error checking/handling on execute
-        execute_run_resp = requests.post(
-            url=execute_url, headers=self.headers, json=execute_json
-        )
+        execute_run_resp = self._send_run_action(run_id, "play")
         if (
             execute_run_resp.status_code != 201
         ):  # this is the good response code for this endpoint
             print(f"Could not run play action on {run_id}")
             print(execute_run_resp.json())
+        return execute_run_resp
+
+    def wait(
+        self,
+        run_id: str,
+        watchdog: Optional[RunWatchdog] = None,
+        progress: Optional[RunProgress] = None,
+    ) -> Dict[str, Dict[str, str]]:
+        """Poll a started run until it finishes
+
+        Parameters
+        ----------
+        run_id : str
+            the run ID coming from `transfer()`
+        watchdog : Optional[RunWatchdog], optional
+            watches the run for stalls while polling, and its policy is applied if one is found, by default None
+        progress : Optional[RunProgress], optional
+            updated with the run's progress while polling, by default None
+
+        Returns
+        -------
+        Dict[str, Dict[str, str]]
+            the run summary once it has finished
+        """
+        if watchdog is not None:
+            watchdog.reset()
 
         while True:
             try:
-                if self.check_run_status(run_id) in {
+                status = self.check_run_status(run_id)
+                if status in {
                     RunStatus.FAILED,
                     RunStatus.SUCCEEDED,
                     RunStatus.STOPPED,
                 }:
                     break
-                else:
-                    time.sleep(1)
+
+                if watchdog is not None or progress is not None:
+                    run_progress = self.get_run_progress(run_id)
+                if progress is not None:
+                    if progress.total_commands is None and progress.protocol_id:
+                        self._load_analysis(progress)
+                    progress.observe(status, **run_progress)
+                if watchdog is not None:
+                    self._apply_stall_policy(
+                        run_id, watchdog.observe(status, **run_progress)
+                    )
 
             except Exception as e:
                 print(e)
-                pass
+            # a failed poll waits like any other, so a flaky robot is not hammered
+            time.sleep(1)
+
+        run = self.get_run(run_id)
+        if progress is not None:
+            # a finished run completed everything, a failed or stopped one keeps its last count
+            completed = (
+                progress.total_commands if status == RunStatus.SUCCEEDED else None
+            )
+            progress.observe(status, completed)
+        return run
 
-        return self.get_run(run_id)
+    def _load_analysis(self, progress: RunProgress) -> None:
+        """Load the analysis of the run's protocol into its progress, if the robot has it
+
+        Failures only leave the command total unknown, the progress is still updated and
+        the analysis is asked for again on the next poll.
+        """
+        with contextlib.suppress(requests.RequestException, ValueError):
+            progress.set_analysis(self.get_protocol_analysis(progress.protocol_id))
+
+    def _apply_stall_policy(self, run_id: str, policy: Optional[StallPolicy]) -> None:
+        """Act on the policy returned by a watchdog for a stalled run"""
+        if policy is None:
+            return
+        print(f"Run {run_id} stalled, applying policy: {policy.value}")
+        if policy == StallPolicy.PAUSE:
+            self.pause(run_id)
+        elif policy == StallPolicy.CANCEL:
+            self.cancel(run_id)
 
     def pause(self, run_id):
         """Execute a `pause` command for a given protocol-id
@@ -224,14 +670,8 @@ class OT2_Driver:
         Dict[str, Dict[str, str]]
             the json response from the OT2 pause command
         """
-        execute_url = f"{self.base_url}/runs/{run_id}/actions"
-        execute_json = {"data": {"actionType": "pause"}}
-
         # TODO: do some error checking/handling on execute
-        execute_run_resp = requests.post(
-            url=execute_url, headers=self.headers, json=execute_json
-        )
-        return execute_run_resp
+        return self._send_run_action(run_id, "pause")
 
     def resume(self, run_id):
         """Execute a `play` command for a given protocol-id
@@ -246,14 +686,8 @@ class OT2_Driver:
         Dict[str, Dict[str, str]]
             the json response from the OT2 play command
         """
-        execute_url = f"{self.base_url}/runs/{run_id}/actions"
-        execute_json = {"data": {"actionType": "play"}}
-
         # TODO: do some error checking/handling on execute
-        execute_run_resp = requests.post(
-            url=execute_url, headers=self.headers, json=execute_json
-        )
-        return execute_run_resp
+        return self._send_run_action(run_id, "play")
 
     def cancel(self, run_id):
         """Execute a `stop` command for a given protocol-id
@@ -268,14 +702,8 @@ class OT2_Driver:
         Dict[str, Dict[str, str]]
             the json response from the OT2 execute command
         """
-        execute_url = f"{self.base_url}/runs/{run_id}/actions"
-        execute_json = {"data": {"actionType": "stop"}}
-
         # TODO: do some error checking/handling on execute
-        execute_run_resp = requests.post(
-            url=execute_url, headers=self.headers, json=execute_json
-        )
-        return execute_run_resp
+        return self._send_run_action(run_id, "stop")
 
     def check_run_status(self, run_id) -> RunStatus:
         """Checks the status of a run
@@ -292,7 +720,7 @@ class OT2_Driver:
         """
         # check run
         check_run_url = f"{self.base_url}/runs/{run_id}"
-        check_run_resp = requests.get(url=check_run_url, headers=self.headers)
+        check_run_resp = self.session.get(url=check_run_url, headers=self.headers)
 
         if check_run_resp.status_code != 200:
             print(f"Cannot check run {run_id}")
@@ -301,6 +729,87 @@ class OT2_Driver:
 
         return status
 
+    def get_run_progress(self, run_id) -> Dict[str, Any]:
+        """Get how far along a run is, without downloading its whole command list
+
+        Parameters
+        ----------
+        run_id : str
+            The run id given by the OT2 api
+
+        Returns
+        -------
+        Dict[str, Any]
+            `completed_commands`, and the `command_type`, `params` and `command_started_at` of the current command
+        """
+        # with no cursor the robot returns the page around the current command
+        commands_url = f"{self.base_url}/runs/{run_id}/commands"
+        commands_resp = self.session.get(
+            url=commands_url, headers=self.headers, params={"pageLength": 1}
+        )
+
+        if commands_resp.status_code != 200:
+            print(f"Could not get run {run_id} commands")
+            return {"completed_commands": None}
+
+        commands_json = commands_resp.json()
+        current = commands_json.get("links", {}).get("current") or {}
+        completed = current.get("meta", {}).get("index")
+        command = commands_json["data"][-1] if commands_json.get("data") else {}
+
+        return {
+            "completed_commands": completed,
+            "command_type": command.get("commandType"),
+            "params": command.get("params"),
+            "command_started_at": command.get("startedAt"),
+        }
+
+    def get_protocol_analysis(self, protocol_id: str) -> Optional[List[Dict]]:
+        """Get the analyzed commands of an uploaded protocol
+
+        Parameters
+        ----------
+        protocol_id : str
+            The protocol id, given by the opentrons API
+
+        Returns
+        -------
+        Optional[List[Dict]]
+            the commands of the latest completed analysis, or None if the robot has not finished analyzing the protocol
+        """
+        analyses_url = f"{self.base_url}/protocols/{protocol_id}/analyses"
+        analyses_resp = self.session.get(url=analyses_url, headers=self.headers)
+
+        if analyses_resp.status_code != 200:
+            print(f"Could not get protocol {protocol_id} analyses")
+            return None
+
+        analyses = analyses_resp.json().get("data") or []
+        if not analyses or analyses[-1].get("status") != "completed":
+            return None
+        return analyses[-1].get("commands")
+
+    def get_attached_pipettes(self) -> Dict[str, Optional[str]]:
+        """Get the pipettes attached to the robot
+
+        Returns
+        -------
+        Dict[str, Optional[str]]
+            pipette name (e.g. `p300_single_gen2`) by mount, None for an empty mount, empty if unknown
+        """
+        pipettes_url = f"{self.base_url}/pipettes"
+        pipettes_resp = self.session.get(url=pipettes_url, headers=self.headers)
+
+        if pipettes_resp.status_code != 200:
+            print("Could not get attached pipettes")
+            return {}
+
+        return {
+            mount: (pipette or {}).get("name")
+            for mount, pipette in pipettes_resp.json().items()
+            if mount in ("left", "right")
+        }
+
     def get_run(self, run_id) -> Dict:
         """Get the OT2 summary of a specific run
 
@@ -315,7 +824,7 @@ class OT2_Driver:
             The response json dictionary
         """
         run_url = f"{self.base_url}/runs/{run_id}"
-        run_resp = requests.get(url=run_url, headers=self.headers)
+        run_resp = self.session.get(url=run_url, headers=self.headers)
 
         if run_resp.status_code != 200:
             print(f"Could not get run {run_id}")
@@ -336,7 +845,7 @@ class OT2_Driver:
             The response json dictionary
         """
         run_url = f"{self.base_url}/runs/{run_id}"
-        run_resp = requests.get(
+        run_resp = self.session.get(
             url=run_url, headers=self.headers, params={"cursor": 0, "pageLength": 1000}
         )
 
@@ -344,17 +853,27 @@ class OT2_Driver:
             print(f"Could not get run {run_id}")
 
         commands_url = f"{self.base_url}/runs/{run_id}/commands"
-        commands_resp = requests.get(
-            url=commands_url,
-            headers=self.headers,
-            params={"cursor": 0, "pageLength": 1000},
-        )
+        commands = []
+        while True:
+            commands_resp = self.session.get(
+                url=commands_url,
+                headers=self.headers,
+                params={"cursor": len(commands), "pageLength": 1000},
+            )
 
-        if commands_resp.status_code != 200:
-            print(f"Could not get run {run_id} commands")
+            if commands_resp.status_code != 200:
+                print(f"Could not get run {run_id} commands")
+                break
+
+            # long (e.g. batched) runs span several pages
+            page = commands_resp.json()
+            commands.extend(page["data"])
+            if not page["data"] or len(commands) >= page["meta"]["totalLength"]:
+                break
 
         result = run_resp.json()
         result["commands"] = commands_resp.json()
+        result["commands"]["data"] = commands
 
         return result
 
@@ -367,7 +886,7 @@ class OT2_Driver:
             Returns a list of dictionaries that contain simplified information about the runs
         """
         runs_url = f"{self.base_url}/runs"
-        runs_resp = requests.get(url=runs_url, headers=self.headers)
+        runs_resp = self.session.get(url=runs_url, headers=self.headers)
 
         if runs_resp.status_code == 200:
             runs_simplified = []
@@ -414,14 +933,14 @@ class OT2_Driver:
 
         for run in self.get_runs():
             if run["status"] == "failed":
-                requests.delete(url=delete_url + run["runID"], headers=self.headers)
+                self.session.delete(url=delete_url + run["runID"], headers=self.headers)
 
     def change_lights_status(self, status: bool = False):
         """switch the lights"""
         change_lights_url = f"{self.base_url}/robot/lights"
         payload = {"on": status}
 
-        requests.post(change_lights_url, headers=self.headers, json=payload)
+        self.session.post(change_lights_url, headers=self.headers, json=payload)
 
     def send_request(self, request_extension: str, **kwargs) -> requests.Response:
         """Allows us to send arbitrary requests to the ot2 http server.
@@ -458,7 +977,7 @@ class OT2_Driver:
         else:
             kwargs["method"] = kwargs["method"].upper()
 
-        return requests.request(url=url, **kwargs)
+        return self.session.request(url=url, **kwargs)
 
     def stream(
         self,
@@ -515,11 +1034,10 @@ class OT2_Driver:
 
         if not run_id:
             # create a run
-            run_resp = requests.post(
+            run_resp = self.session.post(
                 url=f"{self.base_url}/runs",
                 headers=self.headers,
                 json={"data": {}},
-                max_retries=self.retry_strategy,
             )
             run_id = run_resp.json()["data"]["id"]
 
@@ -527,27 +1045,64 @@ class OT2_Driver:
         enqueue_payload = {
             "data": {"commandType": command, "params": params, "intent": intent}
         }
-        enqueue_resp = requests.post(
+        enqueue_resp = self.session.post(
             url=f"{self.base_url}/runs/{run_id}/commands",
             headers=self.headers,
             json=enqueue_payload,
-            max_retries=self.retry_strategy,
         )
         print(f"Enqueue return: {enqueue_resp.json()}")
 
         # run the command
         if execute:
-            execute_command_resp = requests.post(
-                url=f"{self.base_url}/runs/{run_id}/actions",
-                headers=self.headers,
-                json={"data": {"actionType": "play"}},
-                max_retries=self.retry_strategy,
-            )
+            execute_command_resp = self._send_run_action(run_id, "play")
             print(f"Execute return: {execute_command_resp.json()}")
 
         return run_id
 
 
+def split_run_log(run_log: Dict) -> List[Dict[str, Any]]:
+    """Split the log of a batched protocol (see `OT2_Driver.compile_protocols`) into one result per step
+
+    Parameters
+    ----------
+    run_log : Dict
+        the run log from `OT2_Driver.get_run_log`
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        for each step that started: its index, name, status and commands. Steps that never started are not included.
+    """
+    steps = []
+    for command in run_log["commands"]["data"]:
+        marker = step_marker(command)
+        if marker is not None:
+            step, name = marker
+            steps.append({"step": step, "name": name, "commands": []})
+        elif steps:
+            steps[-1]["commands"].append(command)
+
+    for step in steps:
+        statuses = {command.get("status") for command in step["commands"]}
+        if "failed" in statuses:
+            step["status"] = RunStatus.FAILED.value
+        elif statuses <= {"succeeded"}:
+            step["status"] = RunStatus.SUCCEEDED.value
+        else:
+            step["status"] = RunStatus.STOPPED.value
+
+    # commands are logged as they run, so the step the run ended on shares its outcome
+    run_status = run_log.get("data", {}).get("status")
+    if (
+        steps
+        and run_status in (RunStatus.FAILED.value, RunStatus.STOPPED.value)
+        and steps[-1]["status"] == RunStatus.SUCCEEDED.value
+    ):
+        steps[-1]["status"] = run_status
+
+    return steps
+
+
 def main(args):  # noqa: D103
     ot2s = []
     for ot2_raw_cfg in yaml.safe_load(open(args.robot_config)):
@@ -0,0 +1,124 @@
+"""Substitution of `$key` run parameters into opentrons protocol files"""
+
+import hashlib
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from ot2_interface.config import PathLike
+
+PARAMETER_PATTERN = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)")
+"""a `$key` placeholder, `key` being a python identifier"""
+
+MAX_CACHED_TEMPLATES = 32
+"""number of compiled protocol templates kept in memory"""
+
+_template_cache: "OrderedDict[str, ParameterTemplate]" = OrderedDict()
+# actions render protocols from threads of their own
+_template_lock = threading.Lock()
+
+
+class ParameterTemplate:
+    """A protocol file split once into literal text and `$key` placeholders.
+
+    Rendering is then a single join over the pieces, no matter how many parameters are
+    given or how large the file is. Placeholders with no matching parameter are left as is.
+    """
+
+    def __init__(self, text: str) -> None:
+        """Compile the template
+
+        Parameters
+        ----------
+        text : str
+            contents of the protocol file
+        """
+        self.literals: List[str] = []
+        self.keys: List[str] = []
+        position = 0
+        for match in PARAMETER_PATTERN.finditer(text):
+            self.literals.append(text[position : match.start()])
+            self.keys.append(match.group(1))
+            position = match.end()
+        self.literals.append(text[position:])
+
+    def render(self, parameters: Dict[str, Any]) -> str:
+        """Substitute the parameters into the template
+
+        Parameters
+        ----------
+        parameters : Dict[str, Any]
+            values for the `$key` placeholders, inserted with `str()`
+
+        Returns
+        -------
+        str
+            the protocol text with the parameters substituted
+        """
+        pieces = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:], strict=True):
+            pieces.append(str(parameters[key]) if key in parameters else "$" + key)
+            pieces.append(literal)
+        return "".join(pieces)
+
+
+def load_template(protocol: PathLike) -> Tuple[ParameterTemplate, str]:
+    """Load the compiled template for a protocol file, from the cache if its contents are unchanged
+
+    Parameters
+    ----------
+    protocol : PathLike
+        path to the protocol file
+
+    Returns
+    -------
+    Tuple[ParameterTemplate, str]
+        the compiled template and the sha256 of the file contents
+    """
+    data = Path(protocol).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    with _template_lock:
+        template = _template_cache.get(digest)
+        if template is not None:
+            _template_cache.move_to_end(digest)
+            return template, digest
+    template = ParameterTemplate(data.decode("utf-8"))
+    with _template_lock:
+        _template_cache[digest] = template
+        if len(_template_cache) > MAX_CACHED_TEMPLATES:
+            _template_cache.popitem(last=False)
+    return template, digest
+
+
+def render_protocol(
+    protocol: PathLike, parameters: Dict[str, Any], out_dir: PathLike
+) -> Path:
+    """Write a copy of a protocol with the parameters substituted, leaving the original untouched
+
+    Parameters
+    ----------
+    protocol : PathLike
+        path to the protocol file
+    parameters : Dict[str, Any]
+        values for the `$key` placeholders
+    out_dir : PathLike
+        directory to write the rendered protocol to
+
+    Returns
+    -------
+    Path
+        path to the rendered protocol, unique to this call; the caller deletes it once done
+    """
+    protocol = Path(protocol)
+    template, digest = load_template(protocol)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = (
+        out_dir
+        / f"{protocol.stem}_{digest[:8]}_{uuid.uuid4().hex[:8]}{protocol.suffix}"
+    )
+    out_path.write_text(template.render(parameters), encoding="utf-8")
+    return out_path
@@ -0,0 +1,270 @@
+"""Compile many protopiler configs at once, across a pool of worker processes"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from ot2_interface.compile_cache import DEFAULT_CACHE_DIR, CompileCache
+from ot2_interface.protopiler.config import PathLike
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.templates import template_registry
+
+
+@dataclass
+class CompileResult:
+    """Outcome of compiling one config"""
+
+    config: Path
+    """the config compiled"""
+    protocol: Optional[Path]
+    """the protocol written, None if compiling failed"""
+    seconds: float
+    """time spent compiling and writing the protocol"""
+    error: Optional[str] = None
+    """why compiling failed"""
+
+    @property
+    def ok(self) -> bool:
+        """Whether the config compiled"""
+        return self.error is None
+
+
+def find_configs(targets: List[str]) -> List[Path]:
+    """The configs named by files, directories (searched recursively) and glob patterns
+
+    Parameters
+    ----------
+    targets : List[str]
+        config files, directories holding configs, or globs such as `configs/**/*.yaml`
+
+    Returns
+    -------
+    List[Path]
+        the configs, sorted and without duplicates
+    """
+    configs = set()
+    for target in targets:
+        path = Path(target)
+        if path.is_dir():
+            configs.update(path.rglob("*.yaml"))
+            configs.update(path.rglob("*.yml"))
+        elif any(char in target for char in "*?["):
+            root = Path(path.anchor) if path.is_absolute() else Path()
+            configs.update(root.glob(str(path.relative_to(root))))
+        else:
+            configs.add(path)
+    return sorted(config.resolve() for config in configs if config.is_file())
+
+
+def output_paths(configs: List[Path], out_dir: PathLike) -> List[Path]:
+    """Where each config's protocol goes, mirroring the directories of the configs
+
+    `a/x.yaml` and `a/b/x.yaml` become `<out_dir>/x.py` and `<out_dir>/b/x.py`, so configs
+    with the same name do not overwrite each other.
+    """
+    if not configs:
+        return []
+    root = Path(os.path.commonpath([config.parent for config in configs]))
+    return [
+        Path(out_dir) / config.relative_to(root).with_suffix(".py")
+        for config in configs
+    ]
+
+
+def _init_worker(template_dir: Optional[PathLike]) -> None:
+    """Warm up a worker once: templates read and compiled, imports done"""
+    template_registry(template_dir)
+
+
+def compile_config(
+    config: Path,
+    protocol_out: Path,
+    *,
+    template_dir: Optional[PathLike] = None,
+    cache: Optional[CompileCache] = None,
+    compact: bool = False,
+) -> CompileResult:
+    """Compile one config with a ProtoPiler of its own, so nothing carries over between configs
+
+    Parameters
+    ----------
+    config : Path
+        the config to compile
+    protocol_out : Path
+        file to write the protocol to
+    template_dir : Optional[PathLike], optional
+        templates to compile with, by default the protopiler's own
+    cache : Optional[CompileCache], optional
+        compiled protocols to reuse, by default no cache
+    compact : bool, optional
+        compile transfers into tables run by a loop, by default False
+
+    Returns
+    -------
+    CompileResult
+        the protocol written, or why the config did not compile
+    """
+    start = time.perf_counter()
+    try:
+        # the protopiler reports its progress with print, keep it out of the summary
+        with contextlib.redirect_stdout(io.StringIO()):
+            protocol, _ = ProtoPiler(
+                template_dir=template_dir, cache=cache, compact=compact
+            ).yaml_to_bytes(config)
+        protocol_out.parent.mkdir(parents=True, exist_ok=True)
+        protocol_out.write_bytes(protocol)
+    except Exception as err:
+        message = str(err).strip().splitlines()
+        return CompileResult(
+            config,
+            None,
+            time.perf_counter() - start,
+            f"{type(err).__name__}: {message[0] if message else ''}",
+        )
+    return CompileResult(config, protocol_out, time.perf_counter() - start)
+
+
+def compile_all(
+    configs: List[Path],
+    out_dir: PathLike,
+    *,
+    workers: Optional[int] = None,
+    template_dir: Optional[PathLike] = None,
+    cache: Optional[CompileCache] = None,
+    compact: bool = False,
+) -> Iterator[CompileResult]:
+    """Compile configs across a pool of worker processes, yielding results as they finish
+
+    Parameters
+    ----------
+    configs : List[Path]
+        the configs to compile, see `find_configs`
+    out_dir : PathLike
+        directory to write the protocols to, see `output_paths`
+    workers : Optional[int], optional
+        number of worker processes, by default one per CPU. With 1, configs are compiled in
+        this process
+    template_dir : Optional[PathLike], optional
+        templates to compile with, by default the protopiler's own
+    cache : Optional[CompileCache], optional
+        compile cache shared by the workers, by default no cache
+    compact : bool, optional
+        compile transfers into tables run by a loop, by default False
+
+    Yields
+    ------
+    CompileResult
+        the outcome of each config, in the order they finish
+    """
+    jobs = list(zip(configs, output_paths(configs, out_dir), strict=True))
+    options = {"template_dir": template_dir, "cache": cache, "compact": compact}
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if workers == 1:
+        _init_worker(template_dir)
+        for config, protocol_out in jobs:
+            yield compile_config(config, protocol_out, **options)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(template_dir,),
+    ) as pool:
+        futures = [
+            pool.submit(compile_config, config, protocol_out, **options)
+            for config, protocol_out in jobs
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(args: argparse.Namespace) -> int:  # noqa: D103
+    configs = find_configs(args.configs)
+    if not configs:
+        print(f"No configs found in {' '.join(args.configs)}")  # noqa: T201
+        return 1
+
+    start = time.perf_counter()
+    results = []
+    for result in compile_all(
+        configs,
+        args.out,
+        workers=args.workers,
+        template_dir=args.template_dir,
+        cache=None if args.no_cache else CompileCache(args.cache_dir),
+        compact=args.compact,
+    ):
+        results.append(result)
+        status = "ok" if result.ok else "FAILED"
+        detail = result.protocol if result.ok else result.error
+        print(f"{status:<6} {result.seconds:7.3f}s  {result.config.name}  {detail}")  # noqa: T201
+    wall = time.perf_counter() - start
+
+    failed = [result for result in results if not result.ok]
+    total = sum(result.seconds for result in results)
+    print(  # noqa: T201
+        f"\n{len(results) - len(failed)} compiled, {len(failed)} failed in {wall:.2f}s "
+        f"({total:.2f}s of compiling"
+        + (
+            f", slowest {max(results, key=lambda r: r.seconds).config.name}"
+            if results
+            else ""
+        )
+        + ")"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile protopiler configs in parallel, e.g. a whole library after a template change"
+    )
+    parser.add_argument(
+        "configs",
+        nargs="+",
+        help="Config files, directories of configs (searched recursively) or glob patterns",
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        help="Directory to write the protocols to, mirroring the config directories",
+        type=Path,
+        default=Path("./protocols"),
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        help="Number of worker processes, by default one per CPU",
+        type=int,
+    )
+    parser.add_argument(
+        "--template_dir",
+        help="Directory of the templates to compile with",
+        type=Path,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="Directory of the compile cache shared by the workers",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no_cache",
+        help="Always compile, without reading or filling the cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compact",
+        help="Write transfers as tables run by a loop, for smaller protocols that the robot analyzes faster",
+        action="store_true",
+    )
+
+    args = parser.parse_args()
+    sys.exit(main(args))
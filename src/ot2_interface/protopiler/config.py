@@ -3,7 +3,12 @@
 from pathlib import Path
 from typing import List, Literal, Optional, TypeVar, Union
 
-from pydantic import ValidationError, field_validator, model_validator
+from pydantic import (
+    ValidationError,
+    ValidationInfo,
+    field_validator,
+    model_validator,
+)
 
 from ..config import BaseModel
 
@@ -92,6 +97,16 @@ class Transfer(CommandBase):
     """Drop the tip once a transfer is done"""
     return_tip: Union[bool, List[bool]] = False
     """puts tip back into tip box"""
+    distribute: bool = False
+    """aspirate once for consecutive destinations of the same source, and dispense into each in turn"""
+    disposal_volume: float = 0
+    """extra volume aspirated with each distribution, so every dispense is the same. It is blown out back into the source when blow_out is set or the tip is kept for the next distribution, otherwise it leaves with the tip"""
+    consolidate: bool = False
+    """aspirate consecutive sources for the same destination into one tip, and dispense once. The tip touches every source, so only use it where that does not matter"""
+    air_gap: float = 0
+    """air drawn in after each aspirate of a consolidation, keeping the liquids apart in the tip"""
+    reuse_tips: bool = False
+    """change tips by liquid instead of by drop_tip and return_tip: a tip stays on for consecutive transfers from the same source into empty wells, and clean tips go back to their rack for later transfers of the same source in the same compile"""
 
     @field_validator("*")
     @classmethod
@@ -102,6 +117,21 @@ class Transfer(CommandBase):
                 return v[0]
         return v
 
+    @field_validator("disposal_volume", "air_gap")
+    @classmethod
+    def check_extra_volume(cls, v: float, info: ValidationInfo) -> float:
+        """Disposal volumes and air gaps are drawn in on top of the transfer, they cannot be negative"""
+        if v < 0:
+            raise ValueError(f"{info.field_name} cannot be negative")
+        return v
+
+    @model_validator(mode="after")
+    def check_one_grouping(self) -> "Transfer":
+        """A block either distributes or consolidates, not both"""
+        if self.distribute and self.consolidate:
+            raise ValueError("a transfer cannot both distribute and consolidate")
+        return self
+
     @model_validator(mode="after")
     def check_list_lengths_match(self) -> "Transfer":
         """Make sure that all list fields are the same length, if they are lists"""
@@ -0,0 +1,520 @@
+"""Static checks of protopiler configs, fast enough to run before a job is queued or compiled"""
+
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+
+from ot2_interface.protopiler.config import (
+    Clear_Pipette,
+    CommandBase,
+    Mix,
+    Move_Labware,
+    Move_Pipette,
+    Multi_Transfer,
+    PathLike,
+    ProtocolConfig,
+    Replace_Tip,
+    Transfer,
+)
+from ot2_interface.protopiler.resource_manager import ResourceManager
+from ot2_interface.protopiler.transfers import (
+    TipPlanner,
+    TransferStep,
+    group_liquid,
+    transfer_groups,
+)
+
+WELL_PATTERN = re.compile(r"^([A-Z])(\d{1,2})$")
+"""A well name, e.g. `A1` or `H12`"""
+
+PLATE_FORMATS = {
+    6: (2, 3),
+    12: (3, 4),
+    24: (4, 6),
+    48: (6, 8),
+    96: (8, 12),
+    384: (16, 24),
+}
+"""Rows and columns of a wellplate, by number of wells"""
+
+
+class PreflightError(Exception):
+    """Raised when a job fails its preflight checks"""
+
+    def __init__(self, problems: List[str]) -> None:
+        """Initialize the error
+
+        Parameters
+        ----------
+        problems : List[str]
+            everything wrong with the job
+        """
+        self.problems = problems
+        super().__init__("Preflight checks failed: " + "; ".join(problems))
+
+
+class PreflightReport:
+    """What a preflight found: problems, and the tips the job needs against what is on the deck"""
+
+    def __init__(self) -> None:
+        """Initialize an empty report"""
+        self.problems: List[str] = []
+        self.tips_needed: Counter = Counter()
+        self.tips_available: Dict[str, int] = {}
+
+    @property
+    def ok(self) -> bool:
+        """Whether the job passed every check"""
+        return not self.problems
+
+    def raise_for_problems(self) -> None:
+        """Raise a `PreflightError` if the job failed any check"""
+        if self.problems:
+            raise PreflightError(self.problems)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Summary of the report, JSON serializable"""
+        return {
+            "ok": self.ok,
+            "problems": self.problems,
+            "tips_needed": dict(self.tips_needed),
+            "tips_available": self.tips_available,
+        }
+
+
+def preflight(
+    configs: Union[PathLike, ProtocolConfig, List[Union[PathLike, ProtocolConfig]]],
+    payloads: Optional[Union[Dict, List[Optional[Dict]]]] = None,
+    resource_file: Optional[PathLike] = None,
+) -> PreflightReport:
+    """Check protopiler configs for problems that would otherwise only show after upload
+
+    Several configs are checked as one batch, as `ProtoPiler.yaml_to_batch_protocol` would
+    compile them: on the deck of the first config, with tip usage carrying over.
+
+    Parameters
+    ----------
+    configs : Union[PathLike, ProtocolConfig, List[Union[PathLike, ProtocolConfig]]]
+        config file(s), or configs already loaded
+    payloads : Optional[Union[Dict, List[Optional[Dict]]]], optional
+        payload of the config, or one per config, by default None
+    resource_file : Optional[PathLike], optional
+        resource file describing the tips and wells already used, by default None (fresh deck)
+
+    Returns
+    -------
+    PreflightReport
+        the problems found and the tip budget
+    """
+    if not isinstance(configs, list):
+        configs, payloads = [configs], [payloads]
+    payloads = payloads or [None] * len(configs)
+    report = PreflightReport()
+
+    loaded = []
+    for config in configs:
+        if isinstance(config, ProtocolConfig):
+            loaded.append(config)
+            continue
+        try:
+            loaded.append(ProtocolConfig.from_yaml(config))
+        except (OSError, ValueError, TypeError, ValidationError) as e:
+            summary = str(e).splitlines()[0] if str(e) else type(e).__name__
+            report.problems.append(f"{Path(config).name}: invalid config: {summary}")
+    if report.problems:
+        return report
+
+    try:
+        manager = ResourceManager(
+            loaded[0].equipment,
+            Path(resource_file) if resource_file is not None else None,
+        )
+    except Exception as e:
+        report.problems.append(f"Deck conflict: {e}")
+        return report
+
+    checker = _Checker(manager, report)
+    for config, payload in zip(loaded, payloads, strict=True):
+        checker.check(config, payload)
+    checker.check_tips()
+    return report
+
+
+class _Checker:
+    """Walks the commands of configs the way the protopiler would compile them, without compiling"""
+
+    def __init__(self, manager: ResourceManager, report: PreflightReport) -> None:
+        """Start from the deck the resource manager describes"""
+        self.manager = manager
+        self.report = report
+        # deck slot -> labware, changes as labware is moved
+        self.deck = dict(manager.location_to_labware)
+        self.last_mount = None
+        # wells earlier transfers touched, and clean tips returned by (pipette, liquid)
+        self.wells_used = set()
+        self.returned_tips = Counter()
+
+    def problem(self, block_name: str, message: str) -> None:
+        """Record a problem once"""
+        problem = f"{block_name}: {message}"
+        if problem not in self.report.problems:
+            self.report.problems.append(problem)
+
+    def check(self, config: ProtocolConfig, payload: Optional[Dict]) -> None:
+        """Check the commands of one config"""
+        tip_loaded = {"left": False, "right": False}
+        for i, command in enumerate(config.commands):
+            block_name = command.name if command.name is not None else f"command {i}"
+            block = _inject_payload(command, payload)
+            if isinstance(block, Transfer):
+                self._check_transfer(block_name, block, tip_loaded)
+            elif isinstance(block, Multi_Transfer):
+                self._check_multi_transfer(block_name, block, tip_loaded)
+            elif isinstance(block, Mix):
+                self._check_mix(block_name, block, tip_loaded)
+            elif isinstance(block, Move_Labware):
+                self._check_move_labware(block_name, block)
+            elif isinstance(block, (Replace_Tip, Clear_Pipette, Move_Pipette)):
+                if self.last_mount is None:
+                    self.problem(block_name, "no earlier command used a pipette")
+                elif not isinstance(block, Move_Pipette):
+                    tip_loaded[self.last_mount] = False
+
+    def check_tips(self) -> None:
+        """Compare the tips the commands need with the tips on the deck"""
+        for pipette_name, needed in self.report.tips_needed.items():
+            if not self.manager.find_valid_tipracks(pipette_name):
+                self.report.problems.append(
+                    f"No tip rack on the deck fits {pipette_name}"
+                )
+                continue
+            available = self.manager.get_available_tips(pipette_name)
+            self.report.tips_available[pipette_name] = available
+            if needed > available:
+                self.report.problems.append(
+                    f"Out of tips: {pipette_name} needs {needed} tips, {available} are on the deck"
+                )
+
+    def _unresolved(self, block_name: str, *values: Any) -> bool:
+        """Record a problem for any payload reference left unfilled"""
+        missing = [str(v) for v in values if "payload." in str(v)]
+        for value in missing:
+            self.problem(block_name, f"no payload value for '{value}'")
+        return bool(missing)
+
+    def _pick_up(self, mount: str, tip_loaded: Dict[str, bool], tips: int = 1) -> None:
+        """Count a tip pickup, if the pipette has none"""
+        self.last_mount = mount
+        if not tip_loaded[mount]:
+            self.report.tips_needed[self.manager.mount_to_pipette[mount]] += tips
+            tip_loaded[mount] = True
+
+    def _pipette(self, block_name: str, volume: float, multi: bool) -> Optional[str]:
+        """The mount the protopiler would pick for a volume, recording a problem if there is none"""
+        mount = self.manager.determine_pipette(volume, multi)
+        if mount is None:
+            kind = "multi-channel" if multi else "single-channel"
+            self.problem(
+                block_name, f"no {kind} pipette on the deck can handle {volume} µL"
+            )
+        return mount
+
+    def _check_location(self, block_name: str, location: str) -> None:
+        """Check that a `alias:well` (or `well`) location resolves to a well of a plate on the deck"""
+        if ":" in location:
+            plate, well = location.split(":", 1)
+            slot = self.manager.alias_to_location.get(plate)
+            if slot is None:
+                self.problem(block_name, f"unknown labware alias or location '{plate}'")
+                return
+        else:
+            well = location
+            slots = [
+                slot for slot, name in self.deck.items() if "well" in name
+            ]  # the protopiler's fallback for bare well names
+            if not slots:
+                self.problem(block_name, f"no wellplate on the deck for '{location}'")
+                return
+            slot = slots[0]
+
+        labware = self.deck.get(slot)
+        if labware is None:
+            self.problem(block_name, f"no labware in slot {slot} at this point")
+            return
+        rows_columns = (
+            PLATE_FORMATS.get(_capacity(labware)) if "wellplate" in labware else None
+        )
+        match = WELL_PATTERN.match(well)
+        if rows_columns is not None and match is not None:
+            rows, columns = rows_columns
+            row, column = ord(match.group(1)) - ord("A"), int(match.group(2))
+            if row >= rows or not 1 <= column <= columns:
+                self.problem(block_name, f"{labware} in slot {slot} has no well {well}")
+
+    def _check_destination(self, block_name: str, location: str) -> None:
+        """Check a location liquid is dispensed into, its plate must not be full"""
+        self._check_location(block_name, location)
+        plate = location.split(":", 1)[0] if ":" in location else None
+        slot = self.manager.alias_to_location.get(plate)
+        if slot is not None and self.manager.resources.get(slot, {}).get("depleted"):
+            self.problem(
+                block_name,
+                f"destination plate in slot {slot} is full per the resource file",
+            )
+
+    def _check_transfer(
+        self, block_name: str, block: Transfer, tip_loaded: Dict[str, bool]
+    ) -> None:
+        """Check a transfer, row by row, and count its tips"""
+        steps = self._transfer_steps(block_name, block)
+        groups = transfer_groups(block, steps, self.manager.pipette_volume)
+        if block.reuse_tips:
+            self._plan_tips(groups, tip_loaded)
+        else:
+            self._flag_tips(groups, tip_loaded)
+        for step in steps:
+            self.wells_used.update((step.src, step.dst))
+
+    def _transfer_steps(self, block_name: str, block: Transfer) -> List[TransferStep]:
+        """The steps of a transfer that resolve to a pipette, as `ProtoPiler._transfer_steps` builds them"""
+        sources = _locations(block.source)
+        destinations = _locations(block.destination)
+        if sources is None or destinations is None or _from_file(block.volume):
+            # wells or volumes read from a resource spreadsheet at compile time
+            return []
+        steps = []
+        for (
+            volume,
+            source,
+            destination,
+            mix_cycles,
+            mix_volume,
+            aspirate_clearance,
+            dispense_clearance,
+            blow_out,
+            drop_tip,
+            return_tip,
+        ) in _rows(
+            block.volume,
+            sources,
+            destinations,
+            block.mix_cycles,
+            block.mix_volume,
+            block.aspirate_clearance,
+            block.dispense_clearance,
+            block.blow_out,
+            block.drop_tip,
+            block.return_tip,
+        ):
+            if self._unresolved(block_name, volume, source, destination):
+                continue
+            if float(volume) <= 0:
+                continue
+            mount = self._pipette(block_name, float(volume), False)
+            self._check_location(block_name, source)
+            self._check_destination(block_name, destination)
+            if mount is None:
+                continue
+            steps.append(
+                TransferStep(
+                    mount,
+                    None,
+                    float(volume),
+                    _split_location(source),
+                    _split_location(destination),
+                    aspirate_clearance,
+                    dispense_clearance,
+                    mix_cycles,
+                    mix_volume,
+                    blow_out,
+                    drop_tip,
+                    return_tip,
+                )
+            )
+        return steps
+
+    def _flag_tips(
+        self, groups: Iterator[List[TransferStep]], tip_loaded: Dict[str, bool]
+    ) -> None:
+        """Count the tips of groups that change tips as their flags say, as `ProtoPiler._flagged_tips` does"""
+        for group in groups:
+            self._pick_up(group[0].mount, tip_loaded)
+            if group[0].drop_tip or group[0].return_tip:
+                tip_loaded[group[0].mount] = False
+
+    def _plan_tips(
+        self, groups: Iterator[List[TransferStep]], tip_loaded: Dict[str, bool]
+    ) -> None:
+        """Count the tips of groups that change tips by liquid, as `ProtoPiler._planned_tips` does"""
+
+        def used(well: Tuple[str, str]) -> bool:
+            plate, name = well
+            slot = self.manager.alias_to_location.get(plate, plate)
+            return well in self.wells_used or self.manager.well_used(slot, name)
+
+        planner = TipPlanner(used)
+        for group in groups:
+            mount = group[0].mount
+            if planner.held is not None and planner.keeps(group):
+                clean = True
+            else:
+                if planner.held is not None:
+                    self._put_away(*planner.held, tip_loaded)
+                clean = not tip_loaded[mount]
+                returned = (self.manager.mount_to_pipette[mount], group_liquid(group))
+                if clean and self.returned_tips[returned]:
+                    self.returned_tips[returned] -= 1
+                    tip_loaded[mount] = True
+                self._pick_up(mount, tip_loaded)
+            planner.serve(group, clean)
+        if planner.held is not None:
+            self._put_away(*planner.held, tip_loaded)
+
+    def _put_away(
+        self, mount: str, liquid: Optional[str], tip_loaded: Dict[str, bool]
+    ) -> None:
+        """Return a tip clean for `liquid` to its rack, or drop it"""
+        if liquid is not None:
+            self.returned_tips[(self.manager.mount_to_pipette[mount], liquid)] += 1
+        tip_loaded[mount] = False
+
+    def _check_multi_transfer(
+        self, block_name: str, block: Multi_Transfer, tip_loaded: Dict[str, bool]
+    ) -> None:
+        """Check a multi-channel transfer, column by column"""
+        if _from_file(block.multi_volume):
+            return
+        for volume, source, destination, drop_tip in _rows(
+            block.multi_volume,
+            block.multi_source,
+            block.multi_destination,
+            block.multi_drop_tip,
+        ):
+            if self._unresolved(block_name, volume, source, destination):
+                continue
+            if float(volume) <= 0:
+                continue
+            mount = self._pipette(block_name, float(volume), True)
+            plate = str(source).split(":", 1)[0]
+            if plate not in self.manager.alias_to_location:
+                self.problem(block_name, f"unknown labware alias or location '{plate}'")
+            plate = str(destination).split(":", 1)[0]
+            if plate not in self.manager.alias_to_location:
+                self.problem(block_name, f"unknown labware alias or location '{plate}'")
+            if mount is None:
+                continue
+            # one tip per well of the source column
+            wells = str(source).split(":")[-1].replace("'", "").strip("][").split(", ")
+            self._pick_up(mount, tip_loaded, len(wells))
+            if drop_tip:
+                tip_loaded[mount] = False
+
+    def _check_mix(
+        self, block_name: str, block: Mix, tip_loaded: Dict[str, bool]
+    ) -> None:
+        """Check a mix, it keeps its tip on"""
+        locations = _locations(block.location)
+        volumes = (
+            block.mix_volume
+            if isinstance(block.mix_volume, list)
+            else [block.mix_volume]
+        )
+        if locations is None:
+            return
+        if self._unresolved(block_name, *volumes, *locations):
+            return
+        mount = self._pipette(block_name, max(float(v) for v in volumes), False)
+        for location in locations:
+            self._check_location(block_name, location)
+        if mount is not None:
+            self._pick_up(mount, tip_loaded)
+
+    def _check_move_labware(self, block_name: str, block: Move_Labware) -> None:
+        """Check that the labware is there to move, and its destination is free"""
+        source = self.manager.alias_to_location.get(block.labware, block.labware)
+        if source not in self.deck:
+            self.problem(block_name, f"no labware in slot {block.labware} to move")
+            return
+        if block.destination in self.deck:
+            self.problem(
+                block_name,
+                f"slot {block.destination} is already taken by {self.deck[block.destination]}",
+            )
+            return
+        self.deck[block.destination] = self.deck.pop(source)
+
+
+def _capacity(labware_name: str) -> Optional[int]:
+    """Number of wells (or tips) of labware, by opentrons naming scheme"""
+    for part in labware_name.split("_")[1:3]:
+        if part.isdigit():
+            return int(part)
+    return None
+
+
+def _inject_payload(block: CommandBase, payload: Optional[Dict]) -> CommandBase:
+    """A copy of the command block with the payload filled in, as `ProtoPiler._create_commands` does"""
+    if not isinstance(payload, dict):
+        return block
+    block = block.model_copy(deep=True)
+    for key, value in payload.items():
+        short_key = key.replace("payload.", "")
+        for field, current in list(block.__dict__.items()):
+            if isinstance(block, Multi_Transfer):
+                first = current[0] if isinstance(current, list) else current
+                if short_key in str(first):
+                    plate = str(first).split(":")[0]
+                    setattr(block, field, [f"{plate}:{value[0]}"])
+            elif current == f"payload.{short_key}":
+                setattr(block, field, value)
+    return block
+
+
+def _from_file(value: Any) -> bool:
+    """Whether a field names a column of a resource spreadsheet rather than holding values"""
+    return isinstance(value, str) and "payload" not in value and not _is_number(value)
+
+
+def _is_number(value: str) -> bool:
+    """Whether a string is a number"""
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _locations(value: Union[str, List[str]]) -> Optional[List[str]]:
+    """Unpack `alias:[A1, A2]` location syntax into a list, None if the wells come from a spreadsheet"""
+    if isinstance(value, str) and ":[" in value:
+        alias, wells = value.split(":", 1)
+        value = [
+            well if ":" in well else f"{alias}:{well}"
+            for well in wells.strip("][").split(", ")
+            if well
+        ]
+    locations = value if isinstance(value, list) else [value]
+    peek = str(locations[0]).split(":")[-1]
+    if "payload" not in peek and not WELL_PATTERN.match(peek) and not peek.isdigit():
+        return None
+    return locations
+
+
+def _split_location(location: str) -> Tuple[str, str]:
+    """`alias:well` as (alias, well), a bare well has no alias"""
+    plate, _, well = location.rpartition(":")
+    return plate, well
+
+
+def _rows(*fields: Any) -> Iterator[Tuple]:
+    """Zip list fields, repeating single values, the way the protopiler unrolls a command"""
+    length = max((len(f) for f in fields if isinstance(f, list)), default=1)
+    # one source for many destinations is a list of one, repeated like a single value
+    columns = [
+        (f * length if len(f) == 1 else f) if isinstance(f, list) else [f] * length
+        for f in fields
+    ]
+    return zip(*columns, strict=False)
@@ -2,30 +2,65 @@
 
 import argparse
 import copy
-from datetime import datetime
-from itertools import repeat
+import io
+import shutil
+from collections import Counter
+from functools import partial
+from itertools import chain, repeat
 from pathlib import Path
-from typing import Dict, Generator, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import pandas as pd
 
+from ot2_interface.compile_cache import DEFAULT_CACHE_DIR, CompileCache
 from ot2_interface.protopiler.config import (
     Clear_Pipette,
     CommandBase,
     Deactivate,
+    Labware,
     Mix,
     Move_Labware,
     Move_Pipette,
     Multi_Transfer,
     Ninetysix_Transfer,
     PathLike,
+    Pipette,
     ProtocolConfig,
     Replace_Tip,
     Resource,
     Temperature_Set,
     Transfer,
 )
-from ot2_interface.protopiler.resource_manager import ResourceManager
+from ot2_interface.protopiler.resource_manager import (
+    ResourceManager,
+    save_resource_json,
+)
+from ot2_interface.protopiler.stream import (
+    Sink,
+    output_file,
+    output_name,
+    write_lines,
+)
+from ot2_interface.protopiler.templates import template_registry
+from ot2_interface.protopiler.transfers import (
+    TipPlanner,
+    TransferStep,
+    group_liquid,
+    transfer_groups,
+)
+
+STEP_MARKER = "ot2_module step"
+"""Prefix of the `protocol.comment` that starts each config in a batched protocol"""
 
 """ Things to do:
         [x] take in current resources, if empty default is full
@@ -46,6 +81,9 @@ class ProtoPiler:
         config_path: Optional[PathLike] = None,
         template_dir: PathLike = None,
         resource_file: Optional[PathLike] = None,
+        reload_templates: bool = False,
+        cache: Optional[CompileCache] = None,
+        compact: bool = False,
     ) -> None:
         """Can initialize with the resources we need, or it can be done after initialization
 
@@ -57,12 +95,27 @@ class ProtoPiler:
             path to the template directory, by default Path("./protocol_templates")
         resource_file : Optional[PathLike], optional
             path to the resource file, if using a config and it does not exist, it will be created, by default None
+        reload_templates : bool, optional
+            re-read templates that changed on disk, for template development, by default False
+        cache : Optional[CompileCache], optional
+            compiled protocols for `yaml_to_protocol` and `yaml_to_bytes` to reuse, by default None
+        compact : bool, optional
+            write each transfer block as a table of steps run by a loop instead of unrolling every
+            step into its own commands, same liquid handling in a much smaller protocol, by default False
         """
         if template_dir is None:
             self.template_dir = Path(__file__).parent.resolve() / "protocol_templates"
         else:
             self.template_dir = template_dir
+        # read once per process, shared with every other ProtoPiler
+        self.templates = template_registry(
+            self.template_dir, check_mtime=reload_templates
+        )
         self.resource_file = resource_file
+        self.cache = cache
+        self.compact = compact
+        # tips the tip planner did without in the last compile, see `_planned_tips`
+        self.tips_saved = Counter()
 
         if self.resource_file:
             self.resource_file = Path(self.resource_file)
@@ -411,15 +464,20 @@ class ProtoPiler:
         write_resources: bool = True,
         overwrite_resources_json: bool = True,
         reset_when_done: bool = False,
+        cache: Optional[CompileCache] = None,
     ) -> Tuple[Path]:
         """Public function that provides entrance to the protopiler. Creates the OT2 *.py file from a configuration
 
+        With a cache, compiling the same config, spreadsheets, payload, resource state and
+        templates again copies the earlier result instead, without loading the config.
+
         Parameters
         ----------
         config_path : Optional[PathLike], optional
             path to yaml configuration file, if not present, will look to self, by default None
         protocol_out : PathLike, optional
-            path to save the protocol to, by default Path(f"./protocol_{datetime.now().strftime('%Y%m%d-%H%M%S')}.py")
+            directory to save the protocol to, by default the current directory. The file is named
+            `protocol_<timestamp>-<random>.py`
         resource_file : Optional[PathLike], optional
            path to existing resource file, if config is used, it will be created, by default None
         resource_file_out : Optional[PathLike], optional
@@ -430,28 +488,32 @@ class ProtoPiler:
             whether you want to rewrite a resource file, by default True
         reset_when_done : bool, optional
             whether to reset the class when finished compiling, by default False
+        cache : Optional[CompileCache], optional
+            compiled protocols to reuse, by default the one the ProtoPiler was created with
 
         Returns
         -------
         Tuple[Path]
             returns the path to the protocol.py file as well as the resource file (if it does not exist, None)
         """
-        if protocol_out_path is None:
-            protocol_out = Path(
-                f"./protocol_{datetime.now().strftime('%Y%m%d-%H%M%S')}.py"
-            )
-
-        else:
-            protocol_out = Path(
-                str(protocol_out_path)
-                + f"/protocol_{datetime.now().strftime('%Y%m%d-%H%M%S')}.py"
-            )
-
-        if not self.config:
-            self.load_config(config_path)
-
-        if resource_file and not self.resource_file:
-            self.load_config(self.config_path, resource_file)
+        protocol_out = self._protocol_out(protocol_out_path)
+
+        cache = cache or self.cache
+        if cache is not None:
+            key, cached = self._cache_lookup(cache, config_path, payload, resource_file)
+            if cached is not None:
+                protocol, resources = cached
+                shutil.copyfile(protocol, protocol_out)
+                resource_file_out = self._write_resources(
+                    resource_file=resource_file,
+                    resource_file_out=resource_file_out,
+                    write_resources=write_resources,
+                    overwrite_resources_json=overwrite_resources_json,
+                    resource_json=resources.read_text(),
+                )
+                if reset_when_done:
+                    self._reset()
+                return protocol_out, resource_file_out
 
         # if self.protocol_out_path is None:
         #     protocol_out = Path(
@@ -463,25 +525,380 @@ class ProtoPiler:
         #         + f"/protocol_{datetime.now().strftime('%Y%m%d-%H%M%S')}.py"
         #     )
 
+        # TODO: anything to write for closing?
+
+        with output_file(protocol_out) as f:
+            self.stream_protocol(
+                f, config_path=config_path, payload=payload, resource_file=resource_file
+            )
+        if cache is not None:
+            cache.put(key, protocol_out, self.resource_manager.resource_json().encode())
+
+        resource_file_out = self._write_resources(
+            resource_file=resource_file,
+            resource_file_out=resource_file_out,
+            write_resources=write_resources,
+            overwrite_resources_json=overwrite_resources_json,
+        )
+
+        if reset_when_done:
+            self._reset()
+
+        return protocol_out, resource_file_out
+
+    def yaml_to_batch_protocol(
+        self,
+        config_paths: List[PathLike],
+        payloads: Optional[List[Optional[Dict]]] = None,
+        protocol_out_path: PathLike = None,
+        resource_file: Optional[PathLike] = None,
+        resource_file_out: Optional[PathLike] = None,
+        write_resources: bool = True,
+        reset_when_done: bool = False,
+    ) -> Tuple[Path]:
+        """Compiles several configs that share a deck layout into one protocol.py file
+
+        The deck and pipettes are loaded once, from the first config, and the commands of each
+        config follow in order. Resource usage (tips, wells) carries over from one config to the next.
+        Each config's commands are preceded by a `protocol.comment` step marker so the run log can
+        be split back up per config with `split_run_log`.
+
+        Parameters
+        ----------
+        config_paths : List[PathLike]
+            paths to the yaml configuration files, in the order they should run
+        payloads : Optional[List[Optional[Dict]]], optional
+            payload for each config, by default None
+        protocol_out_path : PathLike, optional
+            directory to save the protocol to, by default the current directory
+        resource_file : Optional[PathLike], optional
+            path to existing resource file describing the state before the first config, by default None
+        resource_file_out : Optional[PathLike], optional
+            if you want to specify the creation of new resource file, by default None
+        write_resources : bool, optional
+            whether you want to save the resource file or clean it up, by default True
+        reset_when_done : bool, optional
+            whether to reset the class when finished compiling, by default False
+
+        Returns
+        -------
+        Tuple[Path]
+            returns the path to the protocol.py file as well as the resource file (if it does not exist, None)
+
+        Raises
+        ------
+        Exception
+            If the configs do not share the same deck layout
+        """
+        protocol_out = self._protocol_out(protocol_out_path)
+
+        with output_file(protocol_out) as f:
+            self.stream_batch_protocol(
+                f, config_paths, payloads=payloads, resource_file=resource_file
+            )
+
+        resource_file_out = self._write_resources(
+            resource_file=resource_file,
+            resource_file_out=resource_file_out,
+            write_resources=write_resources,
+            overwrite_resources_json=False,
+        )
+
+        if reset_when_done:
+            self._reset()
+
+        return protocol_out, resource_file_out
+
+    def yaml_to_bytes(
+        self,
+        config_path: Optional[PathLike] = None,
+        payload: Optional[Dict] = None,
+        resource_file: Optional[PathLike] = None,
+        resource_file_out: Optional[PathLike] = None,
+        write_resources: bool = False,
+        reset_when_done: bool = False,
+        cache: Optional[CompileCache] = None,
+    ) -> Tuple[bytes, Optional[str]]:
+        """Compiles a config in memory, see `yaml_to_protocol`
+
+        No protocol file is written, and the resource file only if asked for, so compiles
+        running side by side never share a file.
+
+        Parameters
+        ----------
+        config_path : Optional[PathLike], optional
+            path to yaml configuration file, if not present, will look to self, by default None
+        payload : Optional[Dict], optional
+            values for the `payload.` fields of the config, by default None
+        resource_file : Optional[PathLike], optional
+           path to existing resource file, by default None
+        resource_file_out : Optional[PathLike], optional
+            where to save the resource state after compiling, by default None
+        write_resources : bool, optional
+            whether to save the resource state when no `resource_file_out` is given, in place
+            of `resource_file` if there is one, by default False
+        reset_when_done : bool, optional
+            whether to reset the class when finished compiling, by default False
+        cache : Optional[CompileCache], optional
+            compiled protocols to reuse, by default the one the ProtoPiler was created with
+
+        Returns
+        -------
+        Tuple[bytes, Optional[str]]
+            the protocol.py file's content and the path to the resource file, if one was written
+        """
+        cache = cache or self.cache
+        resource_json = None
+        if cache is not None:
+            key, cached = self._cache_lookup(cache, config_path, payload, resource_file)
+            if cached is not None:
+                protocol = cached[0].read_bytes()
+                resource_json = cached[1].read_text()
+
+        if resource_json is None:
+            sink = io.BytesIO()
+            self.stream_protocol(
+                sink,
+                config_path=config_path,
+                payload=payload,
+                resource_file=resource_file,
+            )
+            protocol = sink.getvalue()
+            if cache is not None:
+                cache.put(key, protocol, self.resource_manager.resource_json().encode())
+
+        resource_file_out = self._write_resources(
+            resource_file=resource_file,
+            resource_file_out=resource_file_out,
+            write_resources=write_resources,
+            resource_json=resource_json,
+        )
+
+        if reset_when_done:
+            self._reset()
+
+        return protocol, resource_file_out
+
+    def yaml_to_batch_bytes(
+        self,
+        config_paths: List[PathLike],
+        payloads: Optional[List[Optional[Dict]]] = None,
+        resource_file: Optional[PathLike] = None,
+        resource_file_out: Optional[PathLike] = None,
+        write_resources: bool = False,
+        reset_when_done: bool = False,
+    ) -> Tuple[bytes, Optional[str]]:
+        """Compiles several configs that share a deck layout in memory, see `yaml_to_batch_protocol`
+
+        Parameters
+        ----------
+        config_paths : List[PathLike]
+            paths to the yaml configuration files, in the order they should run
+        payloads : Optional[List[Optional[Dict]]], optional
+            payload for each config, by default None
+        resource_file : Optional[PathLike], optional
+            path to existing resource file describing the state before the first config, by default None
+        resource_file_out : Optional[PathLike], optional
+            where to save the resource state after compiling, by default None
+        write_resources : bool, optional
+            whether to save the resource state when no `resource_file_out` is given, by default False
+        reset_when_done : bool, optional
+            whether to reset the class when finished compiling, by default False
+
+        Returns
+        -------
+        Tuple[bytes, Optional[str]]
+            the protocol.py file's content and the path to the resource file, if one was written
+        """
+        sink = io.BytesIO()
+        self.stream_batch_protocol(
+            sink, config_paths, payloads=payloads, resource_file=resource_file
+        )
+
+        resource_file_out = self._write_resources(
+            resource_file=resource_file,
+            resource_file_out=resource_file_out,
+            write_resources=write_resources,
+            overwrite_resources_json=False,
+        )
+
+        if reset_when_done:
+            self._reset()
+
+        return sink.getvalue(), resource_file_out
+
+    def stream_protocol(
+        self,
+        sink: Sink,
+        config_path: Optional[PathLike] = None,
+        payload: Optional[Dict] = None,
+        resource_file: Optional[PathLike] = None,
+    ) -> None:
+        """Compiles a config into any writable sink, writing the protocol as it is generated
+
+        Only a chunk of the protocol is held in memory at a time, however many transfers the
+        config has, and the start of the protocol reaches the sink before the end is compiled.
+        Resource usage is up to date once this returns, see `yaml_to_protocol` for saving it.
+
+        Parameters
+        ----------
+        sink : Sink
+            open text or binary file, `io.BytesIO`, or anything else with a `write` method
+        config_path : Optional[PathLike], optional
+            path to yaml configuration file, if not present, will look to self, by default None
+        payload : Optional[Dict], optional
+            values for the `payload.` fields of the config, by default None
+        resource_file : Optional[PathLike], optional
+           path to existing resource file, by default None
+        """
+        if not self.config:
+            self.load_config(config_path)
+
+        if resource_file and not self.resource_file:
+            self.load_config(self.config_path, resource_file)
+
+        write_lines(
+            chain(self._create_setup(), self._create_commands(payload=payload)), sink
+        )
+
+    def stream_batch_protocol(
+        self,
+        sink: Sink,
+        config_paths: List[PathLike],
+        payloads: Optional[List[Optional[Dict]]] = None,
+        resource_file: Optional[PathLike] = None,
+    ) -> None:
+        """Compiles several configs that share a deck layout into any writable sink, see `yaml_to_batch_protocol`
+
+        Parameters
+        ----------
+        sink : Sink
+            open text or binary file, `io.BytesIO`, or anything else with a `write` method
+        config_paths : List[PathLike]
+            paths to the yaml configuration files, in the order they should run
+        payloads : Optional[List[Optional[Dict]]], optional
+            payload for each config, by default None
+        resource_file : Optional[PathLike], optional
+            path to existing resource file describing the state before the first config, by default None
+
+        Raises
+        ------
+        Exception
+            If the configs do not share the same deck layout
+        """
+        if payloads is None:
+            payloads = [None] * len(config_paths)
+        if len(payloads) != len(config_paths):
+            raise Exception("Need exactly one payload per config when batching")
+
+        write_lines(self._batch_lines(config_paths, payloads, resource_file), sink)
+
+    def _batch_lines(
+        self,
+        config_paths: List[PathLike],
+        payloads: List[Optional[Dict]],
+        resource_file: Optional[PathLike] = None,
+    ) -> Generator[str, None, None]:
+        """Python snippets of a batched protocol, loading each config when its turn comes"""
+        step_marker_template = self.templates["step_marker"]
+
+        equipment = None
+        resources = returned_tips = None
+        for step, (config_path, payload) in enumerate(
+            zip(config_paths, payloads, strict=True)
+        ):
+            self.load_config(
+                config_path, resource_file=resource_file if step == 0 else None
+            )
+            if step == 0:
+                equipment = self.config.equipment
+                yield from self._create_setup()
+            else:
+                if not same_deck_layout(equipment, self.config.equipment):
+                    raise ValueError(
+                        f"Config {config_path} does not share the deck layout of {config_paths[0]}"
+                    )
+                # thread the resource usage through from the previous config
+                self.resource_manager.resources = resources
+                self.resource_manager.returned_tips = returned_tips
+
+            step_name = (
+                self.metadata.protocolName
+                if self.metadata is not None
+                else Path(config_path).stem
+            )
+            yield step_marker_template.render(
+                message=repr(f"{STEP_MARKER} {step}: {step_name}")
+            )
+            yield from self._create_commands(payload=payload)
+            resources = self.resource_manager.resources
+            returned_tips = self.resource_manager.returned_tips
+
+    def _cache_lookup(
+        self,
+        cache: CompileCache,
+        config_path: Optional[PathLike],
+        payload: Optional[Dict],
+        resource_file: Optional[PathLike],
+    ) -> Tuple[str, Optional[Tuple[Path, Path]]]:
+        """Key of a compile and its cached protocol and resource state, if any
+
+        On a miss the config is loaded, so the compile that follows is of the config the key
+        was made from. On a hit only the config and resource file paths are updated.
+        """
+        if config_path is None:
+            # compiling the config that is already loaded
+            config_path = self.config_path
+            resource_file = resource_file or self.resource_file
+        key = cache.key(
+            config_path, payload, resource_file, self.templates, compact=self.compact
+        )
+        cached = cache.get(key)
+        if cached is not None and cached[1] is not None:
+            # the config is not loaded, but its resources go where loading it would send them
+            self.config_path = config_path
+            self.resource_file = resource_file
+            # nothing was planned
+            self.tips_saved = Counter()
+            return key, cached
+        self.load_config(config_path, resource_file)
+        return key, None
+
+    def _protocol_out(self, protocol_out_path: Optional[PathLike] = None) -> Path:
+        """Generate a name for the protocol file to write, unique even between concurrent compiles"""
+        name = output_name("protocol_", ".py")
+        if protocol_out_path is None:
+            return Path(f"./{name}")
+
+        return Path(str(protocol_out_path) + f"/{name}")
+
+    def _create_setup(self) -> List[str]:
+        """Creates the top of the protocol: requirements, header, labware and pipettes
+
+        Returns:
+            List[str]: python snippets that set up the deck, up to the first command
+        """
         protocol = []
 
         # add requirements
-        reqs = open((self.template_dir / "requirements.template")).read()
+        reqs = self.templates["requirements"]
         if self.requirements is not None:
             rtype = self.requirements["robotType"]
-            reqs = reqs.replace("#robotType#", f'"{rtype}"')
+            reqs = reqs.render(robotType=f'"{rtype}"')
+        else:
+            reqs = reqs.text
 
         protocol.append(reqs)
 
         # Header and run() declaration with initial deck and pipette dicts
-        header = open((self.template_dir / "header.template")).read()
+        header = self.templates["header"]
         if self.metadata is not None:
-            header = header.replace(
-                "#metadata#", f"metadata = {self.metadata.model_dump_json(indent=4)}"
+            header = header.render(
+                metadata=f"metadata = {self.metadata.model_dump_json(indent=4)}"
             )
 
         else:
-            header = header.replace("#metadata#", "")
+            header = header.render(metadata="")
         protocol.append(header)
 
         # load labware and pipette
@@ -489,150 +906,145 @@ class ProtoPiler:
             "\n    ################\n    # load labware #\n    ################"
         )
 
-        labware_block = open((self.template_dir / "load_labware.template")).read()
-        module_block = open((self.template_dir / "load_module.template")).read()
-        offset_block = open((self.template_dir / "labware_offset.template")).read()
-        trash_block = open((self.template_dir / "trash.template")).read()
+        labware_block = self.templates["load_labware"]
+        module_block = self.templates["load_module"]
+        offset_block = self.templates["labware_offset"]
+        trash_block = self.templates["trash"]
         # TODO: think of some better software design for accessing members of resource manager
         for location, name in self.resource_manager.location_to_labware.items():
             match = False
             for loc, nm in self.resource_manager.module_info.items():
                 if loc == location:
-                    labware_command = module_block.replace("#module_name#", f'"{nm}"')
-                    labware_command = labware_command.replace(
-                        "#location#", f'"{location}"'
-                    )
-                    labware_command = labware_command.replace(
-                        "#nickname#", f"{'module'}"
-                    )
-                    labware_command = labware_command.replace(
-                        "#labware_name#", f'"{name}"'
+                    labware_command = module_block.render(
+                        module_name=f'"{nm}"',
+                        location=f'"{location}"',
+                        nickname=f"{'module'}",
+                        labware_name=f'"{name}"',
                     )
                     match = True
 
             if not match:
                 if name == "trash":
-                    labware_command = trash_block.replace("#location#", f'"{location}"')
+                    labware_command = trash_block.render(location=f'"{location}"')
                 else:
-                    labware_command = labware_block.replace("#name#", f'"{name}"')
-                    labware_command = labware_command.replace(
-                        "#location#", f'"{location}"'
+                    labware_command = labware_block.render(
+                        name=f'"{name}"', location=f'"{location}"'
                     )
 
             protocol.append(labware_command)
 
             for loc, off in self.resource_manager.offset_to_location.items():
                 if loc == location:
-                    offset_command = offset_block.replace("#x_offset#", f"{off[0]}")
-                    offset_command = offset_command.replace("#y_offset#", f"{off[1]}")
-                    offset_command = offset_command.replace("#z_offset#", f"{off[2]}")
-                    offset_command = offset_command.replace(
-                        "#location#", f'"{location}"'
+                    offset_command = offset_block.render(
+                        x_offset=f"{off[0]}",
+                        y_offset=f"{off[1]}",
+                        z_offset=f"{off[2]}",
+                        location=f'"{location}"',
                     )
 
                     protocol.append(offset_command)
 
-        instrument_block = open((self.template_dir / "load_instrument.template")).read()
+        instrument_block = self.templates["load_instrument"]
 
         # TODO: think of some better software design for accessing members of resource manager
         for mount, name in self.resource_manager.mount_to_pipette.items():
-            pipette_command = instrument_block.replace("#name#", f'"{name}"')
-            pipette_command = pipette_command.replace("#mount#", f'"{mount}"')
-
             # get valid tipracks
             valid_tiprack_locations = self.resource_manager.find_valid_tipracks(name)
             if len(valid_tiprack_locations) == 0:
                 print(f"Warning, no tipracks found for: {name}")
-            pipette_command = pipette_command.replace(
-                "#tip_racks#",
-                ", ".join([f'deck["{loc}"]' for loc in valid_tiprack_locations]),
+            pipette_command = instrument_block.render(
+                name=f'"{name}"',
+                mount=f'"{mount}"',
+                tip_racks=", ".join(
+                    [f'deck["{loc}"]' for loc in valid_tiprack_locations]
+                ),
             )
             protocol.append(pipette_command)
 
+        # compact transfer tables define the function that runs them once, where first needed
+        self._transfer_defined = False
+        # tips the planner did without, see `_planned_tips`
+        self.tips_saved = Counter()
+
         # TODO: if flex, add trash location
         # execute commands
         protocol.append(
             "\n    ####################\n    # execute commands #\n    ####################"
         )
 
-        commands_python = self._create_commands(payload=payload)
-        protocol.extend(commands_python)
+        return protocol
 
-        # TODO: anything to write for closing?
+    def _write_resources(
+        self,
+        resource_file: Optional[PathLike] = None,
+        resource_file_out: Optional[PathLike] = None,
+        write_resources: bool = True,
+        overwrite_resources_json: bool = True,
+        resource_json: Optional[str] = None,
+    ) -> Optional[str]:
+        """Save the resource manager's state after compiling, see `yaml_to_protocol`
 
-        with open(protocol_out, "w+") as f:
-            f.write("\n".join(protocol))
+        Args:
+            resource_json (Optional[str]): resource state to save instead of the resource
+                manager's, e.g. from a cached compile
 
+        Returns:
+            Optional[str]: path to the resource file written, if any
+        """
         # Hierarchy:
         # 1. resource out given
         # 2. resource file given, and writing resources is true
         # 3. self.resources is not none, we are writing resources, and can overwrite it if present
         # 4. we are writing resources but do not have either file, dump it here with generated name
         if resource_file_out is not None:
-            resource_file_out = self.resource_manager.dump_resource_json(
-                out_file=resource_file_out
-            )
+            out_file = resource_file_out
 
         elif resource_file and write_resources:
-            resource_file_out = self.resource_manager.dump_resource_json(
-                out_file=resource_file
-            )
+            out_file = resource_file
 
         elif self.resource_file and write_resources and overwrite_resources_json:
-            resource_file_out = self.resource_manager.dump_resource_json(
-                out_file=self.resource_file
-            )
+            out_file = self.resource_file
 
         elif write_resources:
-            resource_file_out = self.resource_manager.dump_resource_json()
+            out_file = None
 
-        if reset_when_done:
-            self._reset()
+        else:
+            return resource_file_out
 
-        return protocol_out, resource_file_out
+        if resource_json is None:
+            return self.resource_manager.dump_resource_json(out_file=out_file)
+        return save_resource_json(resource_json, out_file, self.resource_file)
+
+    def _create_commands(self, payload: Optional[Dict]) -> Generator[str, None, None]:
+        """Creates the flow of commands for the OT2 to run, one snippet at a time
 
-    def _create_commands(self, payload: Optional[Dict]) -> List[str]:
-        """Creates the flow of commands for the OT2 to run
+        Snippets are generated as they are consumed, so the resource usage is only complete once
+        the generator is exhausted.
 
         Raises:
             Exception: If no tips are present for the current pipette
             Exception: If no wellplates are installed in the deck
 
         Returns:
-            List[str]: python snippets of commands to be run
+            Generator[str, None, None]: python snippets of commands to be run
         """
 
-        commands = []
-
         # load command templates
-        aspirate_template = open((self.template_dir / "aspirate.template")).read()
-        dispense_template = open((self.template_dir / "dispense.template")).read()
-        pick_tip_template = open((self.template_dir / "pick_tip.template")).read()
-        drop_tip_template = open((self.template_dir / "drop_tip.template")).read()
-        return_tip_template = open((self.template_dir / "return_tip.template")).read()
-        mix_template = open((self.template_dir / "mix.template")).read()
-        dispense_clearance_template = open(
-            (self.template_dir / "dispense_clearance.template")
-        ).read()
-        aspirate_clearance_template = open(
-            (self.template_dir / "aspirate_clearance.template")
-        ).read()
-        blow_out_template = open((self.template_dir / "blow_out.template")).read()
-        temp_change_template = open(
-            (self.template_dir / "set_temperature.template")
-        ).read()
-        move_labware_template = open(
-            (self.template_dir / "move_labware.template")
-        ).read()
-        deactivate_template = open((self.template_dir / "deactivate.template")).read()
-        move_template = open((self.template_dir / "move_pipette.template")).read()
+        pick_tip_template = self.templates["pick_tip"]
+        drop_tip_template = self.templates["drop_tip"]
+        return_tip_template = self.templates["return_tip"]
+        mix_template = self.templates["mix"]
+        temp_change_template = self.templates["set_temperature"]
+        move_labware_template = self.templates["move_labware"]
+        deactivate_template = self.templates["deactivate"]
+        move_template = self.templates["move_pipette"]
         tip_loaded = {"left": False, "right": False}
         for i, command_block in enumerate(self.commands):
             block_name = (
                 command_block.name if command_block.name is not None else f"command {i}"
             )
 
-            commands.append(f"\n    # {block_name}")
+            yield f"\n    # {block_name}"
             # TODO: Inject the payload here
             # Inject the payload
             if isinstance(payload, dict):
@@ -677,163 +1089,36 @@ class ProtoPiler:
                             setattr(command_block, step_arg_key, value)
 
             if isinstance(command_block, Transfer):
-                for (
-                    volume,
-                    src,
-                    dst,
-                    mix_cycles,
-                    mix_vol,
-                    asp_height,
-                    disp_height,
-                    blow_out,
-                    drop_tip,
-                    return_tip,
-                ) in self._process_instruction(command_block):
-                    if volume <= 0:
-                        pass
-                    else:
-                        # determine which pipette to use
-                        pipette_mount = self.resource_manager.determine_pipette(
-                            volume, False
-                        )
-
-                        if pipette_mount is None:
-                            raise Exception(
-                                f"No pipette available for {block_name} with volume: {volume}"
-                            )
-                        # check for tip
-                        if not tip_loaded[pipette_mount]:
-                            load_command = pick_tip_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                            # TODO: think of some better software design for accessing members of resource manager
-                            pipette_name = self.resource_manager.mount_to_pipette[
-                                pipette_mount
-                            ]
-
-                            # TODO: define flag to grab from specific well or just use the ones defined by the OT2
-                            if True:
-                                (
-                                    rack_location,
-                                    well_location,
-                                ) = self.resource_manager.get_next_tip(pipette_name, 1)
-                                location_string = (
-                                    f'deck["{rack_location}"].wells()[{well_location}]'
-                                )
-                                load_command = load_command.replace(
-                                    "#location#", location_string
-                                )
-                            else:
-                                load_command = load_command.replace("#location#", "")
-                                self.resource_manager.update_tip_usage(pipette_name)
-
-                            commands.append(load_command)
-                            tip_loaded[pipette_mount] = True
-
-                        # aspirate and dispense
-                        # set aspirate clearance
-                        aspirate_clearance_command = (
-                            aspirate_clearance_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                        )
-                        aspirate_clearance_command = aspirate_clearance_command.replace(
-                            "#height#", str(asp_height)
-                        )
-                        commands.append(aspirate_clearance_command)
-                        src_wellplate_location = self._parse_wellplate_location(src)
-                        # should handle things not formed like loc:well
-                        src_well = src.split(":")[-1]
-
-                        aspirate_command = aspirate_template.replace(
-                            "#pipette#", f'pipettes["{pipette_mount}"]'
-                        )
-                        aspirate_command = aspirate_command.replace(
-                            "#volume#", str(volume)
-                        )
-                        aspirate_command = aspirate_command.replace(
-                            "#src#", f'deck["{src_wellplate_location}"]["{src_well}"]'
-                        )
-                        commands.append(aspirate_command)
-                        self.resource_manager.update_well_usage(
-                            src_wellplate_location, src_well
-                        )
-
-                        # set dispense clearance
-                        dispense_clearance_command = (
-                            dispense_clearance_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                        )
-                        dispense_clearance_command = dispense_clearance_command.replace(
-                            "#height#", str(disp_height)
-                        )
-                        commands.append(dispense_clearance_command)
-
-                        dst_wellplate_location = self._parse_wellplate_location(dst)
-                        dst_well = dst.split(":")[
-                            -1
-                        ]  # should handle things not formed like loc:well
-                        dispense_command = dispense_template.replace(
-                            "#pipette#", f'pipettes["{pipette_mount}"]'
-                        )
-                        dispense_command = dispense_command.replace(
-                            "#volume#", str(volume)
-                        )
-                        dispense_command = dispense_command.replace(
-                            "#dst#", f'deck["{dst_wellplate_location}"]["{dst_well}"]'
-                        )
-                        commands.append(dispense_command)
-                        # update resource usage
-                        self.resource_manager.update_well_usage(
-                            dst_wellplate_location, dst_well
-                        )
-
-                        if mix_cycles is not None:
-                            if mix_cycles >= 1:
-                                # hardcoded to destination well for now
-                                mix_command = mix_template.replace(
-                                    "#pipette#", f'pipettes["{pipette_mount}"]'
-                                )
-                                mix_command = mix_command.replace(
-                                    "#volume#", str(mix_vol)
-                                )
-                                mix_command = mix_command.replace(
-                                    "#loc#",
-                                    f'deck["{dst_wellplate_location}"]["{dst_well}"]',  # same as destination
-                                )
-                                mix_command = mix_command.replace(
-                                    "#reps#", str(mix_cycles)
-                                )
-
-                                commands.append(mix_command)
-
-                            # no change in resources
-                        if blow_out:
-                            blowout_command = blow_out_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                            commands.append(blowout_command)
-
-                        if drop_tip:
-                            drop_command = drop_tip_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                            commands.append(drop_command)
-                            tip_loaded[pipette_mount] = False
-
-                        if return_tip:
-                            return_command = return_tip_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                            commands.append(return_command)
-                            tip_loaded[pipette_mount] = False
-
-                        commands.append("")
+                steps = self._transfer_steps(command_block, block_name)
+                groups = transfer_groups(
+                    command_block, steps, self.resource_manager.pipette_volume
+                )
+                group_lines = lone_steps = None
+                if command_block.distribute:
+                    group_lines = partial(
+                        self._distribution_lines,
+                        disposal_volume=command_block.disposal_volume,
+                    )
+                    lone_steps = partial(
+                        self._takes_disposal,
+                        disposal_volume=command_block.disposal_volume,
+                    )
+                elif command_block.consolidate:
+                    group_lines = partial(
+                        self._consolidation_lines, air_gap=command_block.air_gap
+                    )
+                if command_block.reuse_tips:
+                    tips = self._planned_tips(groups, tip_loaded)
+                else:
+                    tips = self._flagged_tips(groups, tip_loaded)
+                mount = yield from self._transfer_groups(tips, group_lines, lone_steps)
+                if mount is not None:
+                    pipette_mount = mount
 
             elif isinstance(command_block, Ninetysix_Transfer):
                 pass
             elif isinstance(command_block, Multi_Transfer):
+                steps = []
                 for (
                     volume,
                     src,
@@ -877,89 +1162,29 @@ class ProtoPiler:
                                 ]
                             ):
                                 raise Exception("Selected pipette is not multi-channel")
+                        new_src = copy.copy(src)
+                        new_src = new_src.replace("'", "")
+                        new_src = new_src.split(":")[-1]
+                        new_src = new_src.strip("][").split(", ")
                         # check for tip
+                        tip = None
                         if not tip_loaded[pipette_mount]:
-                            load_command = pick_tip_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
                             pipette_name = self.resource_manager.mount_to_pipette[
                                 pipette_mount
                             ]
-                            new_src = copy.copy(src)
-                            new_src = new_src.replace("'", "")
-                            new_src = new_src.split(":")[-1]
-                            new_src = new_src.strip("][").split(", ")
-
-                            # TODO: define flag to grab from specific well or just use the ones defined by the OT2
-                            if True:
-                                (
-                                    rack_location,
-                                    well_location,
-                                ) = self.resource_manager.get_next_tip(
-                                    pipette_name, len(new_src)
-                                )
-
-                                location_string = (
-                                    f'deck["{rack_location}"].wells()[{well_location}]'
-                                )
-                                load_command = load_command.replace(
-                                    "#location#", location_string
-                                )
-                            else:
-                                load_command = load_command.replace("#location#", "")
-                                self.resource_manager.update_tip_usage(pipette_name)
-
-                            commands.append(load_command)
+                            tip = self.resource_manager.get_next_tip(
+                                pipette_name, len(new_src)
+                            )
                             tip_loaded[pipette_mount] = True
 
-                        else:
-                            new_src = copy.copy(src)
-                            new_src = new_src.replace("'", "")
-                            new_src = new_src.split(":")[-1]
-                            new_src = new_src.strip("][").split(", ")
-
-                        # aspirate and dispense
-                        # set aspirate clearance
-                        aspirate_clearance_command = (
-                            aspirate_clearance_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                        )
-                        aspirate_clearance_command = aspirate_clearance_command.replace(
-                            "#height#", str(asp_height)
-                        )
-                        commands.append(aspirate_clearance_command)
                         src_wellplate_location = self._parse_wellplate_location(src)
                         # should handle things not formed like loc:well
                         src_well = new_src[0]
                         src_well = src_well.strip('"')
-
-                        aspirate_command = aspirate_template.replace(
-                            "#pipette#", f'pipettes["{pipette_mount}"]'
-                        )
-                        aspirate_command = aspirate_command.replace(
-                            "#volume#", str(volume)
-                        )
-                        aspirate_command = aspirate_command.replace(
-                            "#src#", f'deck["{src_wellplate_location}"]["{src_well}"]'
-                        )
-                        commands.append(aspirate_command)
-
                         self.resource_manager.update_well_usage(
                             src_wellplate_location, new_src
                         )
 
-                        # set dispense clearance
-                        dispense_clearance_command = (
-                            dispense_clearance_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                        )
-                        dispense_clearance_command = dispense_clearance_command.replace(
-                            "#height#", str(disp_height)
-                        )
-                        commands.append(dispense_clearance_command)
-
                         dst_wellplate_location = self._parse_wellplate_location(dst)
                         new_dst = copy.copy(dst)
                         new_dst = new_dst.replace("'", "")
@@ -969,69 +1194,47 @@ class ProtoPiler:
                             0
                         ]  # should handle things not formed like loc:well
                         dst_well = dst_well.strip('"')
-                        dispense_command = dispense_template.replace(
-                            "#pipette#", f'pipettes["{pipette_mount}"]'
-                        )
-                        dispense_command = dispense_command.replace(
-                            "#volume#", str(volume)
-                        )
-                        dispense_command = dispense_command.replace(
-                            "#dst#", f'deck["{dst_wellplate_location}"]["{dst_well}"]'
-                        )
-                        commands.append(dispense_command)
                         # update resource usage
                         self.resource_manager.update_well_usage(
                             dst_wellplate_location, new_dst
                         )
 
-                        if mix_cycles is not None:
-                            if mix_cycles >= 1:
-                                # hardcoded to destination well for now
-                                mix_command = mix_template.replace(
-                                    "#pipette#", f'pipettes["{pipette_mount}"]'
-                                )
-                                mix_command = mix_command.replace(
-                                    "#volume#", str(mix_vol)
-                                )
-                                mix_command = mix_command.replace(
-                                    "#loc#",
-                                    f'deck["{dst_wellplate_location}"]["{dst_well}"]',  # same as destination
-                                )
-                                mix_command = mix_command.replace(
-                                    "#reps#", str(mix_cycles)
-                                )
-
-                                commands.append(mix_command)
-
-                            # no change in resources
-                        if blow_out:
-                            blowout_command = blow_out_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                            commands.append(blowout_command)
                         if drop_tip:
-                            drop_command = drop_tip_template.replace(
-                                "#pipette#", f'pipettes["{pipette_mount}"]'
-                            )
-                            commands.append(drop_command)
                             tip_loaded[pipette_mount] = False
 
-                        commands.append("")
+                        step = TransferStep(
+                            pipette_mount,
+                            tip,
+                            volume,
+                            (src_wellplate_location, src_well),
+                            (dst_wellplate_location, dst_well),
+                            asp_height,
+                            disp_height,
+                            mix_cycles,
+                            mix_vol,
+                            blow_out,
+                            drop_tip,
+                            False,
+                        )
+                        if self.compact:
+                            steps.append(step)
+                        else:
+                            yield from self._transfer_lines(step)
+                if steps:
+                    yield self._transfer_table(steps)
 
             elif isinstance(command_block, Move_Labware):
-                move_labware_command = move_labware_template.replace(
-                    "#plate#", str(command_block.labware)
-                )
-                move_labware_command = move_labware_command.replace(
-                    "#destination#", str(command_block.destination)
+                move_labware_command = move_labware_template.render(
+                    plate=str(command_block.labware),
+                    destination=str(command_block.destination),
                 )
-                commands.append(move_labware_command)
+                yield move_labware_command
 
             elif isinstance(command_block, Temperature_Set):
-                temp_change_command = temp_change_template.replace(
-                    "#temp#", str(command_block.change_temp)
+                temp_change_command = temp_change_template.render(
+                    temp=str(command_block.change_temp)
                 )
-                commands.append(temp_change_command)
+                yield temp_change_command
 
             elif isinstance(command_block, Mix):
                 if (
@@ -1049,9 +1252,6 @@ class ProtoPiler:
                     # TODO: make more robust
                     # # check for tip
                     if not tip_loaded[pipette_mount]:
-                        load_command = pick_tip_template.replace(
-                            "#pipette#", f'pipettes["{pipette_mount}"]'
-                        )
                         pipette_name = self.resource_manager.mount_to_pipette[
                             pipette_mount
                         ]
@@ -1065,33 +1265,30 @@ class ProtoPiler:
                             location_string = (
                                 f'deck["{rack_location}"].wells()[{well_location}]'
                             )
-                            load_command = load_command.replace(
-                                "#location#", location_string
+                            load_command = pick_tip_template.render(
+                                pipette=f'pipettes["{pipette_mount}"]',
+                                location=location_string,
                             )
                         else:
-                            load_command = load_command.replace("#location#", "")
+                            load_command = pick_tip_template.render(
+                                pipette=f'pipettes["{pipette_mount}"]', location=""
+                            )
                             self.resource_manager.update_tip_usage(pipette_name)
 
-                        commands.append(load_command)
+                        yield load_command
                         tip_loaded[pipette_mount] = True
 
-                    mix_command = mix_template.replace(
-                        "#reps#", str(command_block.reps)
-                    )
-                    mix_command = mix_command.replace(
-                        "#volume#", str(command_block.mix_volume)
-                    )
                     wellplate_location = self._parse_wellplate_location(
                         command_block.location
                     )
                     well = command_block.location.split(":")[-1]
-                    mix_command = mix_command.replace(
-                        "#loc#", f'deck["{wellplate_location}"]["{well}"]'
-                    )
-                    mix_command = mix_command.replace(
-                        "#pipette#", f'pipettes["{pipette_mount}"]'
+                    mix_command = mix_template.render(
+                        reps=str(command_block.reps),
+                        volume=str(command_block.mix_volume),
+                        loc=f'deck["{wellplate_location}"]["{well}"]',
+                        pipette=f'pipettes["{pipette_mount}"]',
                     )
-                    commands.append(mix_command)
+                    yield mix_command
 
                 else:
                     iter_len = 0
@@ -1146,9 +1343,6 @@ class ProtoPiler:
                         )
                     # # check for tip
                     if not tip_loaded[pipette_mount]:
-                        load_command = pick_tip_template.replace(
-                            "#pipette#", f'pipettes["{pipette_mount}"]'
-                        )
                         pipette_name = self.resource_manager.mount_to_pipette[
                             pipette_mount
                         ]
@@ -1162,36 +1356,37 @@ class ProtoPiler:
                             location_string = (
                                 f'deck["{rack_location}"].wells()[{well_location}]'
                             )
-                            load_command = load_command.replace(
-                                "#location#", location_string
+                            load_command = pick_tip_template.render(
+                                pipette=f'pipettes["{pipette_mount}"]',
+                                location=location_string,
                             )
                         else:
-                            load_command = load_command.replace("#location#", "")
+                            load_command = pick_tip_template.render(
+                                pipette=f'pipettes["{pipette_mount}"]', location=""
+                            )
                             self.resource_manager.update_tip_usage(pipette_name)
 
-                        commands.append(load_command)
+                        yield load_command
                         tip_loaded[pipette_mount] = True
 
                     for loc, mix_vols, rep in zip(
                         locations, mix_volumes, mix_reps, strict=False
                     ):
-                        mix_command = mix_template.replace("#reps#", str(rep))
-                        mix_command = mix_command.replace("#volume#", str(mix_vols))
                         wellplate_location = self._parse_wellplate_location(loc)
                         well = loc.split(":")[-1]
-                        mix_command = mix_command.replace(
-                            "#loc#", f'deck["{wellplate_location}"]["{well}"]'
-                        )
-                        mix_command = mix_command.replace(
-                            "#pipette#", f'pipettes["{pipette_mount}"]'
+                        mix_command = mix_template.render(
+                            reps=str(rep),
+                            volume=str(mix_vols),
+                            loc=f'deck["{wellplate_location}"]["{well}"]',
+                            pipette=f'pipettes["{pipette_mount}"]',
                         )
-                        commands.append(mix_command)
+                        yield mix_command
 
             elif isinstance(command_block, Deactivate):
                 if not isinstance(command_block.deactivate, bool):
                     raise Exception("deactivate command must be bool")
-                deactivate_command = deactivate_template.replace("#turn_off#", "")
-                commands.append(deactivate_command)
+                deactivate_command = deactivate_template.render(turn_off="")
+                yield deactivate_command
 
             elif isinstance(command_block, Replace_Tip):
                 if not isinstance(command_block.replace_tip, bool):
@@ -1200,20 +1395,20 @@ class ProtoPiler:
                 if tip_loaded[pipette_mount] is False:
                     print("NO TIP TO REPLACE")
                 else:
-                    replace_tip_command = return_tip_template.replace(
-                        "#pipette#", f'pipettes["{pipette_mount}"]'
+                    replace_tip_command = return_tip_template.render(
+                        pipette=f'pipettes["{pipette_mount}"]'
                     )
-                    commands.append(replace_tip_command)
+                    yield replace_tip_command
                     tip_loaded[pipette_mount] = False
 
             elif isinstance(command_block, Clear_Pipette):
                 if not isinstance(command_block.clear, bool):
                     raise Exception("clear command must be True or False")
 
-                clear_command = drop_tip_template.replace(
-                    "#pipette#", f'pipettes["{pipette_mount}"]'
+                clear_command = drop_tip_template.render(
+                    pipette=f'pipettes["{pipette_mount}"]'
                 )
-                commands.append(clear_command)
+                yield clear_command
                 tip_loaded[pipette_mount] = False
 
             elif isinstance(command_block, Move_Pipette):
@@ -1223,13 +1418,11 @@ class ProtoPiler:
                     raise Exception("number must be a valid deck position 1-12")
                 # TODO: need to establish pipette mount to move
                 # pipette_mount = self.resource_manager.pipette_to_mount[]
-                move_command = move_template.replace(
-                    "#pipette#", f'pipettes["{pipette_mount}"]'
-                )
-                move_command = move_command.replace(
-                    "#location#", str(command_block.move_to)
+                move_command = move_template.render(
+                    pipette=f'pipettes["{pipette_mount}"]',
+                    location=str(command_block.move_to),
                 )
-                commands.append(move_command)
+                yield move_command
             else:
                 raise Exception(
                     f"Command {command_block} not recognized, check that the command is formatted correctly"
@@ -1237,12 +1430,353 @@ class ProtoPiler:
 
         for mount, status in tip_loaded.items():
             if status:
-                commands.append(
-                    drop_tip_template.replace("#pipette#", f'pipettes["{mount}"]')
+                yield drop_tip_template.render(pipette=f'pipettes["{mount}"]')
+                tip_loaded[mount] = False
+
+    def _transfer_steps(
+        self, command_block: Transfer, block_name: str
+    ) -> Generator[TransferStep, None, None]:
+        """The steps of a transfer block, on the pipette each volume needs, tips not yet assigned"""
+        for (
+            volume,
+            src,
+            dst,
+            mix_cycles,
+            mix_vol,
+            asp_height,
+            disp_height,
+            blow_out,
+            drop_tip,
+            return_tip,
+        ) in self._process_instruction(command_block):
+            if volume <= 0:
+                continue
+            # determine which pipette to use
+            pipette_mount = self.resource_manager.determine_pipette(volume, False)
+            if pipette_mount is None:
+                raise Exception(
+                    f"No pipette available for {block_name} with volume: {volume}"
                 )
+            # should handle things not formed like loc:well
+            yield TransferStep(
+                pipette_mount,
+                None,
+                volume,
+                (self._parse_wellplate_location(src), src.split(":")[-1]),
+                (self._parse_wellplate_location(dst), dst.split(":")[-1]),
+                asp_height,
+                disp_height,
+                mix_cycles,
+                mix_vol,
+                blow_out,
+                drop_tip,
+                return_tip,
+            )
+
+    def _flagged_tips(
+        self, groups: Iterable[List[TransferStep]], tip_loaded: Dict[str, bool]
+    ) -> Generator[Tuple[List[TransferStep], Optional[Tuple[str, int]]], None, None]:
+        """Groups with the tip to pick up for each, changing tips as their flags say"""
+        for group in groups:
+            mount = group[0].mount
+            # check for tip
+            tip = None
+            if not tip_loaded[mount]:
+                # TODO: think of some better software design for accessing members of resource manager
+                pipette_name = self.resource_manager.mount_to_pipette[mount]
+                tip = self.resource_manager.get_next_tip(pipette_name, 1)
+                tip_loaded[mount] = True
+            if group[0].drop_tip or group[0].return_tip:
                 tip_loaded[mount] = False
+            yield group, tip
+
+    def _planned_tips(
+        self, groups: Iterable[List[TransferStep]], tip_loaded: Dict[str, bool]
+    ) -> Generator[Tuple[List[TransferStep], Optional[Tuple[str, int]]], None, None]:
+        """Groups with the tip to pick up for each, changing tips by the liquids they touch
 
-        return commands
+        A `TipPlanner` decides, once the next group is known, whether a group's tip stays on for
+        it, goes back to its rack for a later group of the same liquid, or is dropped; the
+        groups' drop_tip and return_tip flags are set accordingly. Tips saved, either kept on or
+        taken back from the rack, are counted in `tips_saved`.
+        """
+        planner = TipPlanner(lambda well: self.resource_manager.well_used(*well))
+        # the last group, the tip picked up for it, where that tip came from, its clean liquid
+        held = None
+        for group in groups:
+            mount = group[0].mount
+            if held is not None and planner.keeps(group):
+                previous, previous_tip, origin, _ = held
+                yield self._with_tip_handling(previous, False, False), previous_tip
+                self.tips_saved["kept"] += 1
+                tip, clean = None, True
+            else:
+                if held is not None:
+                    yield self._release_tip(held, tip_loaded)
+                if tip_loaded[mount]:
+                    # left on by an earlier command, it may have touched anything
+                    tip, origin, clean = None, None, False
+                else:
+                    tip = self._fresh_tip(mount, group_liquid(group))
+                    tip_loaded[mount] = True
+                    origin, clean = tip, True
+            held = (group, tip, origin, planner.serve(group, clean))
+        if held is not None:
+            yield self._release_tip(held, tip_loaded)
+
+    def _fresh_tip(self, mount: str, liquid: Optional[str]) -> Tuple[str, int]:
+        """A tip returned clean for `liquid` on this pipette if there is one, else a new tip"""
+        pipette_name = self.resource_manager.mount_to_pipette[mount]
+        if liquid is not None:
+            tip = self.resource_manager.take_returned_tip(liquid, pipette_name)
+            if tip is not None:
+                self.tips_saved["reused"] += 1
+                return tip
+        return self.resource_manager.get_next_tip(pipette_name, 1)
+
+    def _release_tip(
+        self,
+        held: Tuple[
+            List[TransferStep],
+            Optional[Tuple[str, int]],
+            Optional[Tuple[str, int]],
+            Optional[str],
+        ],
+        tip_loaded: Dict[str, bool],
+    ) -> Tuple[List[TransferStep], Optional[Tuple[str, int]]]:
+        """A planned group whose tip is done: returned to its rack if clean, dropped otherwise"""
+        group, tip, origin, liquid = held
+        mount = group[0].mount
+        tip_loaded[mount] = False
+        if liquid is None or origin is None:
+            return self._with_tip_handling(group, True, False), tip
+        pipette_name = self.resource_manager.mount_to_pipette[mount]
+        self.resource_manager.return_tip(liquid, pipette_name, origin)
+        return self._with_tip_handling(group, False, True), tip
+
+    @staticmethod
+    def _with_tip_handling(
+        group: List[TransferStep], drop_tip: bool, return_tip: bool
+    ) -> List[TransferStep]:
+        """The group's steps, dropping or returning the tip as given"""
+        return [
+            step._replace(drop_tip=drop_tip, return_tip=return_tip) for step in group
+        ]
+
+    def _transfer_groups(
+        self,
+        groups: Iterable[Tuple[List[TransferStep], Optional[Tuple[str, int]]]],
+        group_lines: Optional[
+            Callable[
+                [List[TransferStep], Optional[Tuple[str, int]]],
+                Generator[str, None, None],
+            ]
+        ] = None,
+        lone_steps: Optional[Callable[[TransferStep], bool]] = None,
+    ) -> Generator[str, None, Optional[str]]:
+        """Commands of transfer steps, each group of steps sharing one tip
+
+        Groups come with the tip to pick up first, from `_flagged_tips` or `_planned_tips`.
+        Groups of one step are ordinary transfers, collected into a table in compact mode.
+        Longer groups come from `distribution_groups` or `consolidation_groups`, and are written
+        out command by command by `group_lines`, given the group and the tip to pick up, as are
+        the groups of one step that `lone_steps` picks.
+
+        Returns the mount of the last group, the pipette later tip and move commands act on,
+        or None if there were no groups.
+        """
+        steps = []
+        mount = None
+        for group, tip in groups:
+            mount = group[0].mount
+            # update resource usage
+            for step in group:
+                self.resource_manager.update_well_usage(*step.src)
+                self.resource_manager.update_well_usage(*step.dst)
+
+            if len(group) > 1 or (lone_steps is not None and lone_steps(group[0])):
+                if steps:
+                    yield self._transfer_table(steps)
+                    steps = []
+                yield from group_lines(group, tip)
+            elif self.compact:
+                steps.append(group[0]._replace(tip=tip))
+            else:
+                yield from self._transfer_lines(group[0]._replace(tip=tip))
+        if steps:
+            yield self._transfer_table(steps)
+        return mount
+
+    def _distribution_lines(
+        self,
+        group: List[TransferStep],
+        tip: Optional[Tuple[str, int]],
+        disposal_volume: float,
+    ) -> Generator[str, None, None]:
+        """The commands of one distribution: a single aspirate, then a dispense per step
+
+        The disposal volume is drawn on top of the dispenses, and blown out back into the source
+        if the steps blow out or the tip stays on for more, otherwise it leaves with the tip.
+        """
+        first = group[0]
+        pipette = f'pipettes["{first.mount}"]'
+        src = f'deck["{first.src[0]}"]["{first.src[1]}"]'
+        if tip is not None:
+            rack_location, well_location = tip
+            yield self.templates["pick_tip"].render(
+                pipette=pipette,
+                location=f'deck["{rack_location}"].wells()[{well_location}]',
+            )
+        yield self.templates["aspirate_clearance"].render(
+            pipette=pipette, height=str(first.aspirate_clearance)
+        )
+        total = sum(step.volume for step in group) + disposal_volume
+        yield self.templates["aspirate"].render(
+            pipette=pipette, volume=str(round(total, 6)), src=src
+        )
+        for step in group:
+            yield self.templates["dispense_clearance"].render(
+                pipette=pipette, height=str(step.dispense_clearance)
+            )
+            yield self.templates["dispense"].render(
+                pipette=pipette,
+                volume=str(step.volume),
+                dst=f'deck["{step.dst[0]}"]["{step.dst[1]}"]',
+            )
+        keeps_tip = not (first.drop_tip or first.return_tip)
+        if disposal_volume and (first.blow_out or keeps_tip):
+            # the disposal volume goes back where it came from, a kept tip must be empty
+            # before its next aspirate
+            yield self.templates["blow_out"].render(pipette=pipette, location=src)
+        elif first.blow_out:
+            # blowing out between dispenses would empty the tip, only the last well gets it
+            yield self.templates["blow_out"].render(pipette=pipette, location="")
+        if first.drop_tip:
+            yield self.templates["drop_tip"].render(pipette=pipette)
+        if first.return_tip:
+            yield self.templates["return_tip"].render(pipette=pipette)
+        yield ""
+
+    def _takes_disposal(self, step: TransferStep, disposal_volume: float) -> bool:
+        """Whether a distribution step alone in its group still draws the disposal volume
+
+        It does, like every longer group, unless it mixes its destination or the pipette has no
+        room for the disposal volume; then it is an ordinary transfer.
+        """
+        return (
+            disposal_volume > 0
+            and not step.mixes
+            and step.volume + disposal_volume
+            <= self.resource_manager.pipette_volume(step.mount)
+        )
+
+    def _consolidation_lines(
+        self,
+        group: List[TransferStep],
+        tip: Optional[Tuple[str, int]],
+        air_gap: float,
+    ) -> Generator[str, None, None]:
+        """The commands of one consolidation: an aspirate per step, then a single dispense"""
+        first = group[0]
+        pipette = f'pipettes["{first.mount}"]'
+        dst = f'deck["{first.dst[0]}"]["{first.dst[1]}"]'
+        if tip is not None:
+            rack_location, well_location = tip
+            yield self.templates["pick_tip"].render(
+                pipette=pipette,
+                location=f'deck["{rack_location}"].wells()[{well_location}]',
+            )
+        for step in group:
+            yield self.templates["aspirate_clearance"].render(
+                pipette=pipette, height=str(step.aspirate_clearance)
+            )
+            yield self.templates["aspirate"].render(
+                pipette=pipette,
+                volume=str(step.volume),
+                src=f'deck["{step.src[0]}"]["{step.src[1]}"]',
+            )
+            if air_gap:
+                # keeps this liquid apart from the next, and from dripping on the way
+                yield self.templates["air_gap"].render(
+                    pipette=pipette, volume=str(air_gap)
+                )
+        yield self.templates["dispense_clearance"].render(
+            pipette=pipette, height=str(first.dispense_clearance)
+        )
+        total = sum(step.volume for step in group) + air_gap * len(group)
+        yield self.templates["dispense"].render(
+            pipette=pipette, volume=str(round(total, 6)), dst=dst
+        )
+        if first.mixes:
+            yield self.templates["mix"].render(
+                pipette=pipette,
+                volume=str(first.mix_volume),
+                loc=dst,
+                reps=str(first.mix_cycles),
+            )
+        if first.blow_out:
+            yield self.templates["blow_out"].render(pipette=pipette, location="")
+        if first.drop_tip:
+            yield self.templates["drop_tip"].render(pipette=pipette)
+        if first.return_tip:
+            yield self.templates["return_tip"].render(pipette=pipette)
+        yield ""
+
+    def _transfer_lines(self, step: TransferStep) -> Generator[str, None, None]:
+        """The commands of one transfer step, unrolled"""
+        pipette = f'pipettes["{step.mount}"]'
+        if step.tip is not None:
+            rack_location, well_location = step.tip
+            yield self.templates["pick_tip"].render(
+                pipette=pipette,
+                location=f'deck["{rack_location}"].wells()[{well_location}]',
+            )
+        # aspirate and dispense
+        yield self.templates["aspirate_clearance"].render(
+            pipette=pipette, height=str(step.aspirate_clearance)
+        )
+        yield self.templates["aspirate"].render(
+            pipette=pipette,
+            volume=str(step.volume),
+            src=f'deck["{step.src[0]}"]["{step.src[1]}"]',
+        )
+        yield self.templates["dispense_clearance"].render(
+            pipette=pipette, height=str(step.dispense_clearance)
+        )
+        dst = f'deck["{step.dst[0]}"]["{step.dst[1]}"]'
+        yield self.templates["dispense"].render(
+            pipette=pipette, volume=str(step.volume), dst=dst
+        )
+        if step.mixes:
+            # hardcoded to destination well for now
+            yield self.templates["mix"].render(
+                pipette=pipette,
+                volume=str(step.mix_volume),
+                loc=dst,
+                reps=str(step.mix_cycles),
+            )
+        if step.blow_out:
+            yield self.templates["blow_out"].render(pipette=pipette, location="")
+        if step.drop_tip:
+            yield self.templates["drop_tip"].render(pipette=pipette)
+        if step.return_tip:
+            yield self.templates["return_tip"].render(pipette=pipette)
+        yield ""
+
+    def _transfer_table(self, steps: List[TransferStep]) -> str:
+        """The steps of a transfer block as one table, run by the `transfer` function of the protocol"""
+        rows = []
+        for step in steps:
+            # the tip index goes in unquoted, like in `pick_tip`
+            tip = None if step.tip is None else (step.tip[0], int(step.tip[1]))
+            mix_cycles = step.mix_cycles if (step.mix_cycles or 0) >= 1 else 0
+            fields = step._replace(tip=tip, mix_cycles=mix_cycles)
+            rows.append(f"        ({', '.join(_literal(field) for field in fields)}),")
+        table = self.templates["transfer_table"].render(steps="\n".join(rows))
+        if self._transfer_defined:
+            return table
+        self._transfer_defined = True
+        return "\n".join((self.templates["transfer"].text, table))
 
     def _parse_wellplate_location(self, command_location: str) -> str:
         """Finds the correct wellplate give the commands location
@@ -1392,8 +1926,79 @@ class ProtoPiler:
         pass
 
 
+def _literal(value: Any) -> str:
+    """A value of a transfer step as python source, numbers as they appear in unrolled commands"""
+    if isinstance(value, str):
+        return f'"{value}"'
+    if isinstance(value, (tuple, list)):
+        return f"({', '.join(_literal(item) for item in value)})"
+    return str(value)
+
+
+def same_deck_layout(
+    equipment_a: List[Union[Labware, Pipette]],
+    equipment_b: List[Union[Labware, Pipette]],
+) -> bool:
+    """Checks whether two configs load the same labware and pipettes in the same places
+
+    Parameters
+    ----------
+    equipment_a : List[Union[Labware, Pipette]]
+        equipment of the first config
+    equipment_b : List[Union[Labware, Pipette]]
+        equipment of the second config
+
+    Returns
+    -------
+    bool
+        True if a protocol compiled for one deck can run the commands of the other
+    """
+
+    def layout(equipment: List[Union[Labware, Pipette]]) -> set:
+        return {
+            (
+                item.name,
+                item.location,
+                item.alias,
+                item.module,
+                tuple(item.offset or ()),
+            )
+            if isinstance(item, Labware)
+            else (item.name, item.mount)
+            for item in equipment
+        }
+
+    return layout(equipment_a) == layout(equipment_b)
+
+
+def step_marker(command: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    """The step a command of a run or analysis starts, if it is a `STEP_MARKER` comment
+
+    Parameters
+    ----------
+    command : Dict[str, Any]
+        a command from a run log or a protocol analysis
+
+    Returns
+    -------
+    Optional[Tuple[int, str]]
+        the index and name of the step, None for any other command
+    """
+    if command.get("commandType") not in ("comment", "custom"):
+        return None
+    params = command.get("params") or {}
+    # newer api levels log comments as `comment`, older ones as a legacy `custom` command
+    message = params.get("message") or params.get("legacyCommandText") or ""
+    if not message.startswith(STEP_MARKER):
+        return None
+    step, _, name = message[len(STEP_MARKER) :].strip().partition(": ")
+    return int(step), name
+
+
 def main(args):  # noqa: D103
-    protopiler = ProtoPiler(args.config)
+    cache = None if args.no_cache else CompileCache(args.cache_dir)
+    # the config is loaded by yaml_to_protocol, and not at all on a cache hit
+    protopiler = ProtoPiler(cache=cache, compact=args.compact)
 
     protopiler.yaml_to_protocol(
         config_path=args.config,
@@ -1402,6 +2007,12 @@ def main(args):  # noqa: D103
         resource_file_out=args.resource_out,
         reset_when_done=True,
     )
+    saved = protopiler.tips_saved
+    if saved:
+        print(  # noqa: T201
+            f"Tip planner saved {saved.total()} tips: {saved['kept']} kept on "
+            f"for the same liquid, {saved['reused']} reused after being returned"
+        )
 
 
 if __name__ == "__main__":
@@ -1431,6 +2042,22 @@ if __name__ == "__main__":
         help="Path to save the resource file to",
         type=Path,
     )
+    parser.add_argument(
+        "--cache_dir",
+        help="Directory of the compile cache, shared with the node when it points to the same place",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no_cache",
+        help="Always compile, without reading or filling the cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compact",
+        help="Write transfers as tables run by a loop, for smaller protocols that the robot analyzes faster",
+        action="store_true",
+    )
 
     args = parser.parse_args()
     main(args)
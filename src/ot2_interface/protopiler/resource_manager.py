@@ -4,11 +4,14 @@ import json
 import re
 from argparse import ArgumentParser
 from copy import deepcopy
-from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from ot2_interface.protopiler.config import Labware, PathLike, Pipette, ProtocolConfig
+from ot2_interface.protopiler.stream import output_name
+
+PIPETTE_VOLUME_PATTERN = re.compile(r"\d{2,}")
+"""The volume in a pipette's name, e.g. `300` in `p300_single_gen2`"""
 
 """
 Notes
@@ -79,6 +82,9 @@ class ResourceManager:
 
         # Will leave existing resources as is, will default init new resources not in existing file
         self.resources = self._create_default_resources(resources=resources)
+        # tips put back in their rack clean, by the source well they touched, see `return_tip`;
+        # never saved to the resource file, a later protocol may fill that well with another liquid
+        self.returned_tips: Dict[str, List[Tuple[str, Tuple[str, str]]]] = {}
 
         self.init = True
 
@@ -219,7 +225,10 @@ class ResourceManager:
         for loc in valid_tipracks_locations:
             tiprack_name = self.location_to_labware[loc]
             # dependent on opentrons naming scheme
-            capacity = int(tiprack_name.split("_")[1])
+            if "flex" in tiprack_name:
+                capacity = int(tiprack_name.split("_")[2])
+            else:
+                capacity = int(tiprack_name.split("_")[1])
             left_in_tiprack = capacity - self.resources[loc]["used"]
             num_available += left_in_tiprack
 
@@ -458,12 +467,12 @@ class ResourceManager:
         # if tip_num == 1:
         # if type(well) is not list:
         if isinstance(well, list):
-            self.resources[loc]["wells_used"].add(str(int(well)))
-            self.resources[loc]["used"] += 1
-        else:
             for i in range(tip_num):
                 self.resources[loc]["wells_used"].add(str(int(well[i])))
                 self.resources[loc]["used"] += 1
+        else:
+            self.resources[loc]["wells_used"].add(str(int(well)))
+            self.resources[loc]["used"] += 1
         if self.resources[loc]["used"] == capacity:
             self.resources[loc]["depleted"] = True
 
@@ -530,6 +539,62 @@ class ResourceManager:
         if self.resources[location]["used"] >= capacity:
             self.resources[location]["depleted"] = True
 
+    def well_used(self, location: str, well: str) -> bool:
+        """Whether a well has been used, i.e. may hold liquid, before or during this protocol
+
+        Parameters
+        ----------
+        location : str
+            the deck location of the plate
+        well : str
+            the location of the well on the plate
+
+        Returns
+        -------
+        bool
+            True if the well was aspirated from or dispensed to
+        """
+        return well in self.resources.get(location, {}).get("wells_used", ())
+
+    def return_tip(self, liquid: str, pipette_name: str, tip: Tuple[str, str]) -> None:
+        """Keep a tip returned to its rack for a later transfer of the same liquid
+
+        The tip stays counted as used in its rack, `take_returned_tip` is the only way back to it.
+
+        Parameters
+        ----------
+        liquid : str
+            the only liquid the tip touched
+        pipette_name : str
+            the pipette the tip was used on
+        tip : Tuple[str, str]
+            the tiprack location and tip index the tip was returned to, as from `get_next_tip`
+        """
+        self.returned_tips.setdefault(liquid, []).append((pipette_name, tip))
+
+    def take_returned_tip(
+        self, liquid: str, pipette_name: str
+    ) -> Optional[Tuple[str, str]]:
+        """Take back a tip returned after touching `liquid` on the same pipette, if there is one
+
+        Parameters
+        ----------
+        liquid : str
+            the liquid the tip will be used for
+        pipette_name : str
+            the pipette that needs a tip
+
+        Returns
+        -------
+        Optional[Tuple[str, str]]
+            the tiprack location and tip index to pick up, None if no such tip was returned
+        """
+        tips = self.returned_tips.get(liquid, [])
+        for i, (name, _tip) in enumerate(tips):
+            if name == pipette_name:
+                return tips.pop(i)[1]
+        return None
+
     def find_valid_tipracks(self, pipette_name: str) -> List[str]:
         """Finds the locations of valid tipracks for a given pipette, returned as list of strings
 
@@ -596,9 +661,8 @@ class ResourceManager:
         """
         pipette = None
         min_available = float("inf")
-        pip_volume_pattern = re.compile(r"\d{2,}")
         for mount, name in self.mount_to_pipette.items():
-            pip_volume = int(pip_volume_pattern.search(name).group())
+            pip_volume = self.pipette_volume(mount)
 
             # TODO: make sure the pipettes can handle the max they are labeled as
             if is_multi:
@@ -616,18 +680,28 @@ class ResourceManager:
                             pipette = mount
         return pipette
 
-    def dump_resource_json(self, out_file: Optional[PathLike] = None) -> str:
-        """Save the resource file
+    def pipette_volume(self, mount: str) -> int:
+        """The most a pipette can hold, read from its name (e.g. 300 for `p300_single_gen2`)
 
         Parameters
         ----------
-        out_file : Optional[PathLike], optional
-            place to save the resource file, if none it will be created, by default None
+        mount : str
+            the mount of the pipette, `left` or `right`
+
+        Returns
+        -------
+        int
+            the volume in microliters
+        """
+        return int(PIPETTE_VOLUME_PATTERN.search(self.mount_to_pipette[mount]).group())
+
+    def resource_json(self) -> str:
+        """The resource state as JSON, as `dump_resource_json` saves it
 
         Returns
         -------
         str
-            path to where the file was saved
+            the resource file's content
         """
         out_resources = deepcopy(self.resources)
         for location in out_resources.keys():
@@ -635,25 +709,61 @@ class ResourceManager:
                 out_resources[location]["wells_used"] = list(
                     out_resources[location]["wells_used"]
                 )
+        return json.dumps(out_resources, indent=2)
 
-            # determine out_path,
-            # `out_file` param takes priority, then `resouce_file` from class, then a auto_generated name
-            if not out_file:
-                if not self.resource_file:
-                    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_resources.json"
-                    out_path = Path("./") / name
-                else:
-                    out_path = self.resource_file
-            else:
-                out_path = (
-                    out_file
-                    + f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_resources.json"
-                )
+    def dump_resource_json(self, out_file: Optional[PathLike] = None) -> str:
+        """Save the resource file
+
+        Parameters
+        ----------
+        out_file : Optional[PathLike], optional
+            place to save the resource file, if none it will be created, by default None
+
+        Returns
+        -------
+        str
+            path to where the file was saved
+        """
+        return save_resource_json(self.resource_json(), out_file, self.resource_file)
+
+
+def save_resource_json(
+    content: str,
+    out_file: Optional[PathLike] = None,
+    resource_file: Optional[PathLike] = None,
+) -> str:
+    """Save a resource state, see `ResourceManager.dump_resource_json`
+
+    Parameters
+    ----------
+    content : str
+        the resource state, from `ResourceManager.resource_json`
+    out_file : Optional[PathLike], optional
+        place to save the resource file, if none it will be created, by default None
+    resource_file : Optional[PathLike], optional
+        the resource file the state was loaded from, used when there is no `out_file`
+
+    Returns
+    -------
+    str
+        path to where the file was saved
+    """
+    # determine out_path,
+    # `out_file` param takes priority, then `resouce_file` from class, then a auto_generated name
+    if not out_file:
+        if not resource_file:
+            out_path = Path("./") / output_name(suffix="_resources.json")
+        else:
+            out_path = resource_file
+    elif Path(out_file).is_dir():
+        out_path = Path(out_file) / output_name(suffix="_resources.json")
+    else:
+        out_path = str(out_file) + output_name(suffix="_resources.json")
 
-        with open(out_path, "w") as f:
-            json.dump(out_resources, f, indent=2)
+    with open(out_path, "w") as f:
+        f.write(content)
 
-        return str(out_path)
+    return str(out_path)
 
 
 def main(args):  # noqa: D103
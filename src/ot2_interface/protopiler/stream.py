@@ -0,0 +1,106 @@
+"""Writing compiled protocols to files and other sinks as they are generated"""
+
+import io
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Union
+
+from ot2_interface.protopiler.config import PathLike
+
+CHUNK_SIZE = 64 * 1024
+"""Characters of protocol gathered before each write to the sink"""
+
+Sink = Union[IO[str], IO[bytes]]
+
+
+def write_lines(lines: Iterable[str], sink: Sink, chunk_size: int = CHUNK_SIZE) -> int:
+    """Write lines to a sink the way `"\\n".join(lines)` would, a chunk at a time
+
+    Lines are consumed as they are written, so only one chunk of the protocol is held in
+    memory, however long it is.
+
+    Parameters
+    ----------
+    lines : Iterable[str]
+        python snippets of the protocol, usually a generator
+    sink : Sink
+        anything with a `write` method. Text streams get `str`, anything else (binary files,
+        `io.BytesIO`, sockets) gets UTF-8 encoded `bytes`
+    chunk_size : int, optional
+        characters gathered before each write, by default CHUNK_SIZE
+
+    Returns
+    -------
+    int
+        number of characters written
+    """
+    binary = not isinstance(sink, io.TextIOBase)
+    written = 0
+    chunk = []
+    buffered = 0
+    separator = ""
+    for line in lines:
+        chunk.append(separator)
+        chunk.append(line)
+        separator = "\n"
+        buffered += len(line) + 1
+        if buffered >= chunk_size:
+            written += _write(sink, "".join(chunk), binary)
+            chunk.clear()
+            buffered = 0
+    if chunk:
+        written += _write(sink, "".join(chunk), binary)
+    return written
+
+
+def _write(sink: Sink, text: str, binary: bool) -> int:
+    """Write one chunk to a sink"""
+    sink.write(text.encode("utf-8") if binary else text)
+    return len(text)
+
+
+@contextmanager
+def output_file(path: PathLike) -> Iterator[IO[str]]:
+    """Open a protocol file for writing, removing it if it could not be finished
+
+    Parameters
+    ----------
+    path : PathLike
+        file to write
+
+    Yields
+    ------
+    IO[str]
+        the open file
+    """
+    path = Path(path)
+    try:
+        with path.open("w+") as f:
+            yield f
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+
+def output_name(prefix: str = "", suffix: str = "") -> str:
+    """A file name no other compile will pick, e.g. `protocol_20240101-120000-1a2b3c4d.py`
+
+    The timestamp keeps names sortable and readable, the random part keeps compiles started
+    in the same second, in threads or processes, from writing over each other.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        start of the name, by default ""
+    suffix : str, optional
+        end of the name, usually an extension, by default ""
+
+    Returns
+    -------
+    str
+        the file name
+    """
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return f"{prefix}{stamp}-{uuid.uuid4().hex[:8]}{suffix}"
@@ -0,0 +1,179 @@
+"""Protocol templates, read from disk once per process and shared by every ProtoPiler"""
+
+import hashlib
+import keyword
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ot2_interface.protopiler.config import PathLike
+
+DEFAULT_TEMPLATE_DIR = Path(__file__).parent.resolve() / "protocol_templates"
+"""Templates shipped with the protopiler"""
+
+PLACEHOLDER = re.compile(r"#([A-Za-z_]\w*)#")
+"""A slot of a template, e.g. `#pipette#`"""
+
+
+class Template:
+    """A `#placeholder#` template, split once into its text and slots so every slot is filled in one pass.
+
+    `render(**values)` takes the value of each slot by keyword, slots not given are left as
+    `#name#`. The text is joined once instead of copied once per slot by a chain of
+    `str.replace`.
+    """
+
+    def __init__(self, text: str) -> None:
+        """Split a template into its literal text and slots
+
+        Parameters
+        ----------
+        text : str
+            the template, with `#name#` slots
+        """
+        self.text = text
+        # literal text at even indices, slot names at odd ones; a keyword can not be passed
+        # by keyword, so `#if#` and the like stay literal text
+        self._parts: List[str] = [""]
+        for index, part in enumerate(PLACEHOLDER.split(text)):
+            if index % 2 and not keyword.iskeyword(part):
+                self._parts += [part, ""]
+            else:
+                self._parts[-1] += f"#{part}#" if index % 2 else part
+        self._names = self._parts[1::2]
+        self.slots = tuple(dict.fromkeys(self._names))
+
+    def render(self, **values: str) -> str:
+        """The template with its slots filled
+
+        Parameters
+        ----------
+        **values : str
+            value of each slot, by name
+
+        Returns
+        -------
+        str
+            the rendered text, slots without a value left as `#name#`
+        """
+        parts = self._parts.copy()
+        parts[1::2] = [values.get(name, f"#{name}#") for name in self._names]
+        return "".join(parts)
+
+    def __str__(self) -> str:
+        """The template text"""
+        return self.text
+
+
+class TemplateRegistry:
+    """The `.template` files of a directory, by name (e.g. `aspirate`), kept in memory.
+
+    Every template is read and compiled into a `Template` when the registry is created.
+    With `check_mtime`, a template whose file changed since it was read is read again, for
+    editing templates during development without restarting the node.
+    """
+
+    def __init__(self, template_dir: PathLike, check_mtime: bool = False) -> None:
+        """Read every template of a directory
+
+        Parameters
+        ----------
+        template_dir : PathLike
+            directory of the `.template` files
+        check_mtime : bool, optional
+            re-read templates whose file changed, by default False
+        """
+        self.template_dir = Path(template_dir)
+        self.check_mtime = check_mtime
+        self._lock = threading.Lock()
+        self._templates: Dict[str, Tuple[float, Template]] = {}
+        for path in self.template_dir.glob("*.template"):
+            self._load(path)
+
+    def _load(self, path: Path) -> Template:
+        """Read and compile a template file, remembering when it was last modified"""
+        mtime = path.stat().st_mtime
+        template = Template(path.read_text())
+        with self._lock:
+            self._templates[path.stem] = (mtime, template)
+        return template
+
+    def get(self, name: str) -> Template:
+        """A template by name
+
+        Parameters
+        ----------
+        name : str
+            name of the template, its file name without `.template`
+
+        Returns
+        -------
+        Template
+            the compiled template, ready to `render`
+        """
+        entry = self._templates.get(name)
+        if entry is None:
+            path = self.template_dir / f"{name}.template"
+            if not path.exists():
+                raise ValueError(f"No template {name} in {self.template_dir}")
+            return self._load(path)
+        if self.check_mtime:
+            path = self.template_dir / f"{name}.template"
+            if path.stat().st_mtime != entry[0]:
+                return self._load(path)
+        return entry[1]
+
+    def __getitem__(self, name: str) -> Template:
+        """A template, see `get`"""
+        return self.get(name)
+
+    def digest(self) -> str:
+        """sha256 of every template's name and text, changes whenever a template does
+
+        Returns
+        -------
+        str
+            the version of the templates, e.g. for keying cached compiles
+        """
+        digest = hashlib.sha256()
+        for name in sorted(self._templates):
+            digest.update(name.encode())
+            digest.update(b"\0")
+            digest.update(self.get(name).text.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+
+_registries: Dict[Path, TemplateRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def template_registry(
+    template_dir: Optional[PathLike] = None, check_mtime: bool = False
+) -> TemplateRegistry:
+    """The process-wide registry of a template directory, created on first use
+
+    Parameters
+    ----------
+    template_dir : Optional[PathLike], optional
+        directory of the `.template` files, by default the protopiler's own templates
+    check_mtime : bool, optional
+        re-read templates whose file changed, for development; once requested, it stays on
+        for every user of the registry. By default False
+
+    Returns
+    -------
+    TemplateRegistry
+        the registry shared by every ProtoPiler using this directory
+    """
+    template_dir = Path(template_dir or DEFAULT_TEMPLATE_DIR).resolve()
+    with _registries_lock:
+        registry = _registries.get(template_dir)
+        if registry is None:
+            registry = _registries[template_dir] = TemplateRegistry(
+                template_dir, check_mtime
+            )
+        elif check_mtime:
+            registry.check_mtime = True
+        return registry
@@ -0,0 +1,254 @@
+"""Steps of transfer commands, and the passes that merge them into fewer pipette trips or tips"""
+
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ot2_interface.protopiler.config import Transfer
+
+
+class TransferStep(NamedTuple):
+    """One aspirate and dispense of a transfer, with what is done with the tip around it"""
+
+    mount: str
+    tip: Optional[Tuple[str, int]]
+    """tiprack location and tip index to pick up first, None to keep the tip on the pipette"""
+    volume: float
+    src: Tuple[str, str]
+    """deck location and well to aspirate from"""
+    dst: Tuple[str, str]
+    """deck location and well to dispense to"""
+    aspirate_clearance: float
+    dispense_clearance: float
+    mix_cycles: Optional[int]
+    mix_volume: Optional[float]
+    blow_out: bool
+    drop_tip: bool
+    return_tip: bool
+
+    @property
+    def mixes(self) -> bool:
+        """Whether the destination is mixed after the dispense"""
+        return self.mix_cycles is not None and self.mix_cycles >= 1
+
+
+def distribution_groups(
+    steps: Iterable[TransferStep],
+    capacity: Callable[[str], float],
+    disposal_volume: float = 0,
+) -> Iterator[List[TransferStep]]:
+    """Group consecutive steps from the same source that one aspirate can serve
+
+    Steps join a group while they come from the same well, on the same pipette, with the
+    same aspirate clearance and tip handling, and the group's volume plus the disposal volume
+    still fits in the pipette. A step that mixes its destination would touch the liquid there
+    with the tip, so it is always a group of its own.
+
+    Parameters
+    ----------
+    steps : Iterable[TransferStep]
+        the steps of a transfer block, in order
+    capacity : Callable[[str], float]
+        maximum volume of the pipette on a mount
+    disposal_volume : float, optional
+        extra volume aspirated with each group, by default 0
+
+    Yields
+    ------
+    List[TransferStep]
+        the steps of each group, in order
+    """
+
+    def joins(group: List[TransferStep], step: TransferStep) -> bool:
+        first = group[0]
+        return (
+            not first.mixes
+            and not step.mixes
+            and step.src == first.src
+            and step.mount == first.mount
+            and step.aspirate_clearance == first.aspirate_clearance
+            and _tip_handling(step) == _tip_handling(first)
+            and _volume(group) + step.volume + disposal_volume <= capacity(step.mount)
+        )
+
+    return _consecutive_groups(steps, joins)
+
+
+def consolidation_groups(
+    steps: Iterable[TransferStep],
+    capacity: Callable[[str], float],
+    air_gap: float = 0,
+) -> Iterator[List[TransferStep]]:
+    """Group consecutive steps into the same well that one dispense can serve
+
+    Steps join a group while they go to the same well, on the same pipette, with the same
+    dispense clearance, mix and tip handling, and the group's volume plus an air gap per
+    aspirate still fits in the pipette. The destination is mixed once, after the dispense.
+
+    Parameters
+    ----------
+    steps : Iterable[TransferStep]
+        the steps of a transfer block, in order
+    capacity : Callable[[str], float]
+        maximum volume of the pipette on a mount
+    air_gap : float, optional
+        air drawn in after each aspirate of a group of more than one step, by default 0
+
+    Yields
+    ------
+    List[TransferStep]
+        the steps of each group, in order; a group of one is an ordinary transfer
+    """
+
+    def joins(group: List[TransferStep], step: TransferStep) -> bool:
+        first = group[0]
+        return (
+            step.dst == first.dst
+            and step.mount == first.mount
+            and step.dispense_clearance == first.dispense_clearance
+            and _mix(step) == _mix(first)
+            and _tip_handling(step) == _tip_handling(first)
+            and _volume(group) + step.volume + air_gap * (len(group) + 1)
+            <= capacity(step.mount)
+        )
+
+    return _consecutive_groups(steps, joins)
+
+
+def transfer_groups(
+    block: Transfer,
+    steps: Iterable[TransferStep],
+    capacity: Callable[[str], float],
+) -> Iterator[List[TransferStep]]:
+    """Group the steps of a transfer block into the steps that share a tip
+
+    A distribution or consolidation merges steps with `distribution_groups` or
+    `consolidation_groups`, any other transfer is a group per step.
+
+    Parameters
+    ----------
+    block : Transfer
+        the transfer block the steps come from
+    steps : Iterable[TransferStep]
+        the steps of the block, in order
+    capacity : Callable[[str], float]
+        maximum volume of the pipette on a mount
+
+    Yields
+    ------
+    List[TransferStep]
+        the steps of each group, in order
+    """
+    if block.distribute:
+        return distribution_groups(steps, capacity, block.disposal_volume)
+    if block.consolidate:
+        return consolidation_groups(steps, capacity, block.air_gap)
+    return ([step] for step in steps)
+
+
+def group_liquid(group: List[TransferStep]) -> Optional[str]:
+    """The liquid a group of steps aspirates, named after its source well (e.g. `4:A1`)
+
+    Returns None when the group draws from more than one well, as a consolidation may.
+    """
+    sources = {step.src for step in group}
+    if len(sources) != 1:
+        return None
+    location, well = group[0].src
+    return f"{location}:{well}"
+
+
+class TipPlanner:
+    """Follows the liquid each tip has touched, to tell when a tip can serve the next group
+
+    A tip stays clean while it aspirates a single liquid and dispenses it into wells that held
+    nothing yet, without mixing there. A clean tip can serve the next group drawing the same
+    liquid on the same pipette, or go back to its rack for a later group of that liquid.
+    """
+
+    def __init__(self, used: Callable[[Tuple[str, str]], bool]) -> None:
+        """Plan tips for a block of transfer groups
+
+        Parameters
+        ----------
+        used : Callable[[Tuple[str, str]], bool]
+            whether a (deck location, well) held liquid before the block
+        """
+        self.used = used
+        self.filled: Set[Tuple[str, str]] = set()
+        """wells the block aspirated from or dispensed to so far"""
+        self.held: Optional[Tuple[str, Optional[str]]] = None
+        """mount of the last tip served, and the liquid it is clean for, if any"""
+
+    def keeps(self, group: List[TransferStep]) -> bool:
+        """Whether the tip that served the previous group can serve this one"""
+        liquid = group_liquid(group)
+        return liquid is not None and self.held == (group[0].mount, liquid)
+
+    def serve(self, group: List[TransferStep], clean: bool = True) -> Optional[str]:
+        """Record a group's dispenses, and the liquid its tip is left clean for
+
+        Parameters
+        ----------
+        group : List[TransferStep]
+            the group, in the order of the block
+        clean : bool, optional
+            whether the tip was clean for the group's liquid before it, by default True; a
+            tip left on the pipette by an earlier command may have touched anything
+
+        Returns
+        -------
+        Optional[str]
+            the liquid the tip may be used for again, None if it touched another one
+        """
+        destinations = [step.dst for step in group]
+        clean = (
+            clean
+            and not any(step.mixes for step in group)
+            and len(set(destinations)) == len(destinations)
+            and not any(dst in self.filled or self.used(dst) for dst in destinations)
+        )
+        self.filled.update(destinations)
+        self.filled.update(step.src for step in group)
+        liquid = group_liquid(group) if clean else None
+        self.held = (group[0].mount, liquid)
+        return liquid
+
+
+def _consecutive_groups(
+    steps: Iterable[TransferStep],
+    joins: Callable[[List[TransferStep], TransferStep], bool],
+) -> Iterator[List[TransferStep]]:
+    """Split steps into runs, each step joining the run before it if `joins` says so"""
+    group: List[TransferStep] = []
+    for step in steps:
+        if group and joins(group, step):
+            group.append(step)
+            continue
+        if group:
+            yield group
+        group = [step]
+    if group:
+        yield group
+
+
+def _mix(step: TransferStep) -> Optional[Tuple[int, Optional[float]]]:
+    """The mix after a step's dispense, None if there is none"""
+    return (step.mix_cycles, step.mix_volume) if step.mixes else None
+
+
+def _tip_handling(step: TransferStep) -> Tuple[bool, bool, bool]:
+    """What is done with the tip after a step"""
+    return step.blow_out, step.drop_tip, step.return_tip
+
+
+def _volume(group: List[TransferStep]) -> float:
+    """Liquid moved by a group of steps"""
+    return sum(step.volume for step in group)
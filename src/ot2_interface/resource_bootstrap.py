@@ -0,0 +1,197 @@
+"""Idempotent creation of the resource templates and resources a node needs"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from ot2_interface.config import PathLike
+
+# fields that change every time a resource object is built, and say nothing about its content
+VOLATILE_FIELDS = {"resource_id", "created_at", "updated_at"}
+
+
+def spec_digest(spec: Dict[str, Any]) -> str:
+    """Hash a template or resource spec, so changes to it can be detected
+
+    Parameters
+    ----------
+    spec : Dict[str, Any]
+        keyword arguments for `init_template`, or a resource spec (see `ResourceBootstrap.sync`)
+
+    Returns
+    -------
+    str
+        sha256 of the spec's content
+    """
+    content = dict(spec)
+    if "resource" in content:
+        content["resource"] = content["resource"].model_dump(
+            mode="json", exclude=VOLATILE_FIELDS
+        )
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class ResourceBootstrap:
+    """Brings a resource server in line with a desired-state manifest of templates and resources.
+
+    What was created (and the digest of its spec) is remembered in a local manifest cache, so
+    on restart only specs that are new or changed since the last sync cost any calls. With a
+    cold cache, the server is asked for everything it holds in a few list queries instead of
+    one lookup per item. Delete the cache file to force a full check against the server.
+    """
+
+    def __init__(self, resource_client: Any, cache_file: PathLike) -> None:
+        """Initialize the bootstrap
+
+        Parameters
+        ----------
+        resource_client : ResourceClient
+            client for the resource server
+        cache_file : PathLike
+            where to keep the manifest cache
+        """
+        self.resource_client = resource_client
+        self.cache_file = Path(cache_file)
+        self.server = getattr(resource_client, "resource_server_url", None)
+
+    def _load_cache(self) -> Dict[str, Any]:
+        """Load the manifest cache, empty if missing or for another server"""
+        empty = {"server": str(self.server), "templates": {}, "resources": {}}
+        # local-only resource clients forget everything on restart, so never trust the cache
+        if self.server is None or not self.cache_file.exists():
+            return empty
+        try:
+            cache = json.loads(self.cache_file.read_text())
+        except (OSError, ValueError):
+            return empty
+        if cache.get("server") != empty["server"]:
+            return empty
+        return cache
+
+    def _save_cache(self, cache: Dict[str, Any]) -> None:
+        """Write the manifest cache atomically"""
+        if self.server is None:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(cache, indent=2))
+        tmp_file.replace(self.cache_file)
+
+    def sync(
+        self,
+        templates: List[Dict[str, Any]],
+        resources: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, str]:
+        """Create whatever templates and resources of the manifest are missing
+
+        Parameters
+        ----------
+        templates : List[Dict[str, Any]]
+            keyword arguments for `ResourceClient.init_template`, one per template
+        resources : Optional[List[Dict[str, Any]]], optional
+            resources to create from the templates, each with a `resource_name` and `template_name`,
+            and optionally the `parent` (resource name) and `key` to attach it under, by default None
+
+        Returns
+        -------
+        Dict[str, str]
+            resource id of every resource in the manifest, by resource name
+        """
+        resources = resources or []
+        cache = self._load_cache()
+
+        stale = [
+            template
+            for template in templates
+            if cache["templates"].get(template["template_name"])
+            != spec_digest(template)
+        ]
+        if stale:
+            known = {
+                name
+                for names in self.resource_client.get_templates_by_category().values()
+                for name in names
+            }
+            for template in stale:
+                if template["template_name"] in known:
+                    # may need a version bump, init_template works that out
+                    self.resource_client.init_template(**template)
+                else:
+                    self.resource_client.create_template(**template)
+                cache["templates"][template["template_name"]] = spec_digest(template)
+
+        missing = [
+            resource
+            for resource in resources
+            if cache["resources"].get(resource["resource_name"], {}).get("digest")
+            != spec_digest(resource)
+        ]
+        if missing:
+            existing = self._existing_resources(templates, missing)
+            # resources created in this sync, local-only clients need the objects themselves
+            created = {}
+            for resource in missing:
+                resource_id = existing.get(resource["resource_name"])
+                if resource_id is None:
+                    created[resource["resource_name"]] = (
+                        self.resource_client.create_resource_from_template(
+                            template_name=resource["template_name"],
+                            resource_name=resource["resource_name"],
+                            add_to_database=True,
+                        )
+                    )
+                    resource_id = created[resource["resource_name"]].resource_id
+                    if resource.get("parent") is not None:
+                        self.resource_client.set_child(
+                            created.get(resource["parent"])
+                            or cache["resources"][resource["parent"]]["resource_id"],
+                            resource["key"],
+                            created[resource["resource_name"]],
+                        )
+                cache["resources"][resource["resource_name"]] = {
+                    "resource_id": resource_id,
+                    "digest": spec_digest(resource),
+                }
+
+        if stale or missing:
+            self._save_cache(cache)
+
+        return {
+            resource["resource_name"]: cache["resources"][resource["resource_name"]][
+                "resource_id"
+            ]
+            for resource in resources
+        }
+
+    def _existing_resources(
+        self, templates: List[Dict[str, Any]], resources: List[Dict[str, Any]]
+    ) -> Dict[str, str]:
+        """Find which of the resources the server already holds, with one query per resource class"""
+        if self.server is None:
+            return {}
+        classes = {
+            template["template_name"]: template["resource"].resource_class
+            for template in templates
+        }
+        names = {resource["resource_name"] for resource in resources}
+        existing = {}
+        for resource_class in {classes[r["template_name"]] for r in resources}:
+            try:
+                found = self.resource_client.query_resource(
+                    resource_class=resource_class, multiple=True
+                )
+            except requests.HTTPError as e:
+                # the server answers 404 when it holds nothing of that class yet; any other
+                # failure would make every resource of the class look missing, so it is raised
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                continue
+            for resource in found if isinstance(found, list) else [found]:
+                if resource.resource_name in names:
+                    existing[resource.resource_name] = resource.resource_id
+        return existing
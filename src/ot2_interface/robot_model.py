@@ -0,0 +1,107 @@
+"""In-memory model of an OT2, kept up to date by whoever talks to the robot"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ot2_interface.run_log import RunLog
+from ot2_interface.run_progress import RunProgress
+
+
+class RobotModel:
+    """Everything the node reports about its robot, without asking the robot.
+
+    The run currently executing is tracked through its `RunProgress`, which the driver
+    updates while it polls the run anyway; between runs a background monitor refreshes
+    `robot_status`. Reading the model (`snapshot`) never touches the network.
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty model"""
+        self.robot_status: Optional[str] = None
+        self.status_checked_at: Optional[float] = None
+        self.run_id: Optional[str] = None
+        self.protocol: Optional[str] = None
+        self.progress: Optional[RunProgress] = None
+        self.tips_used_last_run: Optional[int] = None
+        self.tips_used_total = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def run_active(self) -> bool:
+        """Whether a run is executing"""
+        return self.run_id is not None
+
+    def set_robot_status(self, status: Any) -> None:
+        """Record the robot status from the background monitor"""
+        with self._lock:
+            self.robot_status = getattr(status, "value", status)
+            self.status_checked_at = time.time()
+
+    def start_run(self, run_id: str, protocol: str, progress: RunProgress) -> None:
+        """Record that a run is starting
+
+        Parameters
+        ----------
+        run_id : str
+            the run id given by the OT2 api
+        protocol : str
+            name of the protocol file
+        progress : RunProgress
+            updated by the driver while the run executes
+        """
+        with self._lock:
+            self.run_id = run_id
+            self.protocol = protocol
+            self.progress = progress
+
+    def finish_run(self, run: Optional[Dict[str, Any]] = None) -> None:
+        """Record that the run is over
+
+        Parameters
+        ----------
+        run : Optional[Dict[str, Any]], optional
+            the run summary from `OT2_Driver.get_run`, used for its errors, by default None
+        """
+        errors = ((run or {}).get("data") or {}).get("errors") or []
+        with self._lock:
+            self.run_id = None
+            if errors:
+                self.last_error = errors[-1].get("detail", str(errors[-1]))
+
+    def record_run_log(self, run_log: RunLog) -> None:
+        """Count the tips a finished run used"""
+        tips = sum(
+            1
+            for row in run_log.commands
+            if row.command_type == "pickUpTip" and row.status == "succeeded"
+        )
+        with self._lock:
+            self.tips_used_last_run = tips
+            self.tips_used_total += tips
+
+    def set_error(self, error: str) -> None:
+        """Record the latest error"""
+        with self._lock:
+            self.last_error = error
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary of the robot, for the node state"""
+        with self._lock:
+            progress = None if self.progress is None else self.progress.as_dict()
+            robot_status = self.robot_status
+            if self.run_active and progress is not None and progress["status"]:
+                # the run poll is fresher than the monitor, which is idle during runs
+                robot_status = progress["status"]
+            return {
+                "ot2_status_code": robot_status,
+                "run_id": self.run_id,
+                "protocol": self.protocol,
+                "run_progress": progress,
+                "tips_used": {
+                    "last_run": self.tips_used_last_run,
+                    "total": self.tips_used_total,
+                },
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,114 @@
+"""The OT2s served by one node"""
+
+from typing import Any, Dict, List, Optional, Union
+
+import requests
+
+from ot2_interface.ot2_driver_http import OT2_Driver
+from ot2_interface.protopiler.config import Labware, Pipette
+from ot2_interface.protopiler.protopiler import same_deck_layout
+from ot2_interface.robot_model import RobotModel
+
+
+class PooledRobot:
+    """One OT2 of a node's pool: its driver, in-memory model, current run and deck resources"""
+
+    def __init__(self, name: str, driver: OT2_Driver, logger: Any = None) -> None:
+        """Initialize the robot
+
+        Parameters
+        ----------
+        name : str
+            name of the robot within the node
+        driver : OT2_Driver
+            driver connected to the robot
+        logger : Any, optional
+            event client of the node, warned when the robot's pipettes are unknown, by default None
+        """
+        self.name = name
+        self.driver = driver
+        self.logger = logger
+        self.model = RobotModel()
+        self.run_id: Optional[str] = None
+        # deck layout of the last protopiler config run, the labware is likely still there
+        self.equipment: Optional[List[Union[Labware, Pipette]]] = None
+        self.deck: Optional[str] = None
+        self.deck_slots: Dict[str, Any] = {}
+        self.pipette_slots: Dict[str, Any] = {}
+        self.pipettes: Optional[Dict[str, Optional[str]]] = None
+        self.refresh_pipettes()
+
+    def refresh_pipettes(self) -> bool:
+        """Ask the robot which pipettes it has
+
+        Returns
+        -------
+        bool
+            True if the robot reported them, otherwise `pipettes` is None and the robot is left
+            out of matching until a later refresh succeeds
+        """
+        try:
+            pipettes = self.driver.get_attached_pipettes()
+        except (requests.RequestException, ValueError) as e:
+            pipettes, reason = {}, str(e)
+        else:
+            reason = "the robot did not report them"
+        self.pipettes = pipettes or None
+        if self.pipettes is None and self.logger is not None:
+            self.logger.warning(
+                f"Could not get the pipettes of OT2 {self.name}, it will not be matched "
+                f"to protopiler configs until it reports them: {reason}"
+            )
+        return self.pipettes is not None
+
+    def compatible(self, equipment: Optional[List[Union[Labware, Pipette]]]) -> bool:
+        """Whether the robot has the pipettes a protopiler config needs
+
+        Parameters
+        ----------
+        equipment : Optional[List[Union[Labware, Pipette]]]
+            equipment of the config, None for protocols that are not protopiler configs
+
+        Returns
+        -------
+        bool
+            False if the robot has a different pipette on a mount the config uses, or its
+            pipettes are still unknown
+        """
+        if equipment is None:
+            return True
+        if self.pipettes is None and not self.refresh_pipettes():
+            return False
+        return all(
+            self.pipettes.get(item.mount) == item.name
+            for item in equipment
+            if isinstance(item, Pipette)
+        )
+
+    def same_deck(self, equipment: Optional[List[Union[Labware, Pipette]]]) -> bool:
+        """Whether the robot's last run used the same deck layout"""
+        if equipment is None or self.equipment is None:
+            return False
+        return same_deck_layout(self.equipment, equipment)
+
+
+def rank_robots(
+    robots: List[PooledRobot], equipment: Optional[List[Union[Labware, Pipette]]]
+) -> List[str]:
+    """Names of the robots that can run a config, the ones already set up for its deck first
+
+    Parameters
+    ----------
+    robots : List[PooledRobot]
+        the pool
+    equipment : Optional[List[Union[Labware, Pipette]]]
+        equipment of the config, None for protocols that are not protopiler configs
+
+    Returns
+    -------
+    List[str]
+        names of the compatible robots, in order of preference
+    """
+    compatible = [robot for robot in robots if robot.compatible(equipment)]
+    compatible.sort(key=lambda robot: not robot.same_deck(equipment))
+    return [robot.name for robot in compatible]
@@ -0,0 +1,241 @@
+"""Indexed model of an OT2 run log"""
+
+import gzip
+import json
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from ot2_interface.config import PathLike
+
+LIQUID_HANDLING_COMMANDS = {"aspirate", "dispense", "pickUpTip", "dropTip"}
+"""command types that move liquid or tips, and so change resource state"""
+
+
+class CommandRow(NamedTuple):
+    """One command of a run, reduced to what resource tracking and reporting need"""
+
+    index: int
+    command_type: str
+    status: Optional[str]
+    mount: Optional[str]
+    labware_id: Optional[str]
+    slot: Optional[str]
+    well: Optional[str]
+    volume: Optional[float]
+
+
+class RunLog:
+    """A run log (from `OT2_Driver.get_run_log`) with its labware and pipettes indexed.
+
+    The labware-id -> slot and pipette-id -> mount lookups are built once, then every
+    command is reduced to a `CommandRow`, so walking the commands is linear in their number.
+    """
+
+    def __init__(self, run_log: Dict[str, Any]) -> None:
+        """Parse the run log
+
+        Parameters
+        ----------
+        run_log : Dict[str, Any]
+            the run log from `OT2_Driver.get_run_log`
+        """
+        data = run_log.get("data") or {}
+        self.run_id = data.get("id")
+        self.status = data.get("status")
+        run_errors = data.get("errors") or []
+        self.errors: List[Dict[str, Any]] = [
+            {"type": error.get("errorType"), "detail": error.get("detail")}
+            for error in run_errors
+        ]
+
+        module_slots = {
+            module["id"]: module.get("location", {}).get("slotName")
+            for module in data.get("modules") or []
+        }
+        self.labware_slots: Dict[str, Optional[str]] = {}
+        self.labware_names: Dict[str, Optional[str]] = {}
+        for labware in data.get("labware") or []:
+            location = labware.get("location")
+            if isinstance(location, dict):
+                slot = location.get("slotName") or module_slots.get(
+                    location.get("moduleId")
+                )
+            else:
+                # e.g. "offDeck"
+                slot = location
+            self.labware_slots[labware["id"]] = slot
+            self.labware_names[labware["id"]] = labware.get("loadName")
+
+        self.pipette_mounts: Dict[str, Optional[str]] = {
+            pipette["id"]: pipette.get("mount")
+            for pipette in data.get("pipettes") or []
+        }
+
+        commands = (run_log.get("commands") or {}).get("data") or []
+        self._indexes = {
+            command.get("id"): index for index, command in enumerate(commands)
+        }
+        self.commands: List[CommandRow] = [
+            self._row(index, command) for index, command in enumerate(commands)
+        ]
+        # older robot software only timestamps the commands
+        self.started_at = data.get("startedAt") or next(
+            (c["startedAt"] for c in commands if c.get("startedAt")), None
+        )
+        self.completed_at = data.get("completedAt") or next(
+            (c["completedAt"] for c in reversed(commands) if c.get("completedAt")),
+            None,
+        )
+        # the run repeats the error of the command that failed it
+        reported = {error.get("id") for error in run_errors}
+        for command in commands:
+            error = command.get("error")
+            if error and (error.get("id") is None or error["id"] not in reported):
+                self.errors.append(
+                    {"type": error.get("errorType"), "detail": error.get("detail")}
+                )
+
+    def _row(self, index: int, command: Dict[str, Any]) -> CommandRow:
+        """Reduce a command to a row of the table"""
+        params = command.get("params") or {}
+        labware_id = params.get("labwareId")
+        return CommandRow(
+            index=index,
+            command_type=command.get("commandType"),
+            status=command.get("status"),
+            mount=self.pipette_mounts.get(params.get("pipetteId")),
+            labware_id=labware_id,
+            slot=self.labware_slots.get(labware_id),
+            well=params.get("wellName"),
+            volume=params.get("volume"),
+        )
+
+    def rows(self, commands: Iterable[Dict[str, Any]]) -> List[CommandRow]:
+        """Rows for a subset of the raw commands, e.g. one step from `split_run_log`
+
+        Parameters
+        ----------
+        commands : Iterable[Dict[str, Any]]
+            raw commands from this run log
+
+        Returns
+        -------
+        List[CommandRow]
+            their rows in the table
+        """
+        return [self.commands[self._indexes[command.get("id")]] for command in commands]
+
+    def liquid_handling(self) -> List[CommandRow]:
+        """Rows of the commands that change resource state, see `LIQUID_HANDLING_COMMANDS`"""
+        return [
+            row for row in self.commands if row.command_type in LIQUID_HANDLING_COMMANDS
+        ]
+
+    def table(self, rows: Optional[Iterable[CommandRow]] = None) -> Dict[str, Any]:
+        """Compact, json friendly form of the command table
+
+        Parameters
+        ----------
+        rows : Optional[Iterable[CommandRow]], optional
+            rows to include, by default every command of the run
+
+        Returns
+        -------
+        Dict[str, Any]
+            `columns`, and one list of values per row under `rows`
+        """
+        rows = self.commands if rows is None else rows
+        return {
+            "columns": list(CommandRow._fields),
+            "rows": [list(row) for row in rows],
+        }
+
+    def command_counts(
+        self, rows: Optional[Iterable[CommandRow]] = None
+    ) -> Dict[str, Any]:
+        """What a set of commands did: how many ran or failed, tips used and volumes moved
+
+        Parameters
+        ----------
+        rows : Optional[Iterable[CommandRow]], optional
+            rows to count, by default every command of the run
+
+        Returns
+        -------
+        Dict[str, Any]
+            the counts, json friendly
+        """
+        rows = self.commands if rows is None else list(rows)
+        succeeded = [row for row in rows if row.status == "succeeded"]
+        return {
+            "commands": len(rows),
+            "commands_failed": sum(1 for row in rows if row.status == "failed"),
+            "command_types": dict(Counter(row.command_type for row in rows)),
+            "tips_used": sum(1 for row in succeeded if row.command_type == "pickUpTip"),
+            "volume_aspirated": sum(
+                row.volume or 0 for row in succeeded if row.command_type == "aspirate"
+            ),
+            "volume_dispensed": sum(
+                row.volume or 0 for row in succeeded if row.command_type == "dispense"
+            ),
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """Compact summary of the run, small enough for an action result
+
+        The full log is better kept as a file, see `save_run_log`.
+
+        Returns
+        -------
+        Dict[str, Any]
+            status, timings, `command_counts` and errors of the run
+        """
+        return {
+            "run_id": self.run_id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "completed_at": self.completed_at,
+            "duration": _seconds_between(self.started_at, self.completed_at),
+            **self.command_counts(),
+            "errors": self.errors,
+        }
+
+
+def save_run_log(run_log: Dict[str, Any], path: PathLike) -> Path:
+    """Write a full run log as gzipped JSON, see `load_run_log`
+
+    Parameters
+    ----------
+    run_log : Dict[str, Any]
+        the run log from `OT2_Driver.get_run_log`
+    path : PathLike
+        file to write, usually ending in `.json.gz`
+
+    Returns
+    -------
+    Path
+        the written file
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(run_log, f, separators=(",", ":"))
+    return path
+
+
+def load_run_log(path: PathLike) -> Dict[str, Any]:
+    """Read a run log written by `save_run_log`"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _seconds_between(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    """Seconds between two ISO timestamps from the robot, None if either is missing"""
+    try:
+        return (
+            datetime.fromisoformat(end) - datetime.fromisoformat(start)
+        ).total_seconds()
+    except (TypeError, ValueError):
+        return None
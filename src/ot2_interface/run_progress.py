@@ -0,0 +1,114 @@
+"""Progress tracking for OT2 runs"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+from ot2_interface.protopiler.protopiler import step_marker
+
+
+class RunProgress:
+    """Tracks how far along a run is, for reporting while the robot works.
+
+    The total number of commands and the block (step) boundaries come from the robot's
+    analysis of the protocol, loaded with `set_analysis`. Progress observations are fed in
+    by whoever is polling the run, the same way a `RunWatchdog` is fed. The ETA is a
+    straight extrapolation of the average time per completed command so far.
+    """
+
+    def __init__(self, run_id: str, protocol_id: Optional[str] = None) -> None:
+        """Initialize the progress tracker
+
+        Parameters
+        ----------
+        run_id : str
+            the run being tracked
+        protocol_id : Optional[str], optional
+            the protocol the run was created from, used to look up its analysis, by default None
+        """
+        self.run_id = run_id
+        self.protocol_id = protocol_id
+        self.status = None
+        self.total_commands = None
+        self.blocks = []
+        self.completed_commands = 0
+        self.command_type = None
+        self.started_at = None
+        self.updated_at = None
+
+    def set_analysis(self, commands: Optional[List[Dict[str, Any]]]) -> None:
+        """Load the total command count and block boundaries from the protocol analysis
+
+        Parameters
+        ----------
+        commands : Optional[List[Dict[str, Any]]]
+            the analyzed commands of the protocol, ignored if None (analysis not ready yet)
+        """
+        if commands is None:
+            return
+        self.total_commands = len(commands)
+        self.blocks = []
+        for index, command in enumerate(commands):
+            marker = step_marker(command)
+            if marker is not None:
+                self.blocks.append((index, marker[1]))
+
+    def observe(
+        self,
+        status: Any,
+        completed_commands: Optional[int],
+        command_type: Optional[str] = None,
+        now: Optional[float] = None,
+        **_: Any,
+    ) -> None:
+        """Feed one observation of the run
+
+        Parameters
+        ----------
+        status : Any
+            current `RunStatus` (or its string value)
+        completed_commands : Optional[int]
+            number of commands the robot has completed so far, ignored if None
+        command_type : Optional[str], optional
+            `commandType` of the command currently executing, by default None
+        now : Optional[float], optional
+            monotonic time of the observation, by default `time.monotonic()`
+        """
+        now = time.monotonic() if now is None else now
+        if self.started_at is None:
+            self.started_at = now
+        self.updated_at = now
+        self.status = getattr(status, "value", status)
+        if completed_commands is not None:
+            self.completed_commands = completed_commands
+        self.command_type = command_type
+
+    @property
+    def current_block(self) -> Optional[str]:
+        """Name of the block the run is currently in, if the protocol has any"""
+        name = None
+        for index, block_name in self.blocks:
+            if index > self.completed_commands:
+                break
+            name = block_name
+        return name
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds until the run is done, or None if it cannot be estimated yet"""
+        if not self.total_commands or not self.completed_commands:
+            return None
+        elapsed = self.updated_at - self.started_at
+        remaining = max(self.total_commands - self.completed_commands, 0)
+        return elapsed / self.completed_commands * remaining
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Summary of the run progress, for the node state"""
+        return {
+            "run_id": self.run_id,
+            "status": self.status,
+            "completed_commands": self.completed_commands,
+            "total_commands": self.total_commands,
+            "current_block": self.current_block,
+            "current_command": self.command_type,
+            "eta_seconds": None if self.eta is None else round(self.eta, 1),
+        }
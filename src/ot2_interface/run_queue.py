@@ -0,0 +1,183 @@
+"""Bounded priority queue of jobs waiting for a robot"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a queue that is already at capacity"""
+
+
+class QueueTicket:
+    """A job's place in a `RunQueue`"""
+
+    def __init__(self, name: str, priority: int, sequence: int) -> None:
+        """Initialize the ticket
+
+        Parameters
+        ----------
+        name : str
+            what the job is, for the node state
+        priority : int
+            jobs with a higher priority run first
+        sequence : int
+            submission order, jobs with the same priority run first come first served
+        """
+        self.name = name
+        self.priority = priority
+        self.sequence = sequence
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.prepared = False
+        self.candidates: Optional[List[str]] = None
+        self.robot: Optional[str] = None
+
+    @property
+    def sort_key(self) -> tuple:
+        """Order of the ticket in the queue"""
+        return (-self.priority, self.sequence)
+
+    def waited(self, now: Optional[float] = None) -> float:
+        """Seconds the job waited (or has been waiting) for the robot"""
+        end = self.started_at
+        if end is None:
+            end = time.monotonic() if now is None else now
+        return end - self.submitted_at
+
+
+class RunQueue:
+    """A bounded FIFO of jobs with priorities, handing each robot of a pool to one job at a time.
+
+    Jobs `submit` as soon as they arrive, so their place in line is fixed while they prepare
+    (compile, upload) their protocol, then block in `turn` until a robot they can use is free
+    and no job ahead of them could use it. Jobs still preparing could use any robot, so
+    nobody overtakes them; with a single robot this is a plain priority FIFO.
+    """
+
+    def __init__(self, max_size: int = 8, robots: Optional[List[str]] = None) -> None:
+        """Initialize the queue
+
+        Parameters
+        ----------
+        max_size : int, optional
+            number of jobs allowed to wait at once, not counting the ones running, by default 8
+        robots : Optional[List[str]], optional
+            names of the robots jobs are handed, by default a single robot named "ot2"
+        """
+        self.max_size = max_size
+        self.robots = list(robots or ["ot2"])
+        self.waiting: List[QueueTicket] = []
+        self.active: Dict[str, QueueTicket] = {}
+        self.last_wait: Optional[float] = None
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def submit(self, name: str, priority: int = 0) -> QueueTicket:
+        """Take a place in line
+
+        Parameters
+        ----------
+        name : str
+            what the job is, for the node state
+        priority : int, optional
+            jobs with a higher priority run first, by default 0
+
+        Returns
+        -------
+        QueueTicket
+            the job's place in line, to pass to `turn` or `withdraw`
+
+        Raises
+        ------
+        QueueFullError
+            if `max_size` jobs are already waiting
+        """
+        with self._condition:
+            if len(self.waiting) >= self.max_size:
+                raise QueueFullError(
+                    f"Run queue is full ({self.max_size} jobs waiting), try again later"
+                )
+            ticket = QueueTicket(name, priority, next(self._sequence))
+            self.waiting.append(ticket)
+            self.waiting.sort(key=lambda waiting: waiting.sort_key)
+            return ticket
+
+    def withdraw(self, ticket: QueueTicket) -> None:
+        """Give up a place in line, or the robot if the job holds one"""
+        with self._condition:
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+            if ticket.robot is not None and self.active.get(ticket.robot) is ticket:
+                del self.active[ticket.robot]
+            self._condition.notify_all()
+
+    def _free_robot(self, ticket: QueueTicket) -> Optional[str]:
+        """The robot the ticket may take now, if any"""
+        claimed = set(self.active)
+        for ahead in self.waiting:
+            if ahead is ticket:
+                break
+            claimed.update(ahead.candidates or self.robots)
+        for robot in ticket.candidates or self.robots:
+            if robot not in claimed:
+                return robot
+        return None
+
+    @contextmanager
+    def turn(
+        self, ticket: QueueTicket, candidates: Optional[List[str]] = None
+    ) -> Iterator[str]:
+        """Wait for a robot, and hold it for the duration of the `with` block
+
+        Parameters
+        ----------
+        ticket : QueueTicket
+            the job's place in line, from `submit`
+        candidates : Optional[List[str]], optional
+            robots the job can run on, in order of preference, by default any robot
+
+        Yields
+        ------
+        str
+            name of the robot the job holds
+        """
+        with self._condition:
+            ticket.candidates = candidates
+            ticket.prepared = True
+            # a job that narrowed its candidates may have let someone else through
+            self._condition.notify_all()
+            self._condition.wait_for(lambda: self._free_robot(ticket) is not None)
+            ticket.robot = self._free_robot(ticket)
+            self.waiting.remove(ticket)
+            self.active[ticket.robot] = ticket
+            ticket.started_at = time.monotonic()
+            self.last_wait = ticket.waited()
+        try:
+            yield ticket.robot
+        finally:
+            self.withdraw(ticket)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary of the queue, for the node state"""
+        with self._condition:
+            now = time.monotonic()
+            return {
+                "depth": len(self.waiting),
+                "max_size": self.max_size,
+                "active": {robot: ticket.name for robot, ticket in self.active.items()},
+                "last_wait_seconds": None
+                if self.last_wait is None
+                else round(self.last_wait, 1),
+                "waiting": [
+                    {
+                        "name": ticket.name,
+                        "priority": ticket.priority,
+                        "prepared": ticket.prepared,
+                        "wait_seconds": round(ticket.waited(now), 1),
+                    }
+                    for ticket in self.waiting
+                ],
+            }
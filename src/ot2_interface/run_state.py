@@ -0,0 +1,79 @@
+"""Local record of the runs in flight, so a restarted node can reattach to them"""
+
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from ot2_interface.config import PathLike
+
+
+def protocol_hash(protocol_path: Union[PathLike, bytes]) -> str:
+    """sha256 of a protocol file's content, or of a protocol given as bytes"""
+    if not isinstance(protocol_path, bytes):
+        protocol_path = Path(protocol_path).read_bytes()
+    return hashlib.sha256(protocol_path).hexdigest()
+
+
+class RunStateFile:
+    """The active run of each robot, kept in a small JSON file that survives node restarts.
+
+    Every record is written before the run is started and removed once the run finishes,
+    so whatever is left in the file at startup was interrupted by a restart.
+    """
+
+    def __init__(self, path: PathLike) -> None:
+        """Initialize the state file
+
+        Parameters
+        ----------
+        path : PathLike
+            where to keep the file
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """The recorded runs by robot name, empty if the file is missing or unreadable"""
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, robot: str) -> Optional[Dict[str, Any]]:
+        """The recorded run of a robot, if any"""
+        return self.load().get(robot)
+
+    def save(self, robot: str, record: Dict[str, Any]) -> None:
+        """Record a robot's active run
+
+        Parameters
+        ----------
+        robot : str
+            name of the robot
+        record : Dict[str, Any]
+            what to remember about the run, at least its `run_id`
+        """
+        with self._lock:
+            runs = self.load()
+            runs[robot] = record
+            self._write(runs)
+
+    def clear(self, robot: str, run_id: Optional[str] = None) -> None:
+        """Forget a robot's run, only if it is still `run_id` when given"""
+        with self._lock:
+            runs = self.load()
+            if robot not in runs or (
+                run_id is not None and runs[robot].get("run_id") != run_id
+            ):
+                return
+            del runs[robot]
+            self._write(runs)
+
+    def _write(self, runs: Dict[str, Dict[str, Any]]) -> None:
+        """Replace the file atomically, a crash mid-write leaves the previous version"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.path.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(runs, indent=2))
+        tmp_file.replace(self.path)
@@ -0,0 +1,203 @@
+"""Watchdog that flags OT2 runs which stop making progress"""
+
+import time
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+# Rough upper bounds (seconds) on how long a single command of each type should take
+# before we start to suspect the robot is stuck. Anything not listed uses `default_duration`.
+EXPECTED_COMMAND_DURATIONS: Dict[str, float] = {
+    "home": 120.0,
+    "loadLabware": 10.0,
+    "loadPipette": 10.0,
+    "loadModule": 10.0,
+    "pickUpTip": 30.0,
+    "dropTip": 30.0,
+    "aspirate": 30.0,
+    "dispense": 30.0,
+    "blowout": 15.0,
+    "touchTip": 15.0,
+    "moveToWell": 20.0,
+    "moveLabware": 120.0,
+    "comment": 1.0,
+    "temperatureModule/waitForTemperature": 1800.0,
+    "heaterShaker/waitForTemperature": 1800.0,
+    "thermocycler/waitForBlockTemperature": 1800.0,
+    "thermocycler/waitForLidTemperature": 1800.0,
+    "thermocycler/runProfile": 14400.0,
+}
+
+
+class StallPolicy(Enum):
+    """what to do when a run is flagged as stalled"""
+
+    ALERT = "alert"
+    PAUSE = "pause"
+    CANCEL = "cancel"
+
+
+class RunWatchdog:
+    """Tracks the progress of a single run and flags it once it has been quiet for too long.
+
+    The watchdog is fed observations (run status, completed-command count and the command
+    currently executing) by whoever is polling the robot. A run is considered stalled when
+    the completed-command count has not changed for longer than the quiet period plus the
+    expected duration of the command currently executing.
+    """
+
+    def __init__(
+        self,
+        *,
+        quiet_period: float = 600.0,
+        policy: StallPolicy = StallPolicy.ALERT,
+        paused_quiet_period: Optional[float] = None,
+        expected_durations: Optional[Dict[str, float]] = None,
+        default_duration: float = 60.0,
+        on_stall: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> None:
+        """Initialize the watchdog
+
+        Parameters
+        ----------
+        quiet_period : float, optional
+            seconds of no progress, on top of the expected command duration, before a run is stalled, by default 600.0
+        policy : StallPolicy, optional
+            what the driver should do with a stalled run, by default StallPolicy.ALERT
+        paused_quiet_period : Optional[float], optional
+            seconds a run may sit paused with no progress before it is stalled, by default None,
+            meaning a paused run is never flagged: an operator may have paused it on purpose
+        expected_durations : Optional[Dict[str, float]], optional
+            per command type expected durations, merged over `EXPECTED_COMMAND_DURATIONS`, by default None
+        default_duration : float, optional
+            expected duration of command types we know nothing about, by default 60.0
+        on_stall : Optional[Callable[[Dict[str, Any]], None]], optional
+            called with a summary of the stall when one is detected, by default None
+        """
+        self.quiet_period = quiet_period
+        self.policy = StallPolicy(policy)
+        self.paused_quiet_period = paused_quiet_period
+        self.expected_durations = dict(EXPECTED_COMMAND_DURATIONS)
+        if expected_durations:
+            self.expected_durations.update(expected_durations)
+        self.default_duration = default_duration
+        self.on_stall = on_stall
+
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything about the run being watched"""
+        self.completed_commands = None
+        self.command_type = None
+        self.last_command_at = None
+        self.last_progress = None
+        self.stalled = False
+
+    def expected_duration(
+        self, command_type: Optional[str], params: Optional[Dict[str, Any]] = None
+    ) -> float:
+        """Expected duration (seconds) of a command of the given type
+
+        Parameters
+        ----------
+        command_type : Optional[str]
+            opentrons `commandType` of the command currently running
+        params : Optional[Dict[str, Any]], optional
+            the command params, used for commands that carry their own duration (delays), by default None
+
+        Returns
+        -------
+        float
+            expected duration in seconds
+        """
+        if command_type in ("waitForDuration", "delay") and params:
+            return float(params.get("seconds", 0.0)) + float(
+                params.get("minutes", 0.0) * 60
+            )
+        if command_type is None:
+            return self.default_duration
+        return self.expected_durations.get(command_type, self.default_duration)
+
+    def threshold(
+        self,
+        status: Any,
+        command_type: Optional[str],
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Optional[float]:
+        """Seconds without progress after which the run counts as stalled, None if never"""
+        if _status_value(status) == "paused":
+            return self.paused_quiet_period
+        return self.quiet_period + self.expected_duration(command_type, params)
+
+    def observe(
+        self,
+        status: Any,
+        completed_commands: Optional[int],
+        command_type: Optional[str] = None,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        command_started_at: Optional[str] = None,
+        now: Optional[float] = None,
+    ) -> Optional[StallPolicy]:
+        """Feed one observation of the run to the watchdog
+
+        Parameters
+        ----------
+        status : Any
+            current `RunStatus` (or its string value)
+        completed_commands : Optional[int]
+            number of commands the robot has completed so far
+        command_type : Optional[str], optional
+            `commandType` of the command currently executing, by default None
+        params : Optional[Dict[str, Any]], optional
+            params of the command currently executing, by default None
+        command_started_at : Optional[str], optional
+            robot timestamp of when the current command started, by default None
+        now : Optional[float], optional
+            monotonic time of the observation, by default `time.monotonic()`
+
+        Returns
+        -------
+        Optional[StallPolicy]
+            the policy to apply if the run just became stalled, otherwise None.
+            A stall is only reported once, until the run makes progress again.
+        """
+        now = time.monotonic() if now is None else now
+
+        if (
+            self.last_progress is None
+            or completed_commands != self.completed_commands
+            or command_type != self.command_type
+        ):
+            self.completed_commands = completed_commands
+            self.command_type = command_type
+            self.last_command_at = command_started_at
+            self.last_progress = now
+            self.stalled = False
+            return None
+
+        if self.stalled or _status_value(status) not in ("running", "paused"):
+            return None
+
+        quiet_for = now - self.last_progress
+        threshold = self.threshold(status, command_type, params)
+        if threshold is None or quiet_for < threshold:
+            return None
+
+        self.stalled = True
+        if self.on_stall is not None:
+            self.on_stall(
+                {
+                    "status": _status_value(status),
+                    "policy": self.policy.value,
+                    "completed_commands": completed_commands,
+                    "command_type": command_type,
+                    "last_command_at": self.last_command_at,
+                    "quiet_for": quiet_for,
+                    "threshold": threshold,
+                }
+            )
+        return self.policy
+
+
+def _status_value(status: Any) -> str:
+    return status.value if isinstance(status, Enum) else status
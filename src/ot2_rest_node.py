@@ -1,17 +1,54 @@
 #! /usr/bin/env python3
 """OT2 Node Module implementation"""
 
+import threading
+import time
 import traceback
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Dict, Literal, Optional, Union
 
+from fastapi.responses import PlainTextResponse
+from madsci.common.context import get_event_client_context
+from madsci.common.types.action_types import (
+    ActionFailed,
+    ActionFiles,
+    ActionRequest,
+    ActionRunning,
+    ActionSucceeded,
+)
 from madsci.common.types.node_types import RestNodeConfig
 from madsci.common.types.resource_types import Container, Pool, Slot, Stack
 from madsci.node_module.helpers import action
 from madsci.node_module.rest_node_module import RestNode
+from pydantic import Field
 from typing_extensions import Annotated
 
-from ot2_interface.ot2_driver_http import OT2_Config, OT2_Driver
+from ot2_interface.compile_cache import CompileCache
+from ot2_interface.metrics import Metrics
+from ot2_interface.ot2_driver_http import (
+    OT2_Config,
+    OT2_Driver,
+    RobotStatus,
+    RunStatus,
+    split_run_log,
+)
+from ot2_interface.protocol_parameters import render_protocol
+from ot2_interface.protopiler.config import ProtocolConfig
+from ot2_interface.protopiler.protopiler import same_deck_layout
+from ot2_interface.resource_bootstrap import ResourceBootstrap
+from ot2_interface.robot_pool import PooledRobot, rank_robots
+from ot2_interface.run_log import CommandRow, RunLog, save_run_log
+from ot2_interface.run_progress import RunProgress
+from ot2_interface.run_queue import QueueTicket, RunQueue
+from ot2_interface.run_state import RunStateFile, protocol_hash
+from ot2_interface.run_watchdog import RunWatchdog, StallPolicy
+
+# run states a robot will not move on from
+TERMINAL_RUN_STATUSES = {
+    RunStatus.SUCCEEDED.value,
+    RunStatus.FAILED.value,
+    RunStatus.STOPPED.value,
+}
 
 
 class OT2NodeConfig(RestNodeConfig):
@@ -19,12 +56,37 @@ class OT2NodeConfig(RestNodeConfig):
 
     ot2_ip: Optional[str] = None
     "ip of opentrons device"
+    stall_quiet_period: float = 600.0
+    "seconds a run may go without progress (on top of the current command's expected duration) before it is flagged as stalled"
+    stall_paused_quiet_period: Optional[float] = None
+    "seconds a run may sit paused without progress before it is flagged as stalled, by default a paused run is never flagged"
+    stall_policy: Literal["alert", "pause", "cancel"] = "alert"
+    "what to do with a stalled run: alert (log only), pause, or cancel"
+    compile_cache_size: int = 128
+    "number of compiled protopiler configs to keep on disk for reuse, 0 disables the cache"
+    compile_cache_max_bytes: Optional[int] = 256 * 1024 * 1024
+    "total size of the compiled protopiler configs kept on disk, least recently used go first"
+    compile_cache_dir: Optional[str] = None
+    "directory of the compile cache, e.g. the protopiler command line's ~/.cache/ot2_module/compile_cache to share it, defaults to the node's temp directory"
+    run_queue_size: int = 8
+    "number of run requests allowed to wait for the robot at once"
+    robot_poll_interval: float = 5.0
+    "seconds between background robot status checks while no run is active"
+    create_resources: bool = False
+    "create the OT2 resource templates, deck, deck slots and pipette mounts on the resource server at startup"
+    ot2_pool: dict[str, str] = Field(default_factory=dict)
+    "OT2s driven by this node, as name: ip (or ip:port); when empty the node drives the single OT2 at ot2_ip"
+    preflight: bool = True
+    "statically check protopiler configs (volumes, aliases, wells, deck conflicts, tips) before queueing them"
+    compact_protocols: bool = False
+    "compile transfers into tables run by a loop instead of one command per step, for much smaller protocols that upload and analyze faster"
 
 
 class OT2Node(RestNode):
     """Node module for Opentrons Robots"""
 
     ot2_interface: OT2_Driver = None
+    metrics: Metrics = None
     config: OT2NodeConfig = OT2NodeConfig()
     config_model = OT2NodeConfig
 
@@ -36,56 +98,101 @@ class OT2Node(RestNode):
         self.protocols_folder_path = str(
             temp_dir / self.node_info.node_name / "protocols/"
         )
-        # Create templates
-        # self._create_ot2_templates()
-
-        # # Create deck instance
-        # self.deck = self.resource_client.create_resource_from_template(
-        #     template_name="ot2_deck",
-        #     resource_name=f"ot2_{self.node_info.node_name}_deck",
-        #     add_to_database=True,
-        # )
-
-        # # Create 12 deck slots (1-11 standard, 12 is trash)
-        # for i in range(1, 13):
-        #     slot_name = f"ot2_{self.node_info.node_name}_deck_slot_{i}"
-        #     template_name = "ot2_trash_slot" if i == 12 else "ot2_deck_slot"
-
-        #     slot = self.resource_client.create_resource_from_template(
-        #         template_name=template_name,
-        #         resource_name=slot_name,
-        #         add_to_database=True,
-        #     )
-
-        #     try:
-        #         self.resource_client.set_child(self.deck, str(i), slot)
-        #     except Exception:
-        #         self.logger.log(f"Deck slot {i} already exists")
-
-        # # Create pipette mount slots
-        # self.pipette_slots = {}
-        # for mount in ["left", "right"]:
-        #     mount_slot = self.resource_client.create_resource_from_template(
-        #         template_name="ot2_pipette_mount",
-        #         resource_name=f"ot2_{self.node_info.node_name}_{mount}_mount",
-        #         add_to_database=True,
-        #     )
-        #     self.pipette_slots[mount] = mount_slot
-
-        if self.config.ot2_ip is None:
+        Path(self.protocols_folder_path).mkdir(parents=True, exist_ok=True)
+        self.run_logs_folder_path = temp_dir / self.node_info.node_name / "run_logs"
+        self.compile_cache = (
+            CompileCache(
+                self.config.compile_cache_dir
+                or temp_dir / self.node_info.node_name / "compile_cache",
+                max_entries=self.config.compile_cache_size,
+                max_bytes=self.config.compile_cache_max_bytes,
+            )
+            if self.config.compile_cache_size > 0
+            else None
+        )
+        self._monitor_stop = threading.Event()
+        self.metrics = Metrics()
+        self._started_at = time.monotonic()
+
+        pool = self.config.ot2_pool or {self.node_info.node_name: self.config.ot2_ip}
+        if None in pool.values():
             raise ValueError("OT2 IP address is not configured.")
-        try:
-            self.ot2_interface = OT2_Driver(OT2_Config(ip=self.config.ot2_ip))
-        except Exception as e:
-            self.logger.error(f"Failed to connect to OT2: {e}")
-            raise e
+        self.robots = {}
+        for name, address in pool.items():
+            ip, _, port = address.partition(":")
+            try:
+                driver = OT2_Driver(
+                    OT2_Config(ip=ip, **({"port": int(port)} if port else {})),
+                    metrics=self.metrics.bind(robot=name),
+                    compact_protocols=self.config.compact_protocols,
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to connect to OT2 {name}: {e}")
+                raise e
+            self.robots[name] = PooledRobot(name, driver, logger=self.logger)
+        # compiling does not need a particular robot
+        self.ot2_interface = next(iter(self.robots.values())).driver
+        self.run_queue = RunQueue(self.config.run_queue_size, robots=list(self.robots))
+
+        if self.config.create_resources:
+            for robot in self.robots.values():
+                self._create_ot2_resources(temp_dir / self.node_info.node_name, robot)
 
-        self.run_id = None
+        self.run_state = RunStateFile(
+            temp_dir / self.node_info.node_name / "active_runs.json"
+        )
+        for robot in self.robots.values():
+            self._reattach_run(robot)
+            threading.Thread(
+                target=self._monitor_robot,
+                args=(robot, self._monitor_stop),
+                daemon=True,
+            ).start()
         self.startup_has_run = True
         self.logger.info("OT2 node initialized!")
 
-    def _create_ot2_templates(self) -> None:
-        """Create all OT2-specific resource templates."""
+    def _create_ot2_resources(self, node_dir: Path, robot: PooledRobot) -> None:
+        """Create the OT2 templates, deck, deck slots and pipette mounts that the resource server is missing."""
+        name = self.node_info.node_name
+        manifest = node_dir / "resource_manifest.json"
+        if len(self.robots) > 1:
+            name = f"{name}_{robot.name}"
+            manifest = node_dir / f"resource_manifest_{robot.name}.json"
+        deck = f"ot2_{name}_deck"
+        resources = [{"resource_name": deck, "template_name": "ot2_deck"}]
+        # 12 deck slots (1-11 standard, 12 is trash)
+        for i in range(1, 13):
+            resources.append(
+                {
+                    "resource_name": f"ot2_{name}_deck_slot_{i}",
+                    "template_name": "ot2_trash_slot" if i == 12 else "ot2_deck_slot",
+                    "parent": deck,
+                    "key": str(i),
+                }
+            )
+        for mount in ["left", "right"]:
+            resources.append(
+                {
+                    "resource_name": f"ot2_{name}_{mount}_mount",
+                    "template_name": "ot2_pipette_mount",
+                }
+            )
+
+        resource_ids = ResourceBootstrap(self.resource_client, manifest).sync(
+            self._ot2_templates(), resources
+        )
+        robot.deck = resource_ids[deck]
+        robot.deck_slots = {
+            str(i): resource_ids[f"ot2_{name}_deck_slot_{i}"] for i in range(1, 13)
+        }
+        robot.pipette_slots = {
+            mount: resource_ids[f"ot2_{name}_{mount}_mount"]
+            for mount in ["left", "right"]
+        }
+
+    def _ot2_templates(self) -> list[dict[str, Any]]:
+        """All OT2-specific resource templates, as `init_template` arguments."""
+        templates = []
 
         # 0. Deck container template
         deck_container = Container(
@@ -100,14 +207,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=deck_container,
-            template_name="ot2_deck",
-            description="Template for OT2 deck container. Holds 11 deck slots plus trash bin.",
-            required_overrides=["resource_name"],
-            tags=["ot2", "deck", "container"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": deck_container,
+                "template_name": "ot2_deck",
+                "description": "Template for OT2 deck container. Holds 11 deck slots plus trash bin.",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "deck", "container"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 1. Deck slot template (standard slots 1-11)
@@ -122,14 +231,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=deck_slot,
-            template_name="ot2_deck_slot",
-            description="Template for OT2 deck slot. Standard SBS-compatible position.",
-            required_overrides=["resource_name"],
-            tags=["ot2", "deck", "slot"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": deck_slot,
+                "template_name": "ot2_deck_slot",
+                "description": "Template for OT2 deck slot. Standard SBS-compatible position.",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "deck", "slot"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 2. Trash bin template (slot 12) - Stack type for collecting tips/waste
@@ -143,14 +254,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=trash_bin,
-            template_name="ot2_trash_slot",
-            description="Template for OT2 trash bin slot.",
-            required_overrides=["resource_name"],
-            tags=["ot2", "trash", "stack"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": trash_bin,
+                "template_name": "ot2_trash_slot",
+                "description": "Template for OT2 trash bin slot.",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "trash", "stack"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 3. Pipette mount template
@@ -164,14 +277,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=pipette_mount,
-            template_name="ot2_pipette_mount",
-            description="Template for OT2 pipette mount slot.",
-            required_overrides=["resource_name"],
-            tags=["ot2", "pipette", "mount", "slot"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": pipette_mount,
+                "template_name": "ot2_pipette_mount",
+                "description": "Template for OT2 pipette mount slot.",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "pipette", "mount", "slot"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 4. P20 Single-Channel Pipette
@@ -191,14 +306,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=p20_single,
-            template_name="ot2_p20_single_pipette",
-            description="Template for OT2 P20 Single-Channel pipette (1-20 µL).",
-            required_overrides=["resource_name"],
-            tags=["ot2", "pipette", "p20", "single-channel", "pool"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": p20_single,
+                "template_name": "ot2_p20_single_pipette",
+                "description": "Template for OT2 P20 Single-Channel pipette (1-20 µL).",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "pipette", "p20", "single-channel", "pool"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 5. P300 Single-Channel Pipette
@@ -224,14 +341,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=p300_single,
-            template_name="ot2_p300_single_pipette",
-            description="Template for OT2 P300 Single-Channel pipette (20-300 µL).",
-            required_overrides=["resource_name"],
-            tags=["ot2", "pipette", "p300", "single-channel", "pool"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": p300_single,
+                "template_name": "ot2_p300_single_pipette",
+                "description": "Template for OT2 P300 Single-Channel pipette (20-300 µL).",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "pipette", "p300", "single-channel", "pool"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 6. P1000 Single-Channel Pipette
@@ -260,14 +379,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=p1000_single,
-            template_name="ot2_p1000_single_pipette",
-            description="Template for OT2 P1000 Single-Channel pipette (100-1000 µL).",
-            required_overrides=["resource_name"],
-            tags=["ot2", "pipette", "p1000", "single-channel", "pool"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": p1000_single,
+                "template_name": "ot2_p1000_single_pipette",
+                "description": "Template for OT2 P1000 Single-Channel pipette (100-1000 µL).",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "pipette", "p1000", "single-channel", "pool"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 7. P20 8-Channel Pipette
@@ -291,14 +412,16 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=p20_multi,
-            template_name="ot2_p20_multi_pipette",
-            description="Template for OT2 P20 8-Channel pipette (1-20 µL).",
-            required_overrides=["resource_name"],
-            tags=["ot2", "pipette", "p20", "8-channel", "multi-channel", "pool"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": p20_multi,
+                "template_name": "ot2_p20_multi_pipette",
+                "description": "Template for OT2 P20 8-Channel pipette (1-20 µL).",
+                "required_overrides": ["resource_name"],
+                "tags": ["ot2", "pipette", "p20", "8-channel", "multi-channel", "pool"],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
         # 8. P300 8-Channel Pipette
@@ -328,40 +451,276 @@ class OT2Node(RestNode):
             },
         )
 
-        self.resource_client.init_template(
-            resource=p300_multi,
-            template_name="ot2_p300_multi_pipette",
-            description="Template for OT2 P300 8-Channel pipette (20-300 µL).",
-            required_overrides=["resource_name"],
-            tags=["ot2", "pipette", "p300", "8-channel", "multi-channel", "pool"],
-            created_by=self.node_info.node_id,
-            version="1.0.0",
+        templates.append(
+            {
+                "resource": p300_multi,
+                "template_name": "ot2_p300_multi_pipette",
+                "description": "Template for OT2 P300 8-Channel pipette (20-300 µL).",
+                "required_overrides": ["resource_name"],
+                "tags": [
+                    "ot2",
+                    "pipette",
+                    "p300",
+                    "8-channel",
+                    "multi-channel",
+                    "pool",
+                ],
+                "created_by": self.node_info.node_id,
+                "version": "1.0.0",
+            }
         )
 
+        return templates
+
     def shutdown_handler(self) -> None:
         """Called to shutdown the node. Should be used to close connections to devices or release any other resources."""
         self.logger.log("Shutting down")
         self.shutdown_has_run = True
-        del self.ot2_interface
+        self._monitor_stop.set()
+        for robot in getattr(self, "robots", {}).values():
+            robot.driver.close()
+        self.robots = {}
         self.ot2_interface = None
         self.logger.log("Shutdown complete.")
 
     def state_handler(self) -> None:
         """Periodically called to update the current state of the node."""
         if self.ot2_interface is not None:
-            self.node_state = {
-                "ot2_status_code": self.ot2_interface.get_robot_status(),
+            # only reads the in-memory models, robots are polled by `_monitor_robot` and runs
+            if len(self.robots) == 1:
+                robots = next(iter(self.robots.values())).model.snapshot()
+            else:
+                robots = {
+                    "robots": {
+                        name: robot.model.snapshot()
+                        for name, robot in self.robots.items()
+                    }
+                }
+            self.node_state = {**robots, "run_queue": self.run_queue.snapshot()}
+
+    def _configure_routes(self) -> None:
+        """Add the metrics endpoint to the standard node routes"""
+        super()._configure_routes()
+        self.rest_api.add_api_route(
+            "/metrics",
+            self.get_metrics,
+            methods=["GET"],
+            response_class=PlainTextResponse,
+        )
+
+    def get_metrics(self) -> PlainTextResponse:
+        """Node metrics in the Prometheus text format: phase durations, queue, robots, tips, errors"""
+        if self.metrics is None:
+            return PlainTextResponse("")
+        uptime = time.monotonic() - self._started_at
+        self.metrics.set("ot2_uptime_seconds", uptime)
+        queue = self.run_queue.snapshot()
+        self.metrics.set("ot2_queue_depth", queue["depth"])
+        self.metrics.set("ot2_queue_active", len(queue["active"]))
+        busy = self.metrics.snapshot()["counters"].get(
+            "ot2_robot_busy_seconds_total", []
+        )
+        busy = {entry["labels"]["robot"]: entry["value"] for entry in busy}
+        for name, robot in self.robots.items():
+            self.metrics.set(
+                "ot2_robot_utilization",
+                min(1.0, busy.get(name, 0.0) / uptime) if uptime else 0.0,
+                robot=name,
+            )
+            self.metrics.set(
+                "ot2_robot_running", int(robot.run_id is not None), robot=name
+            )
+        return PlainTextResponse(
+            self.metrics.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    def _action_thread(
+        self,
+        action_request: ActionRequest,
+        action_callable: Callable[..., Any],
+        arg_dict: Dict[str, Any],
+    ) -> None:
+        """Run an action, recording its duration and outcome in the node metrics"""
+
+        def timed_action(*args: Any, **kwargs: Any) -> Any:
+            status = "failed"
+            start = time.perf_counter()
+            try:
+                result = action_callable(*args, **kwargs)
+                status = "succeeded"
+                return result
+            finally:
+                self.metrics.observe(
+                    "ot2_action_seconds",
+                    time.perf_counter() - start,
+                    action=action_request.action_name,
+                    status=status,
+                )
+                if status == "failed":
+                    self.metrics.inc(
+                        "ot2_errors_total",
+                        kind="action",
+                        action=action_request.action_name,
+                    )
+
+        # the parent runs the action in a thread of its own
+        super()._action_thread(action_request, timed_action, arg_dict)
+
+    def _monitor_robot(self, robot: PooledRobot, stop: threading.Event) -> None:
+        """Keep a robot model's status fresh while no run is active, until `stop` is set"""
+        while not stop.is_set():
+            if not robot.model.run_active:
+                try:
+                    robot.model.set_robot_status(robot.driver.get_robot_status())
+                except Exception as e:
+                    robot.model.set_robot_status(RobotStatus.OFFLINE)
+                    robot.model.set_error(f"Could not check OT2 status: {e}")
+            stop.wait(self.config.robot_poll_interval)
+
+    def _reattach_run(self, robot: PooledRobot) -> None:
+        """Resume watching a robot's run left in flight by a previous node process, if there is one"""
+        record = self.run_state.get(robot.name)
+        try:
+            runs = robot.driver.get_runs()
+        except Exception as e:
+            self.logger.warning(f"Could not list the runs of OT2 {robot.name}: {e}")
+            runs = None
+        if runs is None:
+            # keep the record, the next startup can try again
+            self.logger.warning(
+                f"Could not check OT2 {robot.name} for runs to reattach"
+            )
+            return
+
+        if record is None:
+            # started from outside the node, or the state file was lost: keep other jobs off the robot
+            current = [
+                run
+                for run in runs
+                if run["current"] and run["status"] not in TERMINAL_RUN_STATUSES
+            ]
+            if not current:
+                return
+            record = {
+                "run_id": current[0]["runID"],
+                "protocol_id": current[0]["protocolID"],
             }
+        elif record["run_id"] not in {run["runID"] for run in runs}:
+            self.logger.warning(
+                f"Run {record['run_id']} of OT2 {robot.name} is no longer on the robot"
+            )
+            self._report_reattached_action(
+                record, errors=f"OT2 run {record['run_id']} was lost in a node restart"
+            )
+            self.run_state.clear(robot.name, record["run_id"])
+            return
+
+        self.logger.log(f"Reattaching to run {record['run_id']} on OT2 {robot.name}")
+        # taken now so no new job gets the robot before the watcher thread does
+        ticket = self.run_queue.submit(f"reattached run {record['run_id']}")
+        if record.get("action_id"):
+            self._record_reattached_action(
+                ActionRunning(action_id=record["action_id"]), running=True
+            )
+        threading.Thread(
+            target=self._watch_reattached_run,
+            args=(robot, record, ticket),
+            daemon=True,
+        ).start()
+
+    def _watch_reattached_run(
+        self, robot: PooledRobot, record: dict[str, Any], ticket: QueueTicket
+    ) -> None:
+        """Follow a reattached run to the end, and report it to the action that started it"""
+        run_id = record["run_id"]
+        try:
+            with self.run_queue.turn(ticket, [robot.name]):
+                if robot.driver.check_run_status(run_id) == RunStatus.IDLE:
+                    # the previous process stopped between creating and starting the run
+                    robot.driver.cancel(run_id)
+                resp = self._monitor_run(
+                    robot,
+                    run_id,
+                    record.get("protocol_id"),
+                    record.get("protocol_name", run_id),
+                    start=False,
+                )
+            _, indexed_log, log_path = self._record_run(robot, run_id)
+        except Exception as e:
+            robot.model.set_error(f"{type(e).__name__}: {e}")
+            self._report_reattached_action(record, errors=str(e))
+            return
+        finally:
+            self.run_queue.withdraw(ticket)
+
+        status = resp["data"]["status"]
+        if status != "succeeded":
+            self._report_reattached_action(
+                record, errors=f"Reattached run {run_id} {status}, log at {log_path}"
+            )
+        elif record.get("later_runs"):
+            self._report_reattached_action(
+                record,
+                errors=f"Reattached run {run_id} succeeded, but the "
+                f"{record['later_runs']} runs after it were not started",
+            )
+        else:
+            self._report_reattached_action(
+                record, json_result=indexed_log.summary(), files=log_path
+            )
+
+    def _report_reattached_action(
+        self,
+        record: dict[str, Any],
+        json_result: Any = None,
+        errors: Optional[str] = None,
+        files: Optional[Path] = None,
+    ) -> None:
+        """Publish the outcome of a reattached run under the id of the action that started it"""
+        action_id = record.get("action_id")
+        if not action_id:
+            return
+        if errors is None:
+            result = ActionSucceeded(
+                action_id=action_id, json_result=json_result, files=files
+            )
+        else:
+            result = ActionFailed(action_id=action_id, errors=errors)
+        self._record_reattached_action(result, running=False)
 
-    @action(name="run_protocol", description="run a given opentrons protocol")
+    def _record_reattached_action(
+        self, result: Union[ActionRunning, ActionSucceeded, ActionFailed], running: bool
+    ) -> None:
+        """Publish the state of an action started by a previous node process
+
+        RestNode has no public way to update an action this process did not start, so this
+        reaches into its private `_extend_action_history` and `node_status.running_actions`,
+        as of madsci-node-module 0.7.0 (see pdm.lock); check both when upgrading madsci.
+        """
+        if running:
+            self.node_status.running_actions.add(result.action_id)
+        else:
+            self.node_status.running_actions.discard(result.action_id)
+        self._extend_action_history(result)
+
+    @action(
+        name="run_protocol",
+        description="run a given opentrons protocol",
+        blocking=False,
+    )
     def run_protocol(
         self,
-        protocol: Annotated[Path, "Protocol File"],
+        protocol: Annotated[Path, "Protocol file, or protopiler config (.yaml)"],
         parameters: Annotated[
-            dict[str, Any], "Parameters for insertion into the protocol"
+            dict[str, Any],
+            "Parameters for insertion into the protocol, or the payload of a protopiler config",
         ] = {},
+        priority: Annotated[int, "Queued runs with a higher priority go first"] = 0,
         # TODO: whether or not to use existing resources?
-    ) -> Annotated[dict[str, Any], "ot2 action log"]:
+    ) -> tuple[
+        Annotated[dict[str, Any], "summary of the run"],
+        Annotated[Path, "full ot2 run log, gzipped JSON"],
+    ]:
         """
         Run a given protocol on the ot2
         """
@@ -370,54 +729,284 @@ class OT2Node(RestNode):
         # get the next protocol file
 
         if protocol:
-            with protocol.open(mode="r") as f:
-                file_text = f.read()
-                for key in parameters.keys():
-                    file_text = file_text.replace("$" + key, str(parameters[key]))
-            with protocol.open(mode="w") as f:
-                f.write(file_text)
-            response_flag, response_msg, run_id = self.execute(protocol, parameters)
-            if self.resource_client is not None:
-                self.parse_logs(self.ot2_interface.get_run_log(run_id))
+            if protocol.suffix in (".yaml", ".yml"):
+                self._preflight([protocol], [parameters or None])
+            # take a place in line, then get the protocol ready while earlier runs finish
+            ticket = self.run_queue.submit(protocol.name, priority)
+            source = protocol
+            try:
+                with self.metrics.time("ot2_phase_seconds", phase="compile"):
+                    protocol, equipment, upload_name = self._prepare_protocol(
+                        protocol, parameters
+                    )
+                candidates = self._candidate_robots([equipment])
+                # a protocol can only be uploaded ahead of time to the robot it will run on
+                protocol_id = None
+                if len(candidates) == 1:
+                    protocol_id = self._upload_protocol(
+                        protocol, self.robots[candidates[0]], upload_name
+                    )
+
+                with self.run_queue.turn(ticket, candidates) as name:
+                    self.metrics.observe(
+                        "ot2_phase_seconds", ticket.waited(), phase="queue"
+                    )
+                    robot = self.robots[name]
+                    if protocol_id is None:
+                        protocol_id = self._upload_protocol(
+                            protocol, robot, upload_name
+                        )
+                    response_flag, response_msg, run_id = self.execute(
+                        protocol,
+                        protocol_id=protocol_id,
+                        protocol_name=ticket.name,
+                        robot=robot,
+                    )
+                    if equipment is not None:
+                        robot.equipment = equipment
+            finally:
+                self.run_queue.withdraw(ticket)
+                if isinstance(protocol, Path) and protocol != source:
+                    # a rendered copy, the robot has its own and the template is what is kept
+                    protocol.unlink(missing_ok=True)
+            if run_id is None:
+                raise Exception(response_msg)
+            _, indexed_log, log_path = self._record_run(robot, run_id)
 
             if response_flag == "succeeded":
-                # TODO logging
-                pass
-                # Path(logs_folder_path).mkdir(parents=True, exist_ok=True)
-                # with open(Path(logs_folder_path) / f"{run_id}.json", "w") as f:
-                #     json.dump(state.ot2.get_run_log(run_id), f, indent=2)
-                #     return StepFileResponse(
-                #         status=StepStatus.SUCCEEDED, files={"log": f.name}
-                #     )
-                # if resource_config_path:
-                #   response.resources = str(resource_config_path)
-                return self.ot2_interface.get_run_log(run_id)
-            elif response_flag == "stopped":
-                pass
-                # Path(logs_folder_path).mkdir(parents=True, exist_ok=True)
-                # with open(Path(logs_folder_path) / f"{run_id}.json", "w") as f:
-                #     json.dump(state.ot2.get_run_log(run_id), f, indent=2)
-                #     return StepFileResponse(status=StepStatus.FAILED, files={"log": f.name})
-                raise Exception("Run was stopped")
-            elif response_flag == "failed":
-                pass
-                # response = StepResponse()
-                # response.status = StepStatus.FAILED
-                # response.error = "an error occurred"
-                # if resource_config_path:
-                #   response.resources = str(resource_config_path)
-                raise Exception("Run failed: " + response_msg)
+                return indexed_log.summary(), log_path
+            if response_flag == "stopped":
+                raise Exception(f"Run was stopped, log at {log_path}")
+            raise Exception(f"Run failed: {response_msg}, log at {log_path}")
         else:
             raise Exception("No protocol file found")
 
-    def execute(self, protocol_path, payload=None, resource_config=None):
+    @action(
+        name="run_protocols",
+        description="run several protopiler configs, merging consecutive configs with the same deck layout into one robot run",
+        blocking=False,
+    )
+    def run_protocols(
+        self,
+        protocols: Annotated[list[Path], "Protopiler config files, in run order"],
+        parameters: Annotated[
+            list[dict[str, Any]], "Payload for each config, in the same order"
+        ] = [],
+        priority: Annotated[int, "Queued runs with a higher priority go first"] = 0,
+    ) -> tuple[
+        Annotated[dict[str, Any], "ot2 results for each config"],
+        Annotated[ActionFiles, "full ot2 log of each robot run, gzipped JSON"],
+    ]:
+        """
+        Run protopiler configs back to back, sharing the upload, analysis and homing overhead
+        of every run of consecutive configs that use the same deck layout
+        """
+        payloads = parameters or [None] * len(protocols)
+        if len(payloads) != len(protocols):
+            raise ValueError("Need exactly one set of parameters per protocol")
+
+        results = [
+            {"protocol": protocol.name, "status": "not_run", "run_id": None}
+            for protocol in protocols
+        ]
+        log_files = {}
+        groups = self._group_by_deck_layout(protocols)
+        for group in groups:
+            self._preflight([protocols[i] for i in group], [payloads[i] for i in group])
+        ticket = self.run_queue.submit(
+            ", ".join(protocol.name for protocol in protocols), priority
+        )
+        try:
+            equipment = [
+                ProtocolConfig.from_yaml(protocols[g[0]]).equipment for g in groups
+            ]
+            candidates = self._candidate_robots(equipment)
+            prepared = []
+            for group, group_equipment in zip(groups, equipment, strict=True):
+                with self.metrics.time("ot2_phase_seconds", phase="compile"):
+                    protocol, _ = self.ot2_interface.compile_protocols_bytes(
+                        [protocols[i] for i in group],
+                        payloads=[payloads[i] for i in group],
+                    )
+                upload_name = f"{protocols[group[0]].stem}.py"
+                protocol_id = None
+                if len(candidates) == 1:
+                    protocol_id = self._upload_protocol(
+                        protocol, self.robots[candidates[0]], upload_name
+                    )
+                prepared.append(
+                    (group, group_equipment, protocol, upload_name, protocol_id)
+                )
+
+            with self.run_queue.turn(ticket, candidates) as name:
+                self.metrics.observe(
+                    "ot2_phase_seconds", ticket.waited(), phase="queue"
+                )
+                robot = self.robots[name]
+                for index, job in enumerate(prepared):
+                    group, group_equipment, protocol, upload_name, protocol_id = job
+                    if protocol_id is None:
+                        protocol_id = self._upload_protocol(
+                            protocol, robot, upload_name
+                        )
+                    response_flag, response_msg, run_id = self.execute(
+                        protocol,
+                        protocol_id=protocol_id,
+                        protocol_name=", ".join(protocols[i].name for i in group),
+                        robot=robot,
+                        later_runs=len(prepared) - index - 1,
+                    )
+                    if run_id is None:
+                        raise Exception(response_msg)
+                    robot.equipment = group_equipment
+
+                    run_log, indexed_log, log_path = self._record_run(robot, run_id)
+                    log_files[f"run_log_{index}"] = log_path
+
+                    for step in split_run_log(run_log):
+                        results[group[step["step"]]].update(
+                            status=step["status"],
+                            run_id=run_id,
+                            commands=indexed_log.command_counts(
+                                indexed_log.rows(step["commands"])
+                            ),
+                        )
+
+                    if response_flag != "succeeded":
+                        summary = ", ".join(
+                            f"{r['protocol']}: {r['status']}" for r in results
+                        )
+                        raise Exception(
+                            f"Run {response_flag} ({summary}): {response_msg}, "
+                            f"log at {log_path}"
+                        )
+        finally:
+            self.run_queue.withdraw(ticket)
+
+        return {"protocols": results}, ActionFiles(**log_files)
+
+    def _record_run(
+        self, robot: PooledRobot, run_id: str
+    ) -> tuple[dict[str, Any], RunLog, Path]:
+        """Fetch the log of a finished run once, track resources with it and archive it
+
+        Returns
+        -------
+        tuple[dict[str, Any], RunLog, Path]
+            the raw log, its indexed form, and the gzipped copy for the action files
+        """
+        with self.metrics.time(
+            "ot2_phase_seconds", phase="log_processing", robot=robot.name
+        ):
+            run_log = robot.driver.get_run_log(run_id)
+            indexed_log = RunLog(run_log)
+            robot.model.record_run_log(indexed_log)
+            if self.resource_client is not None:
+                self.parse_logs(indexed_log, robot)
+            log_path = save_run_log(
+                run_log, self.run_logs_folder_path / f"{run_id}.json.gz"
+            )
+        self.metrics.inc(
+            "ot2_tips_used_total", robot.model.tips_used_last_run, robot=robot.name
+        )
+        return run_log, indexed_log, log_path
+
+    def _preflight(
+        self, protocols: list[Path], payloads: list[Optional[dict[str, Any]]]
+    ) -> None:
+        """Reject configs that would fail on the robot, before they take a place in line"""
+        if not self.config.preflight:
+            return
+        report = self.ot2_interface.preflight(protocols, payloads)
+        self.logger.log(
+            f"Preflight of {', '.join(p.name for p in protocols)}: {report.as_dict()}"
+        )
+        report.raise_for_problems()
+
+    def _group_by_deck_layout(self, protocols: list[Path]) -> list[list[int]]:
+        """Split protocol configs into runs of consecutive configs with the same deck layout"""
+        groups = []
+        equipment = None
+        for i, protocol in enumerate(protocols):
+            config_equipment = ProtocolConfig.from_yaml(protocol).equipment
+            if equipment is None or not same_deck_layout(equipment, config_equipment):
+                groups.append([])
+                equipment = config_equipment
+            groups[-1].append(i)
+        return groups
+
+    def _candidate_robots(self, equipment: list[Optional[list]]) -> list[str]:
+        """Robots of the pool that can run every one of a job's decks, the ones already set up for its first deck first"""
+        candidates = rank_robots(list(self.robots.values()), equipment[0])
+        for deck in equipment[1:]:
+            compatible = set(rank_robots(list(self.robots.values()), deck))
+            candidates = [name for name in candidates if name in compatible]
+        if not candidates:
+            raise Exception("No OT2 in the pool has the pipettes this protocol needs")
+        return candidates
+
+    def _prepare_protocol(
+        self, protocol: Path, parameters: dict[str, Any]
+    ) -> tuple[Union[Path, bytes], Optional[list], Optional[str]]:
+        """Compile a protopiler config, or render the parameters into a copy of a protocol file
+
+        Returns the protocol to upload, the equipment of a config's deck (None for a protocol
+        file), and the name to upload a compiled protocol under.
+        """
+        if protocol.suffix in (".yaml", ".yml"):
+            equipment = ProtocolConfig.from_yaml(protocol).equipment
+            # compiled in memory and uploaded from there, nothing is written
+            compiled, _ = self.ot2_interface.compile_protocol_bytes(
+                protocol, payload=parameters or None, cache=self.compile_cache
+            )
+            return compiled, equipment, f"{protocol.stem}.py"
+        if parameters:
+            # render a per-run copy so the original stays reusable as a template
+            rendered = render_protocol(protocol, parameters, self.protocols_folder_path)
+            return rendered, None, None
+        return protocol, None, None
+
+    def _upload_protocol(
+        self,
+        protocol_path: Union[Path, bytes],
+        robot: PooledRobot,
+        name: Optional[str] = None,
+    ) -> str:
+        """Upload a protocol and wait for the robot to accept it, so it is ready to run when its turn comes"""
+        if name is None and not isinstance(protocol_path, bytes):
+            name = Path(protocol_path).name
+        with self.metrics.time("ot2_phase_seconds", phase="upload", robot=robot.name):
+            protocol_id = robot.driver.upload_protocol(protocol_path, name)
+        with self.metrics.time("ot2_phase_seconds", phase="analysis", robot=robot.name):
+            errors = robot.driver.validate_protocol(protocol_id)
+        if errors:
+            details = "; ".join(error.get("detail", str(error)) for error in errors)
+            raise Exception(f"Protocol {name or 'protocol.py'} is invalid: {details}")
+        return protocol_id
+
+    def execute(
+        self,
+        protocol_path,
+        protocol_id=None,
+        protocol_name=None,
+        robot=None,
+        later_runs=0,
+    ):
         """
         Transfers and Executes the .py protocol file
 
         Parameters:
         -----------
         protocol_path: str
-            absolute path to the yaml protocol
+            absolute path to the yaml protocol, or the compiled protocol itself as bytes
+        protocol_id: str
+            id of the protocol if it has already been uploaded, only a run is created for it
+        protocol_name: str
+            what to call the protocol in the node state, defaults to the file name
+        robot: PooledRobot
+            robot of the pool to run on, defaults to the first one
+        later_runs: int
+            runs the calling action still has to start after this one, remembered in case the node restarts
 
         Returns
         -----------
@@ -425,17 +1014,36 @@ class OT2Node(RestNode):
             If the ot2 execution was successful
         """
 
-        protocol_file_path = Path(protocol_path)
-        self.logger.log(f"{protocol_file_path.resolve()=}")
+        if isinstance(protocol_path, bytes):
+            protocol_name = protocol_name or "protocol.py"
+        else:
+            protocol_file_path = Path(protocol_path)
+            protocol_name = protocol_name or protocol_file_path.name
+            self.logger.log(f"{protocol_file_path.resolve()=}")
+        robot = robot or next(iter(self.robots.values()))
         try:
-            protocol_id, run_id = self.ot2_interface.transfer(protocol_file_path)
-            self.logger.log(
-                "OT2 " + self.node_info.node_name + " protocol transfer successful"
-            )
+            if protocol_id is None:
+                protocol_id, run_id = robot.driver.transfer(protocol_path)
+                self.logger.log(
+                    "OT2 " + self.node_info.node_name + " protocol transfer successful"
+                )
+            else:
+                run_id = robot.driver.create_run(protocol_id)
 
-            self.run_id = run_id
-            resp = self.ot2_interface.execute(run_id)
-            self.run_id = None
+            # so a restarted node can find the run and the action waiting on it
+            context = get_event_client_context()
+            self.run_state.save(
+                robot.name,
+                {
+                    "run_id": run_id,
+                    "protocol_id": protocol_id,
+                    "protocol_hash": protocol_hash(protocol_path),
+                    "protocol_name": protocol_name,
+                    "action_id": context.metadata.get("action_id") if context else None,
+                    "later_runs": later_runs,
+                },
+            )
+            resp = self._monitor_run(robot, run_id, protocol_id, protocol_name)
             print(resp)
             if resp["data"]["status"] == "succeeded":
                 # poll_OT2_until_run_completion()
@@ -488,12 +1096,66 @@ class OT2Node(RestNode):
 
             response_msg = f"Error: {traceback.format_exc()}"
             print(response_msg)
+            robot.model.set_error(f"{type(err).__name__}: {err}")
             return False, response_msg, None
 
+    def _monitor_run(
+        self,
+        robot: PooledRobot,
+        run_id: str,
+        protocol_id: Optional[str],
+        protocol_name: str,
+        start: bool = True,
+    ) -> dict[str, Any]:
+        """Start a run (or follow one already started) until it finishes, publishing its progress through the node state"""
+        robot.run_id = run_id
+        # the calling thread blocks here
+        progress = RunProgress(run_id, protocol_id)
+        robot.model.start_run(run_id, protocol_name, progress)
+        resp = None
+        started = time.perf_counter()
+        try:
+            watchdog = self._create_watchdog(robot)
+            if start:
+                resp = robot.driver.execute(
+                    run_id, watchdog=watchdog, progress=progress
+                )
+            else:
+                resp = robot.driver.wait(run_id, watchdog=watchdog, progress=progress)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe(
+                "ot2_phase_seconds", elapsed, phase="execution", robot=robot.name
+            )
+            self.metrics.inc("ot2_robot_busy_seconds_total", elapsed, robot=robot.name)
+            self.metrics.inc(
+                "ot2_runs_total",
+                robot=robot.name,
+                status=resp["data"]["status"] if resp else "error",
+            )
+            robot.model.finish_run(resp)
+            robot.run_id = None
+            self.run_state.clear(robot.name, run_id)
+        return resp
+
+    def _create_watchdog(self, robot: PooledRobot) -> RunWatchdog:
+        """Create a stall watchdog for a run on a robot from the node config"""
+
+        def on_stall(stall: dict[str, Any]) -> None:
+            self.logger.warning(f"OT2 {robot.name} run {robot.run_id} stalled: {stall}")
+
+        return RunWatchdog(
+            quiet_period=self.config.stall_quiet_period,
+            paused_quiet_period=self.config.stall_paused_quiet_period,
+            policy=StallPolicy(self.config.stall_policy),
+            on_stall=on_stall,
+        )
+
     def pause(self) -> None:
         """Pause the node."""
         self.logger.log("Pausing node...")
-        self.ot2_interface.pause(self.run_id)
+        for robot in self._running_robots():
+            robot.driver.pause(robot.run_id)
         self.node_status.paused = True
         self.logger.log("Node paused.")
         return True
@@ -501,11 +1163,16 @@ class OT2Node(RestNode):
     def resume(self) -> None:
         """Resume the node."""
         self.logger.log("Resuming node...")
-        self.ot2_interface.resume(self.run_id)
+        for robot in self._running_robots():
+            robot.driver.resume(robot.run_id)
         self.node_status.paused = False
         self.logger.log("Node resumed.")
         return True
 
+    def _running_robots(self) -> list[PooledRobot]:
+        """Robots of the pool with a run in progress"""
+        return [robot for robot in self.robots.values() if robot.run_id is not None]
+
     # TODO: shutdown, safety stop, reset
     def shutdown(self) -> None:
         """Shutdown the node."""
@@ -529,41 +1196,24 @@ class OT2Node(RestNode):
     def cancel(self) -> None:
         """Cancel the node."""
         self.logger.log("Canceling node...")
-        self.ot2_interface.cancel(self.run_id)
+        for robot in self._running_robots():
+            robot.driver.cancel(robot.run_id)
         self.logger.log("Node cancelled.")
         return True
 
-    def find_resource(self, logs: Any, command: Any):
-        """Extract resource information from logs"""
-        labwares = logs["data"]["labware"]
-        labware_id = command["params"]["labwareId"]
-        labware = next(labware for labware in labwares if labware["id"] == labware_id)
-        resource = self.deck_slots[labware["location"]["slotName"]]
-        return resource
+    def find_resource(self, row: CommandRow, robot: PooledRobot) -> Any:
+        """The deck resource in the slot a command used, None if the slot is not tracked"""
+        return robot.deck_slots.get(row.slot)
 
-    def parse_logs(self, logs: Any):
-        """Extract useful information from the ot2's logs"""
-        try:
-            for command in logs["commands"]["data"]:
-                if command["commandType"] == "aspirate":
-                    resource = self.find_resource(logs, command)
-                    print(resource)
-                    # self.resource_client.decrease_resource(command["params"]["volume"])
-                elif command["commandType"] == "dispense":
-                    resource = self.find_resource(logs, command)
-                    print(resource)
-                    # self.resource_client.decrease_resource(command["params"]["volume"])
-                elif command["commandType"] == "pickUpTip":
-                    resource = self.find_resource(logs, command)
-
-                    print(resource)
-                elif command["commandType"] == "dropTip":
-                    resource = self.find_resource(logs, command)
-
-                    print(resource)
-                    # self.resource_client.decrease_resource(command["params"]["volume"])
-        except Exception:
-            print("Couldn't update resources, no longer tracked")
+    def parse_logs(
+        self, logs: Any, robot: Optional[PooledRobot] = None
+    ) -> list[tuple[CommandRow, Any]]:
+        """The deck resources the liquid handling commands of a run used, in order"""
+        run_log = logs if isinstance(logs, RunLog) else RunLog(logs)
+        robot = robot or next(iter(self.robots.values()))
+        return [
+            (row, self.find_resource(row, robot)) for row in run_log.liquid_handling()
+        ]
 
 
 if __name__ == "__main__":
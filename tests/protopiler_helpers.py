@@ -0,0 +1,36 @@
+"""helpers shared by the protopiler tests"""
+
+import tempfile
+from pathlib import Path
+
+import ot2_interface
+
+CONFIG_DIR = (
+    Path(ot2_interface.__file__).parent.resolve() / "protopiler" / "test_configs"
+)
+"""the configs shipped with the protopiler"""
+
+
+class ScratchConfigs:
+    """Mixin for test cases that compile edited copies of the shipped configs"""
+
+    def setUp(self):
+        """scratch directory for edited configs"""
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """remove the scratch directory"""
+        self.tmp.cleanup()
+
+    def scratch(self, text: str, name: str = "edited.yaml") -> Path:
+        """write a config to the scratch directory"""
+        config = Path(self.tmp.name) / name
+        config.write_text(text)
+        return config
+
+    def edited(self, *replacements, config: str = "single_test.yaml") -> Path:
+        """a shipped config with each (old, new) piece of text replaced, in order"""
+        text = (CONFIG_DIR / config).read_text()
+        for old, new in replacements:
+            text = text.replace(old, new)
+        return self.scratch(text)
@@ -0,0 +1,71 @@
+"""tests for compiling many configs across worker processes"""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from protopiler_helpers import CONFIG_DIR
+
+from ot2_interface.protopiler.batch_compile import (
+    compile_all,
+    find_configs,
+    output_paths,
+)
+from ot2_interface.protopiler.protopiler import ProtoPiler
+
+
+class TestBatchCompile(unittest.TestCase):
+    """tests for batch compiles"""
+
+    def setUp(self):
+        """a small library of configs, one of them broken, one in a subdirectory"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.library = Path(self.tmp.name) / "library"
+        (self.library / "nested").mkdir(parents=True)
+        shutil.copy(CONFIG_DIR / "single_test.yaml", self.library)
+        shutil.copy(CONFIG_DIR / "pd_cfpe.yaml", self.library / "nested")
+        shutil.copy(CONFIG_DIR / "single_test.yaml", self.library / "nested")
+        (self.library / "broken.yaml").write_text("not: a config")
+        self.out_dir = Path(self.tmp.name) / "out"
+
+    def tearDown(self):
+        """remove the library"""
+        self.tmp.cleanup()
+
+    def test_find_configs(self):
+        """directories are searched recursively, globs are expanded, duplicates dropped"""
+        configs = find_configs(
+            [str(self.library), str(self.library / "nested" / "*.yaml")]
+        )
+        assert [config.name for config in configs] == [
+            "broken.yaml",
+            "pd_cfpe.yaml",
+            "single_test.yaml",
+            "single_test.yaml",
+        ]
+
+    def test_output_paths(self):
+        """protocols mirror the config directories, so equal names do not collide"""
+        configs = find_configs([str(self.library)])
+        outputs = output_paths(configs, self.out_dir)
+        assert len(set(outputs)) == len(configs)
+        assert self.out_dir / "nested" / "single_test.py" in outputs
+
+    def test_compile_all(self):
+        """every config compiles in the pool like it does alone, failures are reported"""
+        configs = find_configs([str(self.library)])
+        results = list(compile_all(configs, self.out_dir, workers=2))
+
+        failed = [result for result in results if not result.ok]
+        assert [result.config.name for result in failed] == ["broken.yaml"]
+        assert failed[0].protocol is None
+        for result in results:
+            assert result.seconds > 0
+            if result.ok:
+                protocol, _ = ProtoPiler().yaml_to_bytes(result.config)
+                assert result.protocol.read_bytes() == protocol
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""tests for compiling several configs into one protocol and splitting its run log"""
+
+import re
+import tempfile
+import unittest
+
+from protopiler_helpers import CONFIG_DIR
+
+from ot2_interface.ot2_driver_http import split_run_log
+from ot2_interface.protopiler.protopiler import STEP_MARKER, ProtoPiler
+
+
+class TestBatchProtocol(unittest.TestCase):
+    """tests for batched protocols"""
+
+    def test_batch_threads_resources(self):
+        """the second config continues where the first left off in the tip rack"""
+        cfg = CONFIG_DIR / "single_test.yaml"
+        with tempfile.TemporaryDirectory() as out_dir:
+            protocol_out, _ = ProtoPiler().yaml_to_batch_protocol(
+                [cfg, cfg],
+                protocol_out_path=out_dir,
+                resource_file_out=out_dir + "/",
+            )
+            protocol = protocol_out.read_text()
+
+        assert protocol.count("protocol.load_instrument") == 1
+        assert protocol.count(STEP_MARKER) == 2
+        tips = [int(tip) for tip in re.findall(r"wells\(\)\[(\d+)\]", protocol)]
+        assert tips == list(range(16))
+
+    def test_batch_rejects_different_decks(self):
+        """configs with different deck layouts cannot share a run"""
+        with tempfile.TemporaryDirectory() as out_dir, self.assertRaises(ValueError):
+            ProtoPiler().yaml_to_batch_protocol(
+                [CONFIG_DIR / "single_test.yaml", CONFIG_DIR / "pd_cfpe.yaml"],
+                protocol_out_path=out_dir,
+                write_resources=False,
+            )
+
+    def test_split_run_log(self):
+        """commands are assigned to the step whose marker precedes them"""
+
+        def comment(step):
+            return {
+                "commandType": "comment",
+                "status": "succeeded",
+                "params": {"message": f"{STEP_MARKER} {step}: step {step}"},
+            }
+
+        def command(status="succeeded"):
+            return {"commandType": "aspirate", "status": status, "params": {}}
+
+        run_log = {
+            "data": {"status": "failed"},
+            "commands": {
+                "data": [
+                    {"commandType": "home", "status": "succeeded", "params": {}},
+                    comment(0),
+                    command(),
+                    command(),
+                    comment(1),
+                    command(),
+                    command("failed"),
+                ]
+            },
+        }
+        steps = split_run_log(run_log)
+        assert [step["step"] for step in steps] == [0, 1]
+        assert [len(step["commands"]) for step in steps] == [2, 2]
+        assert [step["status"] for step in steps] == ["succeeded", "failed"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""tests for compact, loop based protocols"""
+
+import sys
+import tempfile
+import types
+import unittest
+
+from protopiler_helpers import CONFIG_DIR
+
+from ot2_interface.compile_cache import CompileCache
+from ot2_interface.protopiler.protopiler import ProtoPiler
+
+
+class Recorder:
+    """Stands in for the protocol context, recording every call and assignment made through it"""
+
+    def __init__(self, calls, name):
+        """Record into `calls`, under `name`"""
+        object.__setattr__(self, "_calls", calls)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr):
+        """An attribute, recording under its own name"""
+        return Recorder(self._calls, f"{self._name}.{attr}")
+
+    def __setattr__(self, attr, value):
+        """Record an assignment, e.g. of a well bottom clearance"""
+        self._calls.append((f"{self._name}.{attr}", repr(value)))
+
+    def __getitem__(self, key):
+        """An item, recording under its own name"""
+        return Recorder(self._calls, f"{self._name}[{key!r}]")
+
+    def __call__(self, *args, **kwargs):
+        """Record a call"""
+        self._calls.append((self._name, repr(args), repr(sorted(kwargs.items()))))
+        return Recorder(self._calls, f"{self._name}()")
+
+    def __repr__(self):
+        """The expression that gave this object"""
+        return self._name
+
+
+def run_protocol(protocol: bytes) -> list:
+    """The calls a protocol makes on the robot"""
+    protocol_api = types.ModuleType("opentrons.protocol_api")
+    protocol_api.ProtocolContext = object
+    opentrons = types.ModuleType("opentrons")
+    opentrons.protocol_api = protocol_api
+    modules = {"opentrons": opentrons, "opentrons.protocol_api": protocol_api}
+    saved = {name: sys.modules.get(name) for name in modules}
+    sys.modules.update(modules)
+    try:
+        namespace = {}
+        exec(compile(protocol, "protocol.py", "exec"), namespace)  # noqa: S102
+        calls = []
+        namespace["run"](Recorder(calls, "protocol"))
+        return calls
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name)
+            else:
+                sys.modules[name] = module
+
+
+class TestCompactProtocol(unittest.TestCase):
+    """tests for compact protocols"""
+
+    def test_same_commands(self):
+        """compact protocols are smaller and make the same calls as unrolled ones"""
+        for name in ("single_test.yaml", "pd_cfpe.yaml"):
+            unrolled, _ = ProtoPiler().yaml_to_bytes(CONFIG_DIR / name)
+            compact, _ = ProtoPiler(compact=True).yaml_to_bytes(CONFIG_DIR / name)
+            assert b"transfer(*step)" in compact
+            assert len(compact) < len(unrolled)
+            assert run_protocol(compact) == run_protocol(unrolled)
+
+    def test_same_resources(self):
+        """compact protocols use the same tips and wells"""
+        cfg = CONFIG_DIR / "pd_cfpe.yaml"
+        unrolled, compact = ProtoPiler(), ProtoPiler(compact=True)
+        unrolled.yaml_to_bytes(cfg, reset_when_done=False)
+        compact.yaml_to_bytes(cfg, reset_when_done=False)
+        assert compact.resource_manager.resources == unrolled.resource_manager.resources
+
+    def test_no_transfers(self):
+        """protocols without transfers do not define the transfer function"""
+        cfg = CONFIG_DIR / "move_to_staging_B1_A4.yaml"
+        compact, _ = ProtoPiler(compact=True).yaml_to_bytes(cfg)
+        assert compact == ProtoPiler().yaml_to_bytes(cfg)[0]
+
+    def test_cache_key(self):
+        """compact and unrolled compiles of a config are cached apart"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = CompileCache(cache_dir)
+            cfg = CONFIG_DIR / "single_test.yaml"
+            assert cache.key(cfg) != cache.key(cfg, compact=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""tests for the on-disk cache of compiled protocols"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from protopiler_helpers import CONFIG_DIR
+
+from ot2_interface.compile_cache import CompileCache
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.templates import TemplateRegistry
+
+
+class TestCompileCache(unittest.TestCase):
+    """tests for the compile cache"""
+
+    def setUp(self):
+        """scratch directory with a config to compile"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.config = self.root / "config.yaml"
+        self.config.write_text("commands: []\n")
+        self.protocol = self.root / "protocol_out.py"
+        self.protocol.write_text("# compiled\n")
+
+    def tearDown(self):
+        """remove the scratch directory"""
+        self.tmp.cleanup()
+
+    def test_key_covers_inputs(self):
+        """config, payload and resource state all change the key"""
+        cache = CompileCache(self.root / "cache")
+        resources = self.root / "resources.json"
+        resources.write_text("{}")
+
+        key = cache.key(self.config, {"a": 1, "b": 2}, resources)
+        assert key == cache.key(self.config, {"b": 2, "a": 1}, resources)
+        assert key != cache.key(self.config, {"a": 2, "b": 2}, resources)
+        assert key != cache.key(self.config, {"a": 1, "b": 2})
+
+        resources.write_text('{"1": {}}')
+        assert key != cache.key(self.config, {"a": 1, "b": 2}, resources)
+
+    def test_key_covers_spreadsheets_and_templates(self):
+        """editing a referenced spreadsheet or a template changes the key"""
+        cache = CompileCache(self.root / "cache")
+        sheet = self.root / "plate.xlsx"
+        sheet.write_bytes(b"v1")
+        self.config.write_text(f"resources:\n  - name: plate\n    location: {sheet}\n")
+        templates = self.root / "templates"
+        templates.mkdir()
+        (templates / "aspirate.template").write_text("#pipette#.aspirate()")
+        registry = TemplateRegistry(templates, check_mtime=True)
+
+        key = cache.key(self.config, templates=registry)
+        sheet.write_bytes(b"v2")
+        assert key != cache.key(self.config, templates=registry)
+        key = cache.key(self.config, templates=registry)
+        (templates / "aspirate.template").write_text("#pipette#.aspirate(1)")
+        os.utime(templates / "aspirate.template", (0, 0))
+        assert key != cache.key(self.config, templates=registry)
+
+    def test_hit_and_miss(self):
+        """stored protocols come back with their resource state"""
+        cache = CompileCache(self.root / "cache")
+        resources = self.root / "resources_out.json"
+        resources.write_text('{"used": 8}')
+        key = cache.key(self.config)
+
+        assert cache.get(key) is None
+        cache.put(key, self.protocol, resources)
+        protocol, cached_resources = cache.get(key)
+        assert protocol.read_text() == "# compiled\n"
+        assert cached_resources.read_text() == '{"used": 8}'
+
+        cache.put("in_memory", b"# compiled\n", b"{}")
+        protocol, cached_resources = cache.get("in_memory")
+        assert protocol.read_bytes() == b"# compiled\n"
+        assert cached_resources.read_text() == "{}"
+
+    def test_lru_eviction(self):
+        """the least recently used entry goes first"""
+        cache = CompileCache(self.root / "cache", max_entries=2)
+        for name in ("a", "b"):
+            cache.put(name, self.protocol)
+        os.utime(cache.cache_dir / "a", (0, 0))
+        os.utime(cache.cache_dir / "b", (1, 1))
+
+        cache.get("a")
+        cache.put("c", self.protocol)
+
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.get("c") is not None
+
+    def test_size_eviction(self):
+        """entries go, least recently used first, once they take too much space"""
+        cache = CompileCache(self.root / "cache", max_bytes=25)
+        for name, mtime in (("a", 0), ("b", 1)):
+            cache.put(name, b"x" * 10)
+            os.utime(cache.cache_dir / name, (mtime, mtime))
+        cache.put("c", b"x" * 10)
+
+        assert cache.get("a") is None
+        assert cache.get("b") is not None
+        assert cache.get("c") is not None
+
+    def test_protopiler_memoizes(self):
+        """a second compile of the same config comes from the cache, resources included"""
+        cache = CompileCache(self.root / "cache")
+        cfg = CONFIG_DIR / "single_test.yaml"
+        first, first_resources = ProtoPiler(cache=cache).yaml_to_protocol(
+            cfg, protocol_out_path=self.root, resource_file_out=self.root
+        )
+        with mock.patch.object(
+            ProtoPiler, "load_config", side_effect=AssertionError("compiled again")
+        ):
+            second, second_resources = ProtoPiler(cache=cache).yaml_to_protocol(
+                cfg, protocol_out_path=self.root, resource_file_out=self.root
+            )
+            protocol, _ = ProtoPiler(cache=cache).yaml_to_bytes(cfg)
+
+        assert first != second
+        assert first.read_text() == second.read_text()
+        assert protocol == first.read_bytes()
+        assert Path(first_resources).read_text() == Path(second_resources).read_text()
+
+    def test_cache_hit_resource_file(self):
+        """a cached compile does not write its resources to the file of an earlier config"""
+        cache = CompileCache(self.root / "cache")
+        other = CONFIG_DIR / "pd_cfpe.yaml"
+        ProtoPiler(cache=cache).yaml_to_protocol(
+            other, protocol_out_path=self.root, resource_file_out=self.root
+        )
+
+        piler = ProtoPiler(cache=cache)
+        resources = self.root / "resources.json"
+        _, written = piler.yaml_to_protocol(
+            CONFIG_DIR / "single_test.yaml",
+            protocol_out_path=self.root,
+            resource_file=resources,
+        )
+        assert written.startswith(str(resources))
+        cwd = Path.cwd()
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, cwd)
+        _, written = piler.yaml_to_protocol(other, protocol_out_path=self.root)
+
+        assert not written.startswith(str(resources))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""tests for consolidating many sources into one destination"""
+
+import unittest
+from pathlib import Path
+
+from protopiler_helpers import ScratchConfigs
+from pydantic import ValidationError
+
+from ot2_interface.protopiler.config import Transfer
+from ot2_interface.protopiler.preflight import preflight
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.transfers import TransferStep, consolidation_groups
+
+CONSOLIDATE = """    destination: 1:A1
+    consolidate: True
+    air_gap: 1
+"""
+
+
+def step(dst="A1", volume=5, mix_cycles=0, drop_tip=True):
+    """a transfer step from slot 4 to well `dst` of slot 1"""
+    return TransferStep(
+        "left",
+        None,
+        volume,
+        ("4", "A1"),
+        ("1", dst),
+        1,
+        1,
+        mix_cycles,
+        5,
+        True,
+        drop_tip,
+        False,
+    )
+
+
+class TestConsolidate(ScratchConfigs, unittest.TestCase):
+    """tests for consolidations"""
+
+    def edited(self, *replacements) -> Path:
+        """single_test.yaml pooling 5 µL of each source into 1:A1, with more text replaced"""
+        return super().edited(
+            ("    destination: 1:[A1, A2, A3, A4, A5, A6, A7, A8]\n", CONSOLIDATE),
+            ("volume: 20", "volume: 5"),
+            *replacements,
+        )
+
+    def test_groups(self):
+        """groups fill the pipette with their air gaps, and break on a new destination or other mix"""
+
+        def sizes(steps, air_gap=0):
+            return [
+                len(group)
+                for group in consolidation_groups(steps, lambda _mount: 20, air_gap)
+            ]
+
+        assert sizes([step()] * 8) == [4, 4]
+        assert sizes([step()] * 8, air_gap=1) == [3, 3, 2]
+        assert sizes([step(), step(), step("A2"), step("A2")]) == [2, 2]
+        assert sizes([step(mix_cycles=3)] * 2 + [step()]) == [2, 1]
+        assert sizes([step(), step(drop_tip=False), step()]) == [1, 1, 1]
+
+    def test_protocol(self):
+        """one tip and one dispense serve each group, with an air gap after each aspirate"""
+        for compact in (False, True):
+            protocol, _ = ProtoPiler(compact=compact).yaml_to_bytes(self.edited())
+            protocol = protocol.decode()
+            assert protocol.count(".pick_up_tip(") == 3
+            assert protocol.count(".aspirate(5.0, ") == 8
+            assert protocol.count(".air_gap(1.0)") == 8
+            assert protocol.count('.dispense(18.0, deck["1"]["A1"])') == 2
+            assert protocol.count('.dispense(12.0, deck["1"]["A1"])') == 1
+
+    def test_opt_in(self):
+        """without the flag each source gets its own tip"""
+        protocol, _ = ProtoPiler().yaml_to_bytes(
+            self.edited(("consolidate: True", "consolidate: False"))
+        )
+        assert protocol.count(b".pick_up_tip(") == 8
+        assert b"air_gap" not in protocol
+
+    def test_not_both(self):
+        """a block cannot both distribute and consolidate"""
+        with self.assertRaises(ValidationError):
+            Transfer(
+                command="transfer",
+                source="4:A1",
+                destination="1:A1",
+                volume=5,
+                distribute=True,
+                consolidate=True,
+            )
+
+    def test_preflight_tips(self):
+        """preflight counts a tip per consolidation"""
+        report = preflight(self.edited())
+        assert report.ok, report.problems
+        assert report.tips_needed == {"p20_single_gen2": 3}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+"""tests for distributing one source to many destinations"""
+
+import re
+import unittest
+from pathlib import Path
+
+from protopiler_helpers import ScratchConfigs
+
+from ot2_interface.protopiler.preflight import preflight
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.transfers import TransferStep, distribution_groups
+
+DISTRIBUTE = """    source: 4:A1
+    distribute: True
+    disposal_volume: 2
+"""
+
+
+def step(src="A1", volume=5, mix_cycles=0, drop_tip=True):
+    """a transfer step from well `src` of slot 4 to slot 1"""
+    return TransferStep(
+        "left",
+        None,
+        volume,
+        ("4", src),
+        ("1", "A1"),
+        1,
+        1,
+        mix_cycles,
+        0,
+        True,
+        drop_tip,
+        False,
+    )
+
+
+def tip_volumes(protocol: bytes):
+    """the volume in each pipette's tip after every command of a protocol"""
+    held = {}
+    for mount, command, volume in re.findall(
+        rb'pipettes\["(\w+)"\]\.(\w+)\(([\d.]*)', protocol
+    ):
+        if command == b"aspirate":
+            held[mount] = held.get(mount, 0) + float(volume)
+        elif command == b"dispense":
+            held[mount] = held.get(mount, 0) - float(volume)
+        elif command in (b"blow_out", b"drop_tip", b"return_tip"):
+            held[mount] = 0
+        yield held.get(mount, 0)
+
+
+class TestDistribute(ScratchConfigs, unittest.TestCase):
+    """tests for distributions"""
+
+    def edited(self, *replacements) -> Path:
+        """single_test.yaml distributing 5 µL from 4:A1, with more text replaced"""
+        return super().edited(
+            ("    source: 4:[A1, A2, A3, A4, A5, A6, A7, A8]\n", DISTRIBUTE),
+            ("volume: 20", "volume: 5"),
+            *replacements,
+        )
+
+    def test_groups(self):
+        """groups fill the pipette, and break on a new source, a mix or other tip handling"""
+
+        def sizes(steps, disposal_volume=0):
+            return [
+                len(group)
+                for group in distribution_groups(
+                    steps, lambda _mount: 20, disposal_volume
+                )
+            ]
+
+        assert sizes([step()] * 8) == [4, 4]
+        assert sizes([step()] * 8, disposal_volume=2) == [3, 3, 2]
+        assert sizes([step(), step(), step("A2"), step("A2")]) == [2, 2]
+        assert sizes([step(), step(mix_cycles=3), step()]) == [1, 1, 1]
+        assert sizes([step(), step(drop_tip=False), step()]) == [1, 1, 1]
+        assert sizes([step(volume=20)] * 2) == [1, 1]
+
+    def test_protocol(self):
+        """one tip and one aspirate serve each group, the disposal volume goes back to the source"""
+        for compact in (False, True):
+            protocol, _ = ProtoPiler(compact=compact).yaml_to_bytes(self.edited())
+            protocol = protocol.decode()
+            assert protocol.count(".pick_up_tip(") == 3
+            assert protocol.count('.aspirate(17.0, deck["4"]["A1"])') == 2
+            assert protocol.count('.aspirate(12.0, deck["4"]["A1"])') == 1
+            assert protocol.count(".dispense(5.0, ") == 8
+            assert protocol.count('.blow_out(deck["4"]["A1"])') == 3
+
+    def test_disposal_volume(self):
+        """a lone step draws the disposal volume too, and it is only blown out with blow_out"""
+        seven = (
+            "destination: 1:[A1, A2, A3, A4, A5, A6, A7, A8]",
+            "destination: 1:[A1, A2, A3, A4, A5, A6, A7]",
+        )
+        for compact in (False, True):
+            protocol, _ = ProtoPiler(compact=compact).yaml_to_bytes(self.edited(seven))
+            assert protocol.count(b'.aspirate(17.0, deck["4"]["A1"])') == 2
+            assert protocol.count(b'.aspirate(7.0, deck["4"]["A1"])') == 1
+            assert protocol.count(b'.blow_out(deck["4"]["A1"])') == 3
+
+        config = self.edited(
+            seven, ("distribute: True", "distribute: True\n    blow_out: False")
+        )
+        protocol, _ = ProtoPiler().yaml_to_bytes(config)
+        assert protocol.count(b'.aspirate(7.0, deck["4"]["A1"])') == 1
+        assert b".blow_out(" not in protocol
+
+    def test_kept_tip_is_not_overfilled(self):
+        """a tip kept on between groups is emptied of its disposal volume before it aspirates"""
+        config = self.edited(
+            ("disposal_volume: 2", "disposal_volume: 4"),
+            (
+                "distribute: True",
+                "distribute: True\n    blow_out: False\n    drop_tip: False",
+            ),
+        )
+        for compact in (False, True):
+            protocol, _ = ProtoPiler(compact=compact).yaml_to_bytes(config)
+            assert protocol.count(b".pick_up_tip(") == 1
+            assert protocol.count(b'.aspirate(19.0, deck["4"]["A1"])') == 2
+            assert protocol.count(b'.aspirate(14.0, deck["4"]["A1"])') == 1
+            assert protocol.count(b'.blow_out(deck["4"]["A1"])') == 3
+            assert max(tip_volumes(protocol)) <= 20
+
+    def test_mix_is_not_distributed(self):
+        """a transfer that mixes its destination keeps its own tip"""
+        config = self.edited(
+            (
+                "dispense_clearance: 1",
+                "dispense_clearance: 1\n    mix_cycles: 2\n    mix_volume: 5",
+            )
+        )
+        protocol, _ = ProtoPiler().yaml_to_bytes(config)
+        assert protocol.count(b".pick_up_tip(") == 8
+        assert b"blow_out(deck" not in protocol
+
+    def test_tip_commands_after_transfer(self):
+        """tip and move commands after a transfer act on the transfer's pipette"""
+        keep_tip = (
+            "\n\nmetadata:",
+            "\n    drop_tip: False\n"
+            "  - command: replace_tip\n    replace_tip: True\n"
+            "  - command: move_pipette\n    move_to: 5\n\nmetadata:",
+        )
+        for config in (ScratchConfigs.edited(self, keep_tip), self.edited(keep_tip)):
+            protocol, _ = ProtoPiler().yaml_to_bytes(config)
+            assert protocol.count(b".pick_up_tip(") == 1
+            assert b'pipettes["left"].return_tip()' in protocol
+            assert b'pipettes["left"].move_to(5)' in protocol
+
+    def test_preflight_tips(self):
+        """preflight counts a tip per distribution"""
+        report = preflight(self.edited())
+        assert report.ok, report.problems
+        assert report.tips_needed == {"p20_single_gen2": 3}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""tests for the in-memory node metrics"""
+
+import threading
+import unittest
+
+from ot2_interface.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """tests for the metrics registry"""
+
+    def test_counters_and_labels(self):
+        """bound labels are added to everything recorded through the view"""
+        metrics = Metrics()
+        robot = metrics.bind(robot="a")
+        robot.inc("ot2_tips_used_total", 8)
+        robot.inc("ot2_tips_used_total", 2)
+        metrics.inc("ot2_tips_used_total", robot="b")
+        counters = metrics.snapshot()["counters"]["ot2_tips_used_total"]
+        assert {c["labels"]["robot"]: c["value"] for c in counters} == {
+            "a": 10,
+            "b": 1,
+        }
+
+    def test_histogram_render(self):
+        """histograms render cumulative buckets, sum and count"""
+        metrics = Metrics(buckets=(1.0, 10.0, float("inf")))
+        for value in (0.5, 5, 50):
+            metrics.observe("ot2_phase_seconds", value, phase="upload")
+        text = metrics.render()
+        assert "# TYPE ot2_phase_seconds histogram" in text
+        assert 'ot2_phase_seconds_bucket{phase="upload",le="1"} 1' in text
+        assert 'ot2_phase_seconds_bucket{phase="upload",le="10"} 2' in text
+        assert 'ot2_phase_seconds_bucket{phase="upload",le="+Inf"} 3' in text
+        assert 'ot2_phase_seconds_sum{phase="upload"} 55.5' in text
+        assert 'ot2_phase_seconds_count{phase="upload"} 3' in text
+
+    def test_timer_and_threads(self):
+        """concurrent updates are not lost, and the timer records even on errors"""
+        metrics = Metrics()
+
+        def work():
+            for _ in range(1000):
+                metrics.inc("ot2_runs_total")
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        assert "ot2_runs_total 4000" in metrics.render()
+
+        with self.assertRaises(ValueError), metrics.time("ot2_phase_seconds"):
+            raise ValueError
+        histogram = metrics.snapshot()["histograms"]["ot2_phase_seconds"][0]
+        assert histogram["value"]["count"] == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""tests for the static checks of protopiler configs"""
+
+import unittest
+
+from protopiler_helpers import CONFIG_DIR, ScratchConfigs
+
+from ot2_interface.protopiler.preflight import PreflightError, preflight
+
+
+class TestPreflight(ScratchConfigs, unittest.TestCase):
+    """tests for preflight checks"""
+
+    def test_valid_config(self):
+        """a good config passes and reports its tip demand"""
+        report = preflight(CONFIG_DIR / "single_test.yaml")
+        assert report.ok, report.problems
+        assert report.tips_needed == {"p20_single_gen2": 8}
+        assert report.tips_available == {"p20_single_gen2": 96}
+
+    def test_error_configs(self):
+        """volumes no pipette can handle and missing labware are caught"""
+        for name in ("error_config_1", "error_config_2", "error_config_3"):
+            report = preflight(CONFIG_DIR / f"{name}.yaml")
+            assert not report.ok, name
+            with self.assertRaises(PreflightError):
+                report.raise_for_problems()
+
+    def test_unknown_alias_and_well(self):
+        """locations must name labware on the deck and wells on the plate"""
+        report = preflight(self.edited(("source: 4:", "source: nowhere:")))
+        assert any("nowhere" in problem for problem in report.problems)
+        report = preflight(self.edited(("A8]\n    aspirate", "A13]\n    aspirate")))
+        assert any("A13" in problem for problem in report.problems)
+
+    def test_out_of_tips(self):
+        """tip usage adds up across a batch"""
+        config = CONFIG_DIR / "single_test.yaml"
+        assert preflight([config] * 12).ok
+        report = preflight([config] * 13)
+        assert report.tips_needed == {"p20_single_gen2": 104}
+        assert any("tips" in problem for problem in report.problems)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""tests for substituting run parameters into protocol files"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from ot2_interface import protocol_parameters
+from ot2_interface.protocol_parameters import ParameterTemplate, render_protocol
+
+
+class TestProtocolParameters(unittest.TestCase):
+    """tests for protocol parameter substitution"""
+
+    def test_render(self):
+        """placeholders are matched whole, and unknown ones are left alone"""
+        template = ParameterTemplate("a = $vol\nb = $volume\nc = $other\n$vol")
+        assert (
+            template.render({"vol": 5, "volume": "10"})
+            == "a = 5\nb = 10\nc = $other\n5"
+        )
+
+    def test_original_is_reusable(self):
+        """rendering twice with different parameters leaves the original untouched"""
+        with tempfile.TemporaryDirectory() as tmp:
+            protocol = Path(tmp) / "protocol.py"
+            protocol.write_text("volume = $volume\n")
+
+            first = render_protocol(protocol, {"volume": 1}, Path(tmp) / "runs")
+            second = render_protocol(protocol, {"volume": 2}, Path(tmp) / "runs")
+
+            assert first != second
+            assert first.read_text() == "volume = 1\n"
+            assert second.read_text() == "volume = 2\n"
+            assert protocol.read_text() == "volume = $volume\n"
+
+    def test_cache_follows_file_contents(self):
+        """an edited protocol is recompiled, an unchanged one is not"""
+        with tempfile.TemporaryDirectory() as tmp:
+            protocol = Path(tmp) / "protocol.py"
+            protocol.write_text("x = $x\n")
+            template, digest = protocol_parameters.load_template(protocol)
+            assert protocol_parameters.load_template(protocol)[0] is template
+
+            protocol.write_text("y = $x\n")
+            edited, edited_digest = protocol_parameters.load_template(protocol)
+            assert edited_digest != digest
+            assert edited.render({"x": 1}) == "y = 1\n"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""tests for writing protocols to sinks as they are compiled"""
+
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from protopiler_helpers import CONFIG_DIR
+
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.stream import output_file, write_lines
+
+
+class TestProtocolStream(unittest.TestCase):
+    """tests for streamed protocols"""
+
+    def test_write_lines(self):
+        """chunked writes add up to the joined lines, in text and bytes"""
+        lines = [f"line {i} é" for i in range(100)]
+        for chunk_size in (1, 7, 1000):
+            text, binary = io.StringIO(), io.BytesIO()
+            write_lines(iter(lines), text, chunk_size=chunk_size)
+            write_lines(iter(lines), binary, chunk_size=chunk_size)
+            assert text.getvalue() == "\n".join(lines)
+            assert binary.getvalue() == "\n".join(lines).encode("utf-8")
+
+    def test_writes_before_exhausted(self):
+        """lines reach the sink while later lines are still being generated"""
+        sink = io.StringIO()
+
+        def lines():
+            for i in range(10):
+                yield "x" * 10
+                if i == 5:
+                    assert sink.getvalue()
+
+        write_lines(lines(), sink, chunk_size=16)
+
+    def test_stream_matches_file(self):
+        """streaming into memory gives the same protocol as compiling to a file"""
+        cfg = CONFIG_DIR / "single_test.yaml"
+        sink = io.BytesIO()
+        ProtoPiler().stream_protocol(sink, config_path=cfg)
+        with tempfile.TemporaryDirectory() as out_dir:
+            protocol_out, _ = ProtoPiler().yaml_to_protocol(
+                cfg, protocol_out_path=out_dir, write_resources=False
+            )
+            assert sink.getvalue() == protocol_out.read_bytes()
+
+    def test_in_memory_writes_nothing(self):
+        """compiling to bytes leaves no protocol or resource file behind"""
+        cfg = CONFIG_DIR / "single_test.yaml"
+        cwd = Path.cwd()
+        with tempfile.TemporaryDirectory() as work_dir:
+            os.chdir(work_dir)
+            try:
+                protocol, resources = ProtoPiler().yaml_to_bytes(cfg)
+                assert list(Path(work_dir).iterdir()) == []
+            finally:
+                os.chdir(cwd)
+        assert resources is None
+        assert b"protocol.load_instrument" in protocol
+
+    def test_unique_output_names(self):
+        """compiles in the same second get different files"""
+        protopiler = ProtoPiler()
+        names = {protopiler._protocol_out("out") for _ in range(100)}
+        assert len(names) == 100
+
+    def test_failed_output_removed(self):
+        """a protocol that fails to compile leaves no partial file behind"""
+        with tempfile.TemporaryDirectory() as out_dir:
+            path = Path(out_dir) / "protocol.py"
+            with self.assertRaises(ValueError), output_file(path) as f:
+                f.write("partial")
+                raise ValueError("failed")
+            assert not path.exists()
+
+
+if __name__ == "__main__":
+    unittest.main()
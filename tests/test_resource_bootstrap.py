@@ -0,0 +1,144 @@
+"""tests for the idempotent resource bootstrap"""
+
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import requests
+from madsci.common.types.resource_types import Slot
+
+from ot2_interface.resource_bootstrap import ResourceBootstrap
+
+
+class FakeResourceClient:
+    """records calls the way a resource server would see them"""
+
+    resource_server_url = "http://resources/"
+
+    def __init__(self, query_status=None):
+        """empty server, answering resource queries with `query_status` if given"""
+        self.query_status = query_status
+        self.calls = []
+        self.templates = {}
+        self.resources = {}
+
+    def get_templates_by_category(self):
+        """template names by category"""
+        self.calls.append("categories")
+        return {"slot": list(self.templates)}
+
+    def create_template(self, **template):
+        """store a template"""
+        self.calls.append(f"create_template {template['template_name']}")
+        self.templates[template["template_name"]] = template
+
+    def init_template(self, **template):
+        """store or update a template"""
+        self.calls.append(f"init_template {template['template_name']}")
+        self.templates[template["template_name"]] = template
+
+    def query_resource(self, resource_class=None, multiple=False):
+        """all resources of a class"""
+        self.calls.append(f"query {resource_class}")
+        if self.query_status is not None:
+            response = requests.Response()
+            response.status_code = self.query_status
+            raise requests.HTTPError(response=response)
+        return list(self.resources.values())
+
+    def create_resource_from_template(
+        self, template_name, resource_name, add_to_database
+    ):
+        """store a resource"""
+        self.calls.append(f"create_resource {resource_name}")
+        resource = SimpleNamespace(
+            resource_id=f"id-{resource_name}", resource_name=resource_name
+        )
+        self.resources[resource_name] = resource
+        return resource
+
+    def set_child(self, parent, key, child):
+        """attach a resource"""
+        self.calls.append(f"set_child {parent} {key}")
+
+
+def manifest(description="slot"):
+    """one template and two resources built from it"""
+    templates = [
+        {
+            "resource": Slot(resource_name="slot", resource_class="TestSlot"),
+            "template_name": "test_slot",
+            "description": description,
+            "version": "1.0.0",
+        }
+    ]
+    resources = [
+        {"resource_name": "parent", "template_name": "test_slot"},
+        {
+            "resource_name": "child",
+            "template_name": "test_slot",
+            "parent": "parent",
+            "key": "1",
+        },
+    ]
+    return templates, resources
+
+
+class TestResourceBootstrap(unittest.TestCase):
+    """tests for the resource bootstrap"""
+
+    def setUp(self):
+        """scratch directory for the manifest cache"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_file = Path(self.tmp.name) / "manifest.json"
+
+    def tearDown(self):
+        """remove the scratch directory"""
+        self.tmp.cleanup()
+
+    def test_restart_makes_no_calls(self):
+        """the second sync is served from the manifest cache"""
+        client = FakeResourceClient()
+        ids = ResourceBootstrap(client, self.cache_file).sync(*manifest())
+        assert ids == {"parent": "id-parent", "child": "id-child"}
+        assert any(call.startswith("set_child") for call in client.calls)
+
+        client.calls.clear()
+        assert ResourceBootstrap(client, self.cache_file).sync(*manifest()) == ids
+        assert client.calls == []
+
+    def test_changed_template_is_resent(self):
+        """only the changed spec costs calls"""
+        client = FakeResourceClient()
+        ResourceBootstrap(client, self.cache_file).sync(*manifest())
+        client.calls.clear()
+
+        ResourceBootstrap(client, self.cache_file).sync(*manifest("new description"))
+        assert client.calls == ["categories", "init_template test_slot"]
+
+    def test_cold_cache_finds_existing(self):
+        """with no cache, resources already on the server are not created again"""
+        client = FakeResourceClient()
+        ResourceBootstrap(client, self.cache_file).sync(*manifest())
+        self.cache_file.unlink()
+        client.calls.clear()
+
+        ResourceBootstrap(client, self.cache_file).sync(*manifest())
+        assert not [call for call in client.calls if call.startswith("create")]
+
+    def test_query_errors(self):
+        """a class the server has nothing of is created, other query failures are raised"""
+        client = FakeResourceClient(query_status=404)
+        ids = ResourceBootstrap(client, self.cache_file).sync(*manifest())
+        assert ids == {"parent": "id-parent", "child": "id-child"}
+
+        self.cache_file.unlink()
+        client = FakeResourceClient(query_status=500)
+        with self.assertRaises(requests.HTTPError):
+            ResourceBootstrap(client, self.cache_file).sync(*manifest())
+        assert not [call for call in client.calls if call.startswith("create_resource")]
+
+
+if __name__ == "__main__":
+    unittest.main()
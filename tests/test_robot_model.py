@@ -0,0 +1,57 @@
+"""tests for the in-memory robot model"""
+
+import unittest
+
+from ot2_interface.robot_model import RobotModel
+from ot2_interface.run_log import RunLog
+from ot2_interface.run_progress import RunProgress
+
+
+class TestRobotModel(unittest.TestCase):
+    """tests for the robot model"""
+
+    def test_run_lifecycle(self):
+        """the snapshot follows a run from start to finish"""
+        model = RobotModel()
+        model.set_robot_status("idle")
+        assert model.snapshot()["ot2_status_code"] == "idle"
+
+        progress = RunProgress("run")
+        model.start_run("run", "protocol.py", progress)
+        progress.observe("running", 3, "aspirate", now=0.0)
+        state = model.snapshot()
+        assert state["ot2_status_code"] == "running"
+        assert state["run_id"] == "run"
+        assert state["protocol"] == "protocol.py"
+        assert state["run_progress"]["completed_commands"] == 3
+
+        model.finish_run(
+            {"data": {"status": "failed", "errors": [{"detail": "tip collision"}]}}
+        )
+        state = model.snapshot()
+        assert state["run_id"] is None
+        assert state["ot2_status_code"] == "idle"
+        assert state["last_error"] == "tip collision"
+
+    def test_tip_usage(self):
+        """only tips that were actually picked up are counted"""
+        model = RobotModel()
+        run_log = RunLog(
+            {
+                "data": {},
+                "commands": {
+                    "data": [
+                        {"id": "a", "commandType": "pickUpTip", "status": "succeeded"},
+                        {"id": "b", "commandType": "dropTip", "status": "succeeded"},
+                        {"id": "c", "commandType": "pickUpTip", "status": "failed"},
+                    ]
+                },
+            }
+        )
+        model.record_run_log(run_log)
+        model.record_run_log(run_log)
+        assert model.snapshot()["tips_used"] == {"last_run": 1, "total": 2}
+
+
+if __name__ == "__main__":
+    unittest.main()
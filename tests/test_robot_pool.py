@@ -0,0 +1,66 @@
+"""tests for choosing robots from the node's pool"""
+
+import unittest
+
+from ot2_interface.protopiler.config import Labware, Pipette
+from ot2_interface.robot_pool import PooledRobot, rank_robots
+
+
+class FakeDriver:
+    """reports fixed pipettes"""
+
+    def __init__(self, pipettes):
+        """robot with the given pipettes by mount"""
+        self.pipettes = pipettes
+
+    def get_attached_pipettes(self):
+        """the pipettes"""
+        return self.pipettes
+
+
+def deck(pipette="p20_single_gen2", plate_location="1"):
+    """equipment of a config with one pipette and one plate"""
+    return [
+        Pipette(name=pipette, mount="left"),
+        Labware(name="corning_96_wellplate_360ul_flat", location=plate_location),
+    ]
+
+
+class TestRobotPool(unittest.TestCase):
+    """tests for the robot pool"""
+
+    def setUp(self):
+        """a pool of two p20 robots and one p300 robot"""
+        self.robots = [
+            PooledRobot("a", FakeDriver({"left": "p20_single_gen2", "right": None})),
+            PooledRobot("b", FakeDriver({"left": "p20_single_gen2", "right": None})),
+            PooledRobot("c", FakeDriver({"left": "p300_single_gen2", "right": None})),
+        ]
+
+    def test_pipettes(self):
+        """only robots with the config's pipettes are candidates"""
+        assert rank_robots(self.robots, deck()) == ["a", "b"]
+        assert rank_robots(self.robots, deck("p300_single_gen2")) == ["c"]
+        # plain protocols can run anywhere
+        assert rank_robots(self.robots, None) == ["a", "b", "c"]
+
+    def test_same_deck_first(self):
+        """a robot that last ran the same deck layout is preferred"""
+        self.robots[1].equipment = deck()
+        assert rank_robots(self.robots, deck()) == ["b", "a"]
+        assert rank_robots(self.robots, deck(plate_location="2")) == ["a", "b"]
+
+    def test_unknown_pipettes(self):
+        """a robot that could not report its pipettes is left out until it does"""
+        driver = FakeDriver({})
+        robot = PooledRobot("d", driver)
+        assert robot.pipettes is None
+        assert not robot.compatible(deck())
+        assert robot.compatible(None)
+
+        driver.pipettes = {"left": "p20_single_gen2", "right": None}
+        assert robot.compatible(deck())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""tests for the indexed run log model"""
+
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from ot2_interface.run_log import RunLog, load_run_log, save_run_log
+
+
+def make_run_log(n_commands):
+    """a run log with a plate on a module, a tip rack and one pipette"""
+    commands = []
+    for i in range(n_commands):
+        command_type = ["pickUpTip", "aspirate", "dispense", "dropTip"][i % 4]
+        labware = "tips" if command_type in ("pickUpTip", "dropTip") else "plate"
+        commands.append(
+            {
+                "id": f"c{i}",
+                "commandType": command_type,
+                "status": "succeeded",
+                "params": {
+                    "pipetteId": "pip",
+                    "labwareId": labware,
+                    "wellName": "A1",
+                    "volume": 10.0,
+                },
+            }
+        )
+    return {
+        "data": {
+            "id": "run",
+            "status": "succeeded",
+            "modules": [{"id": "mod", "location": {"slotName": "3"}}],
+            "labware": [
+                {"id": "tips", "loadName": "tiprack", "location": {"slotName": "1"}},
+                {"id": "plate", "loadName": "plate", "location": {"moduleId": "mod"}},
+            ],
+            "pipettes": [{"id": "pip", "mount": "left"}],
+        },
+        "commands": {"data": commands},
+    }
+
+
+class TestRunLog(unittest.TestCase):
+    """tests for the run log model"""
+
+    def test_indexes(self):
+        """labware resolve to slots, through modules, and pipettes to mounts"""
+        run_log = RunLog(make_run_log(4))
+        assert run_log.labware_slots == {"tips": "1", "plate": "3"}
+        pick_up, aspirate = run_log.commands[:2]
+        assert (pick_up.slot, pick_up.mount) == ("1", "left")
+        assert (aspirate.slot, aspirate.volume) == ("3", 10.0)
+
+    def test_rows_and_table(self):
+        """a subset of raw commands maps back to its rows"""
+        raw = make_run_log(8)
+        run_log = RunLog(raw)
+        rows = run_log.rows(raw["commands"]["data"][4:6])
+        assert [row.index for row in rows] == [4, 5]
+        table = run_log.table(rows)
+        assert table["columns"][:2] == ["index", "command_type"]
+        assert table["rows"][1][:2] == [5, "aspirate"]
+
+    def test_large_run(self):
+        """a 10k command run is parsed in well under a second"""
+        raw = make_run_log(10_000)
+        start = time.perf_counter()
+        run_log = RunLog(raw)
+        assert len(run_log.liquid_handling()) == 10_000
+        assert time.perf_counter() - start < 0.5
+
+    def test_summary(self):
+        """the summary counts commands and reports timings and errors"""
+        raw = make_run_log(8)
+        commands = raw["commands"]["data"]
+        commands[0]["startedAt"] = "2024-01-01T10:00:00+00:00"
+        commands[-1].update(
+            completedAt="2024-01-01T10:01:30+00:00",
+            status="failed",
+            error={"id": "e1", "errorType": "TipNotAttached", "detail": "no tip"},
+        )
+        raw["data"]["errors"] = [
+            {"id": "e1", "errorType": "TipNotAttached", "detail": "no tip"}
+        ]
+        summary = RunLog(raw).summary()
+        assert summary["duration"] == 90.0
+        assert summary["commands"] == 8
+        assert summary["commands_failed"] == 1
+        assert summary["tips_used"] == 2
+        assert summary["volume_aspirated"] == 20.0
+        assert summary["errors"] == [{"type": "TipNotAttached", "detail": "no tip"}]
+
+    def test_save_and_load(self):
+        """the archived log reads back as the original"""
+        raw = make_run_log(100)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = save_run_log(raw, Path(tmp) / "logs" / "run.json.gz")
+            assert load_run_log(path) == raw
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""tests for run progress tracking"""
+
+import unittest
+from unittest import mock
+
+import requests
+
+from ot2_interface.ot2_driver_http import OT2_Driver, RunStatus
+from ot2_interface.protopiler.protopiler import STEP_MARKER
+from ot2_interface.run_progress import RunProgress
+
+
+def comment(step, name):
+    """an analyzed step marker command"""
+    return {
+        "commandType": "comment",
+        "params": {"message": f"{STEP_MARKER} {step}: {name}"},
+    }
+
+
+class TestRunProgress(unittest.TestCase):
+    """tests for run progress"""
+
+    def test_blocks_and_eta(self):
+        """the current block follows the step markers and the eta extrapolates"""
+        analysis = [{"commandType": "home"}, comment(0, "mix")]
+        analysis += [{"commandType": "aspirate"}] * 4
+        analysis += [comment(1, "transfer")] + [{"commandType": "dispense"}] * 4
+        progress = RunProgress("run", "protocol")
+        progress.set_analysis(analysis)
+        assert progress.total_commands == 11
+
+        progress.observe("running", 0, "home", now=0.0)
+        assert progress.current_block is None
+        assert progress.eta is None
+
+        progress.observe("running", 3, "aspirate", now=30.0)
+        assert progress.current_block == "mix"
+        assert progress.eta == 80.0
+
+        progress.observe("running", 7, "dispense", now=70.0)
+        state = progress.as_dict()
+        assert state["current_block"] == "transfer"
+        assert state["eta_seconds"] == 40.0
+
+    def test_missing_analysis(self):
+        """progress is still reported before the analysis is ready"""
+        progress = RunProgress("run")
+        progress.set_analysis(None)
+        progress.observe("running", 5, "aspirate", now=0.0)
+        progress.observe("running", None, "aspirate", now=1.0)
+        state = progress.as_dict()
+        assert state["completed_commands"] == 5
+        assert state["total_commands"] is None
+        assert state["eta_seconds"] is None
+
+    def test_wait_keeps_polling_through_failures(self):
+        """a failed poll still sleeps, and a failed analysis does not stop the progress update"""
+        driver = OT2_Driver.__new__(OT2_Driver)
+        statuses = iter(
+            [
+                requests.ConnectionError("timeout"),
+                RunStatus.RUNNING,
+                RunStatus.SUCCEEDED,
+            ]
+        )
+
+        def check_run_status(_run_id):
+            status = next(statuses)
+            if isinstance(status, Exception):
+                raise status
+            return status
+
+        driver.check_run_status = check_run_status
+        driver.get_run_progress = lambda _run_id: {
+            "completed_commands": 3,
+            "command_type": "aspirate",
+        }
+        driver.get_protocol_analysis = mock.Mock(side_effect=requests.HTTPError("404"))
+        driver.get_run = lambda run_id: {"data": {"id": run_id}}
+        progress = RunProgress("run", "protocol")
+        with mock.patch("ot2_interface.ot2_driver_http.time.sleep") as sleep:
+            assert driver.wait("run", progress=progress) == {"data": {"id": "run"}}
+        assert sleep.call_count == 2
+        driver.get_protocol_analysis.assert_called_once_with("protocol")
+        assert progress.completed_commands == 3
+        assert progress.status == "succeeded"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""tests for the parameters of the run_protocol action"""
+
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from protopiler_helpers import ScratchConfigs
+
+from ot2_interface.metrics import Metrics
+from ot2_interface.robot_pool import PooledRobot
+from ot2_interface.run_queue import RunQueue
+from ot2_interface.run_state import RunStateFile
+from ot2_rest_node import OT2Node
+
+
+class FakeDriver:
+    """Records the protocols uploaded and the runs created for them"""
+
+    def __init__(self):
+        self.uploaded = {}
+        self.runs = []
+
+    def get_attached_pipettes(self):
+        return {}
+
+    def upload_protocol(self, protocol_path, name=None):
+        protocol_id = f"protocol_{len(self.uploaded)}"
+        self.uploaded[protocol_id] = Path(protocol_path).read_bytes()
+        return protocol_id
+
+    def validate_protocol(self, protocol_id):
+        return []
+
+    def create_run(self, protocol_id):
+        self.runs.append(protocol_id)
+        return f"run_{len(self.runs)}"
+
+
+class TestRunProtocol(ScratchConfigs, unittest.TestCase):
+    """tests for running a protocol with parameters"""
+
+    def setUp(self):
+        super().setUp()
+        self.driver = FakeDriver()
+        node = OT2Node.__new__(OT2Node)
+        node.config = node.config.model_copy(update={"preflight": False})
+        node.node_info = mock.Mock(node_name="ot2")
+        node.logger = mock.Mock()
+        node.metrics = Metrics()
+        node.robots = {"ot2": PooledRobot("ot2", self.driver)}
+        node.run_queue = RunQueue(robots=list(node.robots))
+        node.run_state = RunStateFile(Path(self.tmp.name) / "active_runs.json")
+        node.protocols_folder_path = self.tmp.name
+        node._monitor_run = mock.Mock(return_value={"data": {"status": "succeeded"}})
+        summary = mock.Mock()
+        summary.summary.return_value = {"status": "succeeded"}
+        node._record_run = mock.Mock(return_value=({}, summary, Path("log.json.gz")))
+        self.node = node
+
+    def test_parameters_reach_the_run(self):
+        """the protocol the run is created for has the parameters filled in"""
+        protocol = self.scratch("volume = $volume\n", name="protocol.py")
+        result, _ = self.node.run_protocol(protocol, {"volume": 7})
+        assert result == {"status": "succeeded"}
+        assert self.driver.uploaded == {"protocol_0": b"volume = 7\n"}
+        assert self.driver.runs == ["protocol_0"]
+        # the original stays a template for the next run, the rendered copy is gone
+        assert protocol.read_text() == "volume = $volume\n"
+        assert list(Path(self.tmp.name).glob("*.py")) == [protocol]
+
+
+if __name__ == "__main__":
+    unittest.main()
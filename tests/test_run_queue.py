@@ -0,0 +1,91 @@
+"""tests for the queue of runs waiting for the robot"""
+
+import threading
+import time
+import unittest
+
+from ot2_interface.run_queue import QueueFullError, RunQueue
+
+
+class TestRunQueue(unittest.TestCase):
+    """tests for the run queue"""
+
+    def test_priority_then_fifo(self):
+        """higher priorities go first, equal priorities in submission order"""
+        queue = RunQueue(max_size=4)
+        first = queue.submit("first")
+        tickets = [
+            queue.submit("low"),
+            queue.submit("high", priority=5),
+            queue.submit("low again"),
+        ]
+        assert [t.name for t in queue.waiting] == ["high", "first", "low", "low again"]
+
+        order = []
+
+        def run(ticket):
+            with queue.turn(ticket):
+                order.append(ticket.name)
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in [*tickets, first]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        assert order == ["high", "first", "low", "low again"]
+        assert queue.snapshot()["depth"] == 0
+
+    def test_bounded(self):
+        """the queue refuses jobs past its size, and frees the slot when one leaves"""
+        queue = RunQueue(max_size=1)
+        ticket = queue.submit("one")
+        with self.assertRaises(QueueFullError):
+            queue.submit("two")
+        queue.withdraw(ticket)
+        queue.submit("two")
+
+    def test_snapshot(self):
+        """the node state shows the running job and who is waiting"""
+        queue = RunQueue(max_size=2)
+        running = queue.submit("running")
+        waiting = queue.submit("waiting")
+        with queue.turn(running):
+            state = queue.snapshot()
+            assert state["active"] == {"ot2": "running"}
+            assert state["depth"] == 1
+            assert state["waiting"][0]["name"] == "waiting"
+            assert state["waiting"][0]["prepared"] is False
+            assert state["last_wait_seconds"] is not None
+        queue.withdraw(waiting)
+        assert queue.snapshot()["active"] == {}
+
+    def test_pool(self):
+        """a job only overtakes the jobs ahead of it for robots they cannot use"""
+        queue = RunQueue(max_size=4, robots=["a", "b"])
+        first = queue.submit("first")
+        only_a = queue.submit("only a")
+        any_robot = queue.submit("any")
+
+        with queue.turn(first, ["a"]) as robot:
+            assert robot == "a"
+            assigned = {}
+
+            def run(ticket, candidates):
+                with queue.turn(ticket, candidates) as robot:
+                    assigned[ticket.name] = robot
+
+            waiting_for_a = threading.Thread(target=run, args=(only_a, ["a"]))
+            waiting_for_a.start()
+            while not only_a.prepared:
+                time.sleep(0.01)
+            # "only a" is stuck behind "first", but "any" can have robot b
+            run(any_robot, ["a", "b"])
+            assert assigned == {"any": "b"}
+
+        waiting_for_a.join(timeout=5)
+        assert assigned == {"any": "b", "only a": "a"}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""tests for the record of runs in flight"""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from ot2_interface.run_state import RunStateFile, protocol_hash
+
+
+class TestRunStateFile(unittest.TestCase):
+    """tests for the run state file"""
+
+    def setUp(self):
+        """scratch directory for the state file"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "node" / "active_runs.json"
+
+    def tearDown(self):
+        """remove the scratch directory"""
+        self.tmp.cleanup()
+
+    def test_survives_restart(self):
+        """a record saved by one process is read back by the next"""
+        RunStateFile(self.path).save("ot2", {"run_id": "r1", "action_id": "a1"})
+        restarted = RunStateFile(self.path)
+        assert restarted.get("ot2") == {"run_id": "r1", "action_id": "a1"}
+        assert restarted.get("other") is None
+
+    def test_clear_only_matching_run(self):
+        """a finished run does not clear the record of a newer one"""
+        state = RunStateFile(self.path)
+        state.save("a", {"run_id": "r2"})
+        state.save("b", {"run_id": "r3"})
+        state.clear("a", "r1")
+        assert state.get("a") == {"run_id": "r2"}
+        state.clear("a", "r2")
+        assert state.load() == {"b": {"run_id": "r3"}}
+
+    def test_unreadable_file(self):
+        """a corrupt file reads as no runs in flight"""
+        self.path.parent.mkdir(parents=True)
+        self.path.write_text("{not json")
+        assert RunStateFile(self.path).load() == {}
+
+    def test_protocol_hash(self):
+        """the hash follows the protocol's content"""
+        protocol = Path(self.tmp.name) / "protocol.py"
+        protocol.write_text("a")
+        first = protocol_hash(protocol)
+        protocol.write_text("b")
+        assert protocol_hash(protocol) != first
+
+
+if __name__ == "__main__":
+    unittest.main()
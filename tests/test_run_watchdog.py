@@ -0,0 +1,83 @@
+"""tests for the run stall watchdog"""
+
+import unittest
+
+from ot2_interface.run_watchdog import RunWatchdog, StallPolicy
+
+
+class TestRunWatchdog(unittest.TestCase):
+    """tests for stall detection"""
+
+    def test_progress_resets_the_clock(self):
+        """a run that keeps completing commands is never stalled"""
+        watchdog = RunWatchdog(quiet_period=10, policy=StallPolicy.CANCEL)
+        for i in range(10):
+            assert watchdog.observe("running", i, "aspirate", now=i * 30.0) is None
+        assert not watchdog.stalled
+
+    def test_stall_uses_expected_duration(self):
+        """the quiet period is added on top of the command's expected duration"""
+        watchdog = RunWatchdog(
+            quiet_period=10,
+            policy=StallPolicy.PAUSE,
+            expected_durations={"aspirate": 20},
+        )
+        assert watchdog.observe("running", 3, "aspirate", now=0.0) is None
+        assert watchdog.observe("running", 3, "aspirate", now=29.0) is None
+        assert watchdog.observe("running", 3, "aspirate", now=30.0) == StallPolicy.PAUSE
+        # only reported once until the run moves again
+        assert watchdog.observe("running", 3, "aspirate", now=60.0) is None
+        assert watchdog.observe("running", 4, "dispense", now=61.0) is None
+        assert not watchdog.stalled
+
+    def test_delay_commands_carry_their_own_duration(self):
+        """delays are not flagged before they are over"""
+        watchdog = RunWatchdog(quiet_period=10)
+        params = {"seconds": 100}
+        assert (
+            watchdog.observe("running", 1, "waitForDuration", params=params, now=0)
+            is None
+        )
+        assert (
+            watchdog.observe("running", 1, "waitForDuration", params=params, now=105)
+            is None
+        )
+        assert (
+            watchdog.observe("running", 1, "waitForDuration", params=params, now=110)
+            == StallPolicy.ALERT
+        )
+
+    def test_paused_quiet_period(self):
+        """paused runs use their own quiet period and call the stall hook"""
+        stalls = []
+        watchdog = RunWatchdog(
+            quiet_period=1000, paused_quiet_period=5, on_stall=stalls.append
+        )
+        watchdog.observe("paused", 2, "waitForResume", now=0)
+        assert (
+            watchdog.observe("paused", 2, "waitForResume", now=5) == StallPolicy.ALERT
+        )
+        assert stalls[0]["status"] == "paused"
+        assert stalls[0]["completed_commands"] == 2
+
+    def test_paused_runs_are_not_cancelled(self):
+        """a run paused on purpose is never a stall unless paused runs get a quiet period"""
+        watchdog = RunWatchdog(quiet_period=10, policy=StallPolicy.CANCEL)
+        watchdog.observe("paused", 2, "waitForResume", now=0)
+        assert watchdog.observe("paused", 2, "waitForResume", now=86400) is None
+        assert not watchdog.stalled
+        # the same quiet run, not paused, is cancelled
+        assert (
+            watchdog.observe("running", 2, "waitForResume", now=86401)
+            == StallPolicy.CANCEL
+        )
+
+    def test_terminal_runs_are_ignored(self):
+        """finished runs are not stalls"""
+        watchdog = RunWatchdog(quiet_period=1)
+        watchdog.observe("finishing", 5, "home", now=0)
+        assert watchdog.observe("finishing", 5, "home", now=1000) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""tests for the shared protocol template registry"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.templates import (
+    Template,
+    TemplateRegistry,
+    template_registry,
+)
+
+
+class TestTemplateRegistry(unittest.TestCase):
+    """tests for the template registry"""
+
+    def setUp(self):
+        """a template directory with one template"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.template = Path(self.tmp.name) / "aspirate.template"
+        self.template.write_text("#pipette#.aspirate(#volume#)")
+
+    def tearDown(self):
+        """remove the template directory"""
+        self.tmp.cleanup()
+
+    def test_shared_by_protopilers(self):
+        """every ProtoPiler uses the same registry, read once"""
+        assert ProtoPiler().templates is ProtoPiler().templates
+        assert template_registry(self.tmp.name) is template_registry(self.tmp.name)
+
+    def test_no_reads_after_load(self):
+        """templates come from memory, even when their files change"""
+        registry = TemplateRegistry(self.tmp.name)
+        with mock.patch.object(Path, "read_text", side_effect=AssertionError):
+            assert registry["aspirate"].text == "#pipette#.aspirate(#volume#)"
+        self.template.write_text("changed")
+        assert registry["aspirate"].text == "#pipette#.aspirate(#volume#)"
+
+    def test_mtime_reload(self):
+        """with check_mtime, edited templates are read again"""
+        registry = TemplateRegistry(self.tmp.name, check_mtime=True)
+        self.template.write_text("changed")
+        os.utime(self.template, (0, 0))
+        assert registry["aspirate"].text == "changed"
+
+    def test_missing_template(self):
+        """asking for a template that does not exist is an error"""
+        with self.assertRaises(ValueError):
+            TemplateRegistry(self.tmp.name)["dispense"]
+
+
+class TestTemplate(unittest.TestCase):
+    """tests for compiled templates"""
+
+    def test_render(self):
+        """every slot is filled in one pass, values are not rendered again"""
+        template = Template("#pipette#.aspirate(#volume#, #src#)")
+        assert template.slots == ("pipette", "volume", "src")
+        assert (
+            template.render(pipette="p", volume="#src#", src="deck['1']")
+            == "p.aspirate(#src#, deck['1'])"
+        )
+
+    def test_partial_render(self):
+        """slots without a value are left in place"""
+        template = Template("#pipette#.mix(#reps#, #volume#)")
+        assert template.render(reps="3") == "#pipette#.mix(3, #volume#)"
+
+    def test_literal_text(self):
+        """braces, quotes, backslashes and stray #s are copied as they are"""
+        text = "def run(ctx):\n    d = {\"a\": '#x#'}  # 2# \\ #if# é\n"
+        assert Template(text).render(x="{1}") == text.replace("#x#", "{1}")
+        assert Template(text).slots == ("x",)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""tests for changing tips by the liquids they touch"""
+
+import json
+import unittest
+from pathlib import Path
+
+from protopiler_helpers import CONFIG_DIR, ScratchConfigs
+from test_compact_protocol import run_protocol
+
+from ot2_interface.protopiler.preflight import preflight
+from ot2_interface.protopiler.protopiler import ProtoPiler
+from ot2_interface.protopiler.transfers import TipPlanner, TransferStep
+
+BLOCK = """  - name: {source} into {destination}
+    command: transfer
+    source: 4:{source}
+    destination: 1:{destination}
+    volume: 5
+    reuse_tips: True
+"""
+
+
+def step(src="A1", dst="A1", mix_cycles=0):
+    """a transfer step from well `src` of slot 4 to well `dst` of slot 1"""
+    return TransferStep(
+        "left",
+        None,
+        5,
+        ("4", src),
+        ("1", dst),
+        1,
+        1,
+        mix_cycles,
+        5,
+        True,
+        True,
+        False,
+    )
+
+
+class TestTipReuse(ScratchConfigs, unittest.TestCase):
+    """tests for the tip planner"""
+
+    def edited(self, *blocks) -> Path:
+        """single_test.yaml with its commands replaced by planned (source, destination) blocks"""
+        text = (CONFIG_DIR / "single_test.yaml").read_text()
+        head, rest = text.split("commands:\n")
+        tail = rest[rest.index("\nmetadata:") :]
+        commands = "".join(
+            BLOCK.format(source=source, destination=destination)
+            for source, destination in blocks
+        )
+        return self.scratch(f"{head}commands:\n{commands}{tail}")
+
+    def test_planner(self):
+        """a tip serves the same liquid into empty wells, mixing or filled wells spoil it"""
+        planner = TipPlanner(lambda well: well == ("1", "H1"))
+        assert planner.serve([step(dst="A1")]) == "4:A1"
+        assert planner.keeps([step(dst="A2")])
+        assert not planner.keeps([step(src="A2", dst="A2")])
+        assert planner.serve([step(dst="A1")]) is None
+        assert planner.serve([step(dst="A3", mix_cycles=2)]) is None
+        assert planner.serve([step(dst="H1")]) is None
+        assert planner.serve([step(dst="A4")], clean=False) is None
+
+    def test_same_source(self):
+        """one tip serves a reagent into clean wells, and goes back to its rack"""
+        config = self.edited(("A1", "[A1, A2, A3, A4, A5, A6, A7, A8]"))
+        piler = ProtoPiler()
+        protocol, _ = piler.yaml_to_bytes(config, reset_when_done=False)
+        assert protocol.count(b".pick_up_tip(") == 1
+        assert protocol.count(b".return_tip()") == 1
+        assert b".drop_tip()" not in protocol
+        assert piler.tips_saved == {"kept": 7}
+        assert piler.resource_manager.returned_tips == {
+            "4:A1": [("p20_single_gen2", ("10", "0"))]
+        }
+
+    def test_returned_tips(self):
+        """a returned tip is picked up again for its liquid, filled wells take a tip each"""
+        config = self.edited(
+            ("A1", "[A1, A2]"), ("A2", "[B1, B2]"), ("A1", "[C1]"), ("A3", "[A1, A2]")
+        )
+        for compact in (False, True):
+            piler = ProtoPiler(compact=compact)
+            protocol, _ = piler.yaml_to_bytes(config, reset_when_done=False)
+            assert piler.tips_saved == {"kept": 2, "reused": 1}
+            assert piler.resource_manager.resources["10"]["used"] == 4
+            picks = [
+                call[1]
+                for call in run_protocol(protocol)
+                if call[0].endswith("pick_up_tip")
+            ]
+            assert len(picks) == 5
+            assert picks[0] == picks[2]
+
+        report = preflight(config)
+        assert report.ok, report.problems
+        assert report.tips_needed == {"p20_single_gen2": 4}
+
+    def test_returned_tips_stay_in_the_compile(self):
+        """a later compile against the resource file does not pick up returned tips"""
+        piler = ProtoPiler()
+        _, resources = piler.yaml_to_protocol(
+            self.edited(("A1", "[A1, A2]")),
+            protocol_out_path=self.tmp.name,
+            resource_file_out=self.tmp.name,
+        )
+        resources = Path(resources)
+        assert "returned_tips" not in json.loads(resources.read_text())
+
+        config = self.edited(("A1", "[B1, B2]"))
+        report = preflight(config, resource_file=resources)
+        assert report.ok, report.problems
+        assert report.tips_needed == {"p20_single_gen2": 1}
+        piler = ProtoPiler()
+        protocol, _ = piler.yaml_to_bytes(config, resource_file=resources)
+        assert piler.tips_saved == {"kept": 1}
+        assert b"wells()[0])" not in protocol
+
+    def test_opt_in(self):
+        """without the flag tips follow drop_tip and return_tip"""
+        config = self.edited(("A1", "[A1, A2, A3]"))
+        config.write_text(config.read_text().replace("reuse_tips: True", ""))
+        piler = ProtoPiler()
+        protocol, _ = piler.yaml_to_bytes(config)
+        assert protocol.count(b".pick_up_tip(") == 3
+        assert not piler.tips_saved
+
+
+if __name__ == "__main__":
+    unittest.main()